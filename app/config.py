@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -10,7 +12,136 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
-    GOOGLE_MAPS_API_KEY: str
+    GOOGLE_MAPS_API_KEY: Optional[str] = None
+
+    # In-process driver index fed by the driver_locations topic
+    DRIVER_INDEX_SHARDS: int = 64
+    DRIVER_INDEX_STALE_SECONDS: int = 300
+    DRIVER_INDEX_SWEEP_INTERVAL_SECONDS: int = 30
+
+    # Redis writer for the driver_locations topic
+    LOCATION_CONSUMER_BATCH_MODE: bool = True
+    LOCATION_CONSUMER_BATCH_SIZE: int = 500
+    LOCATION_CONSUMER_LINGER_MS: int = 50
+
+    # Retries of a failing consume_batches batch. Transient errors back off
+    # up to the maximum; other errors are retried KAFKA_BATCH_MAX_ATTEMPTS
+    # times before the records that keep failing are dead-lettered.
+    KAFKA_BATCH_MAX_ATTEMPTS: int = 3
+    KAFKA_BATCH_RETRY_BACKOFF_MS: int = 200
+    KAFKA_BATCH_MAX_BACKOFF_SECONDS: float = 10.0
+    LOCATION_STALE_SECONDS: int = 120
+    LOCATION_SWEEP_INTERVAL_SECONDS: int = 30
+    LOCATION_SWEEP_BATCH_SIZE: int = 1000
+
+    # Batching flusher shared by all driver location sockets. Every point is
+    # kept, so TRACKER_MAX_PENDING counts points rather than drivers.
+    TRACKER_BATCH_SIZE: int = 200
+    TRACKER_LINGER_MS: int = 100
+    TRACKER_MAX_PENDING: int = 50000
+
+    # Movement-aware suppression of location updates in the tracking path
+    LOCATION_FILTER_ENABLED: bool = True
+    LOCATION_FILTER_MIN_DISTANCE_M: float = 25.0
+    LOCATION_FILTER_MIN_HEADING_CHANGE_DEG: float = 30.0
+    LOCATION_FILTER_MAX_SILENCE_SECONDS: float = 30.0
+
+    # Window around server time in which device timestamps are trusted. An
+    # hour back leaves room for points buffered while the device was offline.
+    LOCATION_TIMESTAMP_MAX_AGE_SECONDS: float = 3600.0
+    LOCATION_TIMESTAMP_MAX_SKEW_SECONDS: float = 60.0
+
+    # Candidate lookup for matching: "h3" (hexagon sets) or "geo" (Redis GEO)
+    PROXIMITY_BACKEND: str = "h3"
+    PROXIMITY_SEARCH_RADIUS_KM: float = 5.0
+    PROXIMITY_CANDIDATE_COUNT: int = 20
+
+    # Compressed per-driver location history kept for trip replay
+    LOCATION_HISTORY_BUFFER_POINTS: int = 720
+    LOCATION_HISTORY_CHUNK_POINTS: int = 240
+    LOCATION_HISTORY_CHUNK_SECONDS: int = 300
+    LOCATION_HISTORY_FLUSH_INTERVAL_SECONDS: int = 60
+    LOCATION_HISTORY_MAX_POINTS: int = 5000
+    LOCATION_HISTORY_MAX_SAVE_ATTEMPTS: int = 10
+
+    # COPY-based writer of raw location points into Postgres
+    LOCATION_WRITER_FLUSH_ROWS: int = 20000
+    LOCATION_WRITER_FLUSH_INTERVAL_MS: int = 1000
+    LOCATION_WRITER_UPDATE_DRIVERS: bool = True
+
+    # Per-worker fan-out of Redis pub/sub to local sockets
+    PUBSUB_SUBSCRIBER_QUEUE_SIZE: int = 100
+    SUBSCRIPTION_MAX_CELLS: int = 500
+
+    # Per-socket conflating outbox for live driver updates
+    OUTBOX_TICK_MS: int = 250
+    OUTBOX_MAX_KEYS: int = 1000
+    OUTBOX_MAX_LAG_TICKS: int = 20
+    OUTBOX_MAX_SEND_SECONDS: float = 5.0
+
+    # Cluster-wide presence of driver and user sockets. NODE_ID defaults to
+    # hostname-pid-random.
+    NODE_ID: Optional[str] = None
+    PRESENCE_LEASE_SECONDS: int = 30
+    PRESENCE_HEARTBEAT_SECONDS: int = 10
+
+    # Push of driver_assignments events to locally connected drivers
+    ASSIGNMENT_DELIVERY_BATCH_SIZE: int = 100
+    ASSIGNMENT_DELIVERY_LINGER_MS: int = 20
+    ASSIGNMENT_REPLAY_SECONDS: int = 30
+    ASSIGNMENT_ACK_TIMEOUT_SECONDS: int = 60
+
+    # Verified-token cache in front of the user/driver lookups in auth
+    AUTH_CACHE_MAX_SIZE: int = 50000
+    AUTH_CACHE_TTL_SECONDS: int = 300
+
+    # Socket.IO rooms per H3 cell that driver sockets join for area offers
+    HEX_ROOM_RESOLUTION: int = 8
+    HEX_ROOM_RING_SIZE: int = 2
+
+    # How immediate bookings find a driver: "offer" (offered to the top-ranked
+    # drivers, first accept wins), "batch" (micro-batched matching) or
+    # "nearest" (the nearest available driver, assigned inline)
+    IMMEDIATE_MATCHING_MODE: str = "offer"
+
+    # Micro-batched matching of immediate bookings to drivers
+    BATCH_MATCH_WINDOW_MS: int = 1500
+    BATCH_MATCH_MAX_SIZE: int = 2000
+    BATCH_MATCH_MAX_ATTEMPTS: int = 3
+    BATCH_MATCH_CANDIDATES_PER_BOOKING: int = 10
+
+    # Composite driver score used to rank candidates; weights sum to 1.
+    # Nothing collects driver ratings yet, so rating's documented 30% goes
+    # to distance.
+    SCORING_WEIGHT_DISTANCE: float = 0.7
+    SCORING_WEIGHT_IDLE: float = 0.2
+    SCORING_WEIGHT_ACCEPTANCE: float = 0.1
+    SCORING_IDLE_HORIZON_SECONDS: float = 3600.0
+
+    # Redis driver claims and the batched drivers.is_available writes behind
+    # them
+    DRIVER_CLAIM_TTL_SECONDS: int = 7200
+    DRIVER_CLAIM_WRITE_BATCH_SIZE: int = 500
+    DRIVER_CLAIM_WRITE_INTERVAL_MS: int = 200
+
+    # Immediate bookings offered to the top-ranked drivers, first accept wins.
+    # OFFER_STAGGER_MS > 0 sends the offers one at a time that far apart, and
+    # OFFER_DEADLINE_SECONDS bounds the whole cascade.
+    OFFER_FAN_OUT: int = 3
+    OFFER_ACCEPT_TIMEOUT_SECONDS: float = 15.0
+    OFFER_STAGGER_MS: int = 0
+    OFFER_MAX_OFFERS: int = 10
+    OFFER_DEADLINE_SECONDS: float = 180.0
+    OFFER_WHEEL_TICK_MS: int = 100
+
+    # Offline road routing for pricing and matching, from a graph built with
+    # python -m app.services.routing. Google Distance Matrix is only asked
+    # when the graph has no route and the fallback is on.
+    ROUTING_GRAPH_PATH: Optional[str] = None
+    ROUTING_MAX_SNAP_METERS: float = 500.0
+    ROUTING_ACCESS_SPEED_KMH: float = 15.0
+    ROUTING_MATCHING_ENABLED: bool = True
+    ROUTING_GOOGLE_FALLBACK: bool = True
 
     class Config:
         env_file = ".env"
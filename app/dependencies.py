@@ -2,16 +2,18 @@ import json
 import time
 from datetime import datetime, timedelta
 from functools import wraps
+from typing import Optional
 
 import aioredis
 import httpx
-from app.models import Driver, RoleEnum, User
-from db.database import get_db
+from app.models import Driver, Role, RoleEnum, User
+from app.services.caching.auth_cache import Identity, auth_cache
+from db.database import async_session
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseSettings
-from sqlalchemy.orm import Session
+from sqlalchemy.future import select
 
 from .config import settings
 
@@ -60,14 +62,65 @@ class RateLimiter:
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def _credentials_exception(detail: str = "Could not validate credentials"):
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
+        detail=detail,
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+async def _load_user_identity(email: str) -> Optional[Identity]:
+    async with async_session() as db:
+        result = await db.execute(
+            select(User.id, User.email, Role.name)
+            .outerjoin(Role, User.role_id == Role.id)
+            .where(User.email == email)
+        )
+        row = result.first()
+    if row is None:
+        return None
+    user_id, user_email, role = row
+    return Identity(
+        id=user_id,
+        kind="user",
+        email=user_email,
+        role=role.value if role else None,
+    )
+
+
+async def _load_driver_identity(driver_id: int) -> Optional[Identity]:
+    async with async_session() as db:
+        result = await db.execute(
+            select(
+                Driver.id,
+                Driver.email,
+                Role.name,
+                Driver.vehicle_type,
+                Driver.is_available,
+            )
+            .outerjoin(Role, Driver.role_id == Role.id)
+            .where(Driver.id == driver_id)
+        )
+        row = result.first()
+    if row is None:
+        return None
+    driver_id, email, role, vehicle_type, is_available = row
+    return Identity(
+        id=driver_id,
+        kind="driver",
+        email=email,
+        role=role.value if role else RoleEnum.driver.value,
+        vehicle_type=vehicle_type.value if vehicle_type else None,
+        is_available=is_available,
+    )
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Identity:
+    identity = await auth_cache.get(token, "user")
+    if identity is not None:
+        return identity
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -77,19 +130,19 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email == username).first()
-    if user is None:
+    identity = await _load_user_identity(username)
+    if identity is None:
         raise credentials_exception
-    return user
+    await auth_cache.put(token, identity, payload.get("exp", 0))
+    return identity
 
 
-async def get_current_driver(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials for driver",
-        headers={"WWW-Authenticate": "Bearer"},
+async def get_current_driver(token: str = Depends(oauth2_scheme)) -> Identity:
+    identity = await auth_cache.get(token, "driver")
+    if identity is not None:
+        return identity
+    credentials_exception = _credentials_exception(
+        "Could not validate credentials for driver"
     )
     try:
         payload = jwt.decode(
@@ -100,23 +153,20 @@ async def get_current_driver(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    driver = db.query(Driver).filter(Driver.id == user_id).first()
-    if driver is None:
+    identity = await _load_driver_identity(user_id)
+    if identity is None:
         raise credentials_exception
-    return driver
+    await auth_cache.put(token, identity, payload.get("exp", 0))
+    return identity
 
 
-async def get_current_user_object(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    return await get_current_user(token, db)
+async def get_current_user_object(token: str = Depends(oauth2_scheme)):
+    return await get_current_user(token)
 
 
-async def get_current_admin(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
-    user = await get_current_user(token, db)
-    if user.role.name != RoleEnum.admin:
+async def get_current_admin(token: str = Depends(oauth2_scheme)):
+    user = await get_current_user(token)
+    if user.role != RoleEnum.admin:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     return user
 
@@ -7,10 +7,24 @@ from app.models import Role, RoleEnum
 from app.routes import (admin, analytics, bookings, drivers, pricing, tracking,
                         users, websockets)
 from app.services.analytics.analytics_consumer import start_analytics_consumer
+from app.services.assignment.driver_claims import availability_writer
+from app.services.assignment.driver_features_consumer import \
+    start_driver_features_consumer
+from app.services.assignment.offers import offer_engine
 from app.services.booking.booking_consumer import start_booking_consumer
+from app.services.caching.auth_cache import auth_cache
+from app.services.communication.assignment_delivery import assignment_delivery
+from app.services.communication.presence import presence_registry
+from app.services.communication.websocket_service import manager
 from app.services.driver_availability.driver_availability_consumer import \
     start_driver_availability_consumer
 from app.services.messaging.kafka_service import kafka_service
+from app.services.routing import road_router
+from app.services.tracking.driver_index_consumer import \
+    start_driver_index_consumer
+from app.services.tracking.driver_tracking import driver_tracker
+from app.services.tracking.location_history import \
+    start_location_history_consumer
 from app.tasks.demand import update_demand
 from db.database import async_session, engine
 from fastapi import FastAPI
@@ -111,16 +125,33 @@ async def startup_event():
     asyncio.create_task(update_demand())
     await connect_to_db()
     await create_roles()
+    if settings.ROUTING_GRAPH_PATH:
+        await asyncio.to_thread(road_router.load, settings.ROUTING_GRAPH_PATH)
     await kafka_service.start()
+    await driver_tracker.start()
+    await availability_writer.start()
+    await auth_cache.start()
+    await presence_registry.start(manager.deliver_local, manager.emit_to_rooms)
+    await assignment_delivery.start(manager)
+    await offer_engine.start(manager)
 
     # Start Kafka consumers
     asyncio.create_task(start_booking_consumer())
     asyncio.create_task(start_driver_availability_consumer())
     asyncio.create_task(start_analytics_consumer())
+    asyncio.create_task(start_driver_index_consumer())
+    asyncio.create_task(start_location_history_consumer())
+    asyncio.create_task(start_driver_features_consumer())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await driver_tracker.stop()
+    await availability_writer.stop()
+    await assignment_delivery.stop()
+    await offer_engine.stop()
+    await auth_cache.stop()
+    await presence_registry.stop()
     await kafka_service.stop()
 
 
@@ -2,8 +2,9 @@ from datetime import datetime
 from enum import Enum as PyEnum
 
 from geoalchemy2 import Geometry
-from sqlalchemy import (JSON, Boolean, Column, DateTime, Enum, Float,
-                        ForeignKey, Index, Integer, String, Version)
+from sqlalchemy import (JSON, BigInteger, Boolean, Column, Computed, DateTime,
+                        Enum, Float, ForeignKey, Index, Integer, LargeBinary,
+                        String, Version)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -134,3 +135,48 @@ class BookingStatusHistory(Base):
     timestamp = Column(DateTime, nullable=False)
 
     booking = relationship("Booking", back_populates="status_history")
+
+
+# Runs of driver location points, encoded by tracking.location_history
+class LocationTraceChunk(Base):
+    __tablename__ = "location_trace_chunks"
+    id = Column(Integer, primary_key=True, index=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    points = Column(LargeBinary, nullable=False)
+
+    driver = relationship("Driver")
+
+
+Index(
+    "idx_location_trace_driver_time",
+    LocationTraceChunk.driver_id,
+    LocationTraceChunk.start_time,
+)
+
+
+# Raw location points bulk-loaded with COPY by tracking.location_writer. There
+# is no foreign key or spatial index so ingestion is not slowed by them; the
+# geometry is computed from latitude/longitude by Postgres.
+class DriverLocationPoint(Base):
+    __tablename__ = "driver_location_points"
+    id = Column(BigInteger, primary_key=True)
+    driver_id = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    heading = Column(Float, nullable=True)
+    speed = Column(Float, nullable=True)
+    location = Column(
+        Geometry("POINT", srid=4326, spatial_index=False),
+        Computed("ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)", persisted=True),
+    )
+
+
+Index(
+    "idx_location_points_driver_time",
+    DriverLocationPoint.driver_id,
+    DriverLocationPoint.recorded_at,
+)
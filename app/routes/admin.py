@@ -1,9 +1,10 @@
 from typing import List
 
-from app.dependencies import get_current_admin, get_db
+from app.dependencies import get_current_admin
 from app.schemas.vehicles import VehicleResponse, VehicleSchema, VehicleUpdate
 from app.services.admin.admin_service import (add_vehicle, delete_vehicle,
                                               get_fleet, update_vehicle)
+from db.database import get_db
 from fastapi import APIRouter, Depends, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -1,7 +1,7 @@
-from app.dependencies import get_db
 from app.schemas.analytics import AnalyticsCreate, AnalyticsResponse
 from app.services.analytics.analytics_service import (create_analytics_service,
                                                       get_analytics_service)
+from db.database import get_db
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
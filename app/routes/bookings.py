@@ -1,7 +1,8 @@
-from app.dependencies import get_current_user, get_db, rate_limit
+from app.dependencies import get_current_user, rate_limit
 from app.models import User
 from app.schemas.booking import BookingRequest, BookingResponse
 from app.services.booking.booking_service import create_new_booking
+from db.database import get_db
 from fastapi import APIRouter, BackgroundTasks, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -1,7 +1,7 @@
-from app.dependencies import get_db
 from app.schemas.driver import DriverCreate, DriverResponse
 from app.services.drivers.driver_service import (create_driver_service,
                                                  get_driver_service)
+from db.database import get_db
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
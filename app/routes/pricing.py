@@ -1,7 +1,7 @@
-from app.dependencies import get_db
 from app.schemas.pricing import PricingCreate, PricingResponse
 from app.services.pricing.pricing_service import (create_pricing_service,
                                                   get_pricing_service)
+from db.database import get_db
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -1,21 +1,25 @@
 import logging
+from datetime import datetime, timedelta
+from typing import Optional
 
 import h3
-from app.dependencies import get_current_driver, get_current_user
-from app.models import Driver, User
-from app.services.communication.websocket_service import ConnectionManager
-from app.services.tracking.tracking_service import TrackingService
+from app.config import settings
+from app.dependencies import (get_current_admin, get_current_driver,
+                              get_current_user)
+from app.models import Booking, Driver, RoleEnum, User
+from app.schemas.tracking import LocationTrace, TracePoint
+from app.services.communication.websocket_service import tracking_service
+from app.services.tracking.location_history import (get_booking_trace,
+                                                    get_location_trace)
 from db.database import get_db
-from fastapi import (APIRouter, Depends, Security, WebSocket,
-                     WebSocketDisconnect)
+from fastapi import (APIRouter, Depends, HTTPException, Query, Security,
+                     WebSocket, WebSocketDisconnect)
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 
-manager = ConnectionManager()
-tracking_service = TrackingService(manager)
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -47,7 +51,76 @@ async def get_nearby_drivers(
     return nearby_drivers
 
 
-async def get_current_user_object(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+def _trace_points(points):
+    return [
+        TracePoint(
+            latitude=latitude,
+            longitude=longitude,
+            timestamp=datetime.utcfromtimestamp(timestamp),
+        )
+        for latitude, longitude, timestamp in points
+    ]
+
+
+@router.get("/drivers/{driver_id}/trace", response_model=LocationTrace)
+async def get_driver_trace(
+    driver_id: int,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    min_interval_seconds: Optional[int] = Query(None, ge=1),
+    max_points: int = Query(settings.LOCATION_HISTORY_MAX_POINTS, ge=1),
+    current_admin: User = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
 ):
-    return await get_current_user(token, db)
+    end_time = end_time or datetime.utcnow()
+    start_time = start_time or end_time - timedelta(hours=1)
+    if start_time > end_time:
+        raise HTTPException(status_code=400, detail="start_time is after end_time")
+    points = await get_location_trace(
+        db,
+        driver_id,
+        start_time,
+        end_time,
+        min_interval_seconds=min_interval_seconds,
+        max_points=min(max_points, settings.LOCATION_HISTORY_MAX_POINTS),
+    )
+    return LocationTrace(
+        driver_id=driver_id,
+        start_time=start_time,
+        end_time=end_time,
+        points=_trace_points(points),
+    )
+
+
+@router.get("/bookings/{booking_id}/trace", response_model=LocationTrace)
+async def get_booking_route_trace(
+    booking_id: int,
+    min_interval_seconds: Optional[int] = Query(None, ge=1),
+    max_points: int = Query(settings.LOCATION_HISTORY_MAX_POINTS, ge=1),
+    current_user: User = Security(get_current_user, scopes=["user"]),
+    db: AsyncSession = Depends(get_db),
+):
+    booking = await db.get(Booking, booking_id)
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if booking.user_id != current_user.id and current_user.role != RoleEnum.admin:
+        raise HTTPException(status_code=403, detail="Insufficient permissions")
+    if not booking.driver_id:
+        raise HTTPException(status_code=404, detail="Booking has no driver assigned")
+    start_time, end_time, points = await get_booking_trace(
+        db,
+        booking,
+        min_interval_seconds=min_interval_seconds,
+        max_points=min(max_points, settings.LOCATION_HISTORY_MAX_POINTS),
+    )
+    return LocationTrace(
+        driver_id=booking.driver_id,
+        booking_id=booking_id,
+        start_time=start_time,
+        end_time=end_time,
+        points=_trace_points(points),
+    )
+
+
+async def get_current_user_object(token: str = Depends(oauth2_scheme)):
+    return await get_current_user(token)
@@ -1,7 +1,7 @@
-from app.dependencies import get_db
 from app.schemas.user import UserCreate, UserResponse
 from app.services.users.user_service import (create_user_service,
                                              get_user_service)
+from db.database import get_db
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class TracePoint(BaseModel):
+    latitude: float
+    longitude: float
+    timestamp: datetime
+
+
+class LocationTrace(BaseModel):
+    driver_id: int
+    booking_id: Optional[int] = None
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+    points: List[TracePoint] = Field(
+        default_factory=list, description="Recorded positions, oldest first."
+    )
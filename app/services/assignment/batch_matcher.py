@@ -0,0 +1,330 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from app.config import settings
+from app.models import Booking, BookingStatusEnum, BookingStatusHistory
+from app.services.assignment.driver_claims import (busy_drivers, claim_drivers,
+                                                   release_claim)
+from app.services.assignment.scoring import driver_scorer
+from app.services.caching.auth_cache import auth_cache
+from app.services.tracking.h3_index import driver_index
+from app.utils.geo import haversine_matrix
+from db.database import async_session
+from scipy.optimize import linear_sum_assignment
+from sqlalchemy import bindparam, func, select, update
+
+logger = logging.getLogger(__name__)
+
+# Cost of a pair that must not be matched (too far, wrong vehicle type).
+# Finite so the solver always has a feasible full assignment to choose from.
+INFEASIBLE_COST = 1e9
+
+
+def cost_matrix(
+    distances: np.ndarray,
+    compatible: np.ndarray,
+    max_distance_km: float,
+    scores: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Cost of every booking-driver pair: one minus the driver's score if
+    scores are given, else the pickup distance. Pairs that are out of range
+    or not compatible are priced at INFEASIBLE_COST.
+    """
+    cost = distances if scores is None else 1.0 - scores
+    return np.where(compatible & (distances <= max_distance_km), cost, INFEASIBLE_COST)
+
+
+def solve_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Minimum total cost matching of rows (bookings) to columns (drivers).
+    Returns (row, column) pairs, leaving out rows only matched at
+    INFEASIBLE_COST.
+    """
+    if cost.size == 0:
+        return []
+    rows, columns = linear_sum_assignment(cost)
+    return [
+        (int(row), int(column))
+        for row, column in zip(rows, columns)
+        if cost[row, column] < INFEASIBLE_COST
+    ]
+
+
+@dataclass
+class _PendingMatch:
+    future: asyncio.Future
+    attempts: int = 0
+
+
+@dataclass
+class BatchResult:
+    # booking_id: driver_id
+    assigned: Dict[int, int] = field(default_factory=dict)
+    # Bookings that are no longer pending or are being handled elsewhere
+    skipped: List[int] = field(default_factory=list)
+    # Bookings still pending that got no driver this round
+    unmatched: List[int] = field(default_factory=list)
+
+
+class BatchMatcher:
+    """
+    Matches pending bookings to drivers in micro-batches instead of one at
+    a time. Bookings submitted within window_ms of each other are matched
+    together: each booking's best-scored candidates come from the
+    in-process H3 driver index, the batch is solved as an assignment
+    maximizing the total driver score, and the solved drivers are claimed in
+    Redis like any other assignment before every resulting booking update is
+    committed in one transaction. A booking left unmatched (no driver in
+    range, or its driver claimed by a concurrent booking) is retried in the
+    next batch, up to max_attempts batches.
+    """
+
+    def __init__(
+        self,
+        window_ms: int = 1500,
+        max_batch_size: int = 2000,
+        search_radius_km: float = 5.0,
+        max_attempts: int = 3,
+        candidates_per_booking: int = 10,
+    ):
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.search_radius_km = search_radius_km
+        self.max_attempts = max_attempts
+        self.candidates_per_booking = candidates_per_booking
+        self._pending: Dict[int, _PendingMatch] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, booking_id: int) -> Optional[int]:
+        """
+        Queue a booking for the next batch and wait for its result: the id
+        of the driver it was assigned to, or None if it got none.
+        """
+        self._ensure_running()
+        entry = self._pending.get(booking_id)
+        if entry is None:
+            entry = _PendingMatch(asyncio.get_running_loop().create_future())
+            self._pending[booking_id] = entry
+        self._wakeup.set()
+        return await asyncio.shield(entry.future)
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for entry in self._pending.values():
+            if not entry.future.done():
+                entry.future.set_result(None)
+        self._pending.clear()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Let the window fill up before matching
+            await asyncio.sleep(self.window_seconds)
+            self._wakeup.clear()
+            batch = dict(list(self._pending.items())[: self.max_batch_size])
+            if len(self._pending) > len(batch):
+                self._wakeup.set()
+            try:
+                result = await self.match_batch(list(batch))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error matching batch of {len(batch)} bookings: {e}")
+                result = BatchResult(unmatched=list(batch))
+            self._settle(batch, result)
+
+    def _settle(self, batch: Dict[int, _PendingMatch], result: BatchResult):
+        for booking_id, entry in batch.items():
+            driver_id = result.assigned.get(booking_id)
+            entry.attempts += 1
+            if driver_id is None and entry.attempts < self.max_attempts:
+                if booking_id not in result.skipped:
+                    # Stays queued for the next batch
+                    self._wakeup.set()
+                    continue
+            del self._pending[booking_id]
+            if not entry.future.done():
+                entry.future.set_result(driver_id)
+
+    async def _available_candidates(self, bookings) -> List:
+        """
+        Live driver positions for the batch: for each booking, the
+        candidates_per_booking best-scored drivers in range that are not
+        busy. Pruning keeps the cost matrix at most that many columns per
+        booking, however dense the area.
+        """
+        nearby = []
+        positions = {}
+        for _, vehicle_type, latitude, longitude in bookings:
+            found = driver_index.search(
+                latitude, longitude, self.search_radius_km, vehicle_type
+            )
+            nearby.append(found)
+            for position, _ in found:
+                positions[position.driver_id] = position
+        if not positions:
+            return []
+
+        # The in-process index does not know who is busy; one SMISMEMBER
+        # against the busy set does. The conditional update below still has
+        # the final say.
+        busy = await busy_drivers(list(positions))
+        kept = {}
+        for found in nearby:
+            ranked = driver_scorer.rank(
+                [
+                    (position.driver_id, distance)
+                    for position, distance in found
+                    if position.driver_id not in busy
+                ],
+                self.candidates_per_booking,
+            )
+            for driver_id, _ in ranked:
+                kept[driver_id] = positions[driver_id]
+        return list(kept.values())
+
+    async def match_batch(self, booking_ids: List[int]) -> BatchResult:
+        result = BatchResult()
+        try:
+            async with async_session() as db:
+                async with db.begin():
+                    rows = await db.execute(
+                        select(
+                            Booking.id,
+                            Booking.vehicle_type,
+                            func.ST_Y(Booking.pickup_location),
+                            func.ST_X(Booking.pickup_location),
+                        )
+                        .where(
+                            Booking.id.in_(booking_ids),
+                            Booking.status == BookingStatusEnum.pending,
+                            Booking.driver_id.is_(None),
+                        )
+                        .with_for_update(skip_locked=True)
+                    )
+                    bookings = [
+                        (
+                            booking_id,
+                            getattr(vehicle_type, "value", vehicle_type),
+                            latitude,
+                            longitude,
+                        )
+                        for booking_id, vehicle_type, latitude, longitude in rows
+                    ]
+                    locked = {booking[0] for booking in bookings}
+                    result.skipped = [b for b in booking_ids if b not in locked]
+
+                    candidates = await self._available_candidates(bookings)
+                    pairs = []
+                    if candidates:
+                        booking_coords = np.array([(b[2], b[3]) for b in bookings])
+                        driver_coords = np.array(
+                            [(p.latitude, p.longitude) for p in candidates]
+                        )
+                        compatible = (
+                            np.array([b[1] for b in bookings])[:, None]
+                            == np.array([p.vehicle_type for p in candidates])[None, :]
+                        )
+                        distances = haversine_matrix(booking_coords, driver_coords)
+                        scores = driver_scorer.score(
+                            [p.driver_id for p in candidates], distances
+                        )
+                        cost = cost_matrix(
+                            distances, compatible, self.search_radius_km, scores
+                        )
+                        # The solve is cubic in the batch size; keep it off the
+                        # event loop
+                        pairs = await asyncio.to_thread(solve_assignment, cost)
+
+                    # Claiming is the same compare-and-set every other assignment
+                    # path uses; pairs whose driver was taken meanwhile retry
+                    result.assigned = await claim_drivers(
+                        {
+                            bookings[row][0]: int(candidates[column].driver_id)
+                            for row, column in pairs
+                        }
+                    )
+
+                    if result.assigned:
+                        bookings_table = Booking.__table__
+                        await db.execute(
+                            update(bookings_table)
+                            .where(bookings_table.c.id == bindparam("b_id"))
+                            .values(
+                                driver_id=bindparam("d_id"),
+                                status=BookingStatusEnum.confirmed,
+                                # Keeps the ORM's optimistic version check honest
+                                version=bookings_table.c.version + 1,
+                            ),
+                            [
+                                {"b_id": booking_id, "d_id": driver_id}
+                                for booking_id, driver_id in result.assigned.items()
+                            ],
+                        )
+                        now = datetime.utcnow()
+                        db.add_all(
+                            [
+                                BookingStatusHistory(
+                                    booking_id=booking_id,
+                                    status=BookingStatusEnum.confirmed,
+                                    timestamp=now,
+                                )
+                                for booking_id in result.assigned
+                            ]
+                        )
+        except (Exception, asyncio.CancelledError):
+            # Nothing was committed, so the claimed drivers go back
+            await self._release(result.assigned)
+            raise
+
+        result.unmatched = [b for b in locked if b not in result.assigned]
+        if result.assigned:
+            await self._after_commit(result.assigned)
+        logger.info(
+            f"Matched {len(result.assigned)} of {len(bookings)} bookings "
+            f"against {len(candidates)} drivers"
+        )
+        return result
+
+    async def _release(self, assigned: Dict[int, int]):
+        for outcome in await asyncio.gather(
+            *(
+                release_claim(driver_id, booking_id)
+                for booking_id, driver_id in assigned.items()
+            ),
+            return_exceptions=True,
+        ):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error releasing driver after failed batch: {outcome}")
+
+    async def _after_commit(self, assigned: Dict[int, int]):
+        updates = [
+            auth_cache.invalidate("driver", driver_id)
+            for driver_id in assigned.values()
+        ]
+        for outcome in await asyncio.gather(*updates, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error updating caches after batch match: {outcome}")
+
+
+batch_matcher = BatchMatcher(
+    window_ms=settings.BATCH_MATCH_WINDOW_MS,
+    max_batch_size=settings.BATCH_MATCH_MAX_SIZE,
+    search_radius_km=settings.PROXIMITY_SEARCH_RADIUS_KM,
+    max_attempts=settings.BATCH_MATCH_MAX_ATTEMPTS,
+    candidates_per_booking=settings.BATCH_MATCH_CANDIDATES_PER_BOOKING,
+)
@@ -1,7 +1,8 @@
-from typing import Optional
+from typing import List, Optional
 
 from app.models import Driver
-from app.services.caching.cache import cache_driver_availability
+from app.services.assignment.driver_claims import claim_first_available
+from app.services.caching.auth_cache import auth_cache
 from app.services.tracking.driver_tracking import assign_driver_to_booking
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -19,18 +20,21 @@ async def assign_driver(driver_id: int, booking_id: int, db: AsyncSession) -> bo
     """
     Assign a driver to a booking by updating their availability and booking status.
     """
-    driver = await get_driver_from_db(driver_id, db)
-    if not driver:
-        return False
+    return await assign_first_available([driver_id], booking_id) is not None
 
-    driver.is_available = False
-    await db.commit()
-    await db.refresh(driver)
 
-    # Cache the driver's availability
-    await cache_driver_availability(driver.id, False)
+async def assign_first_available(driver_ids: List, booking_id: int) -> Optional[int]:
+    """
+    Claim the first free driver of a ranked list for a booking. The claim is
+    atomic in Redis; the drivers table is updated behind it in batches.
+    """
+    driver_id = await claim_first_available(driver_ids, booking_id)
+    if driver_id is None:
+        return None
+
+    await auth_cache.invalidate("driver", driver_id)
 
     # Assign driver to booking in Redis for tracking
-    await assign_driver_to_booking(driver.id, booking_id)
+    await assign_driver_to_booking(driver_id, booking_id)
 
-    return True
+    return driver_id
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.config import settings
+from app.models import Driver
+from app.services.caching.cache import get_redis_client
+from app.services.tracking.location_scripts import (CLAIM_DRIVER_SCRIPT,
+                                                    DRIVER_BUSY_KEY,
+                                                    DRIVER_CELLS_KEY,
+                                                    RELEASE_CLAIM_SCRIPT,
+                                                    SET_AVAILABILITY_SCRIPT,
+                                                    driver_claim_key,
+                                                    get_script)
+from db.database import async_session
+from sqlalchemy import update
+
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_TTL_SECONDS = 3600  # Same as cache_driver_availability
+
+
+class AvailabilityWriteBehind:
+    """
+    Writes drivers.is_available behind the Redis claims, so a claim costs
+    one Redis round trip instead of a database commit. Changes are
+    coalesced per driver and flushed as at most two UPDATEs (one per
+    value) every flush_interval_ms, or sooner once batch_size drivers are
+    pending. A failed flush is put back and retried on the next one.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval_ms: int = 200):
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_ms / 1000
+        self._pending: Dict[int, bool] = {}
+        self._batch_full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def set(self, driver_id: int, is_available: bool):
+        self._pending[int(driver_id)] = is_available
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch = self._pending
+        self._pending = {}
+        try:
+            async with async_session() as db:
+                for is_available in (False, True):
+                    driver_ids = [
+                        d for d, value in batch.items() if value is is_available
+                    ]
+                    if driver_ids:
+                        await db.execute(
+                            update(Driver)
+                            .where(Driver.id.in_(driver_ids))
+                            .values(is_available=is_available)
+                            .execution_options(synchronize_session=False)
+                        )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error writing availability of {len(batch)} drivers: {e}")
+            # Anything set since the batch was taken is newer and wins
+            self._pending = {**batch, **self._pending}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._batch_full.wait(), self.flush_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            await self.flush()
+
+
+async def claim_first_available(driver_ids: Iterable, booking_id: int) -> Optional[int]:
+    """
+    Atomically claim the first driver, in the given order, that is not
+    busy, moving it out of the available candidate sets. Conflicts fall
+    through to the next driver inside the same script,
+    so the whole fallback chain costs one round trip. Returns the claimed
+    driver id, or None if all of them were taken.
+    """
+    driver_ids = [str(driver_id) for driver_id in driver_ids]
+    if not driver_ids:
+        return None
+    redis = await get_redis_client()
+    claim = get_script(redis, CLAIM_DRIVER_SCRIPT)
+    claimed = await claim(
+        keys=[DRIVER_CELLS_KEY, DRIVER_BUSY_KEY],
+        args=[
+            booking_id,
+            settings.DRIVER_CLAIM_TTL_SECONDS,
+            AVAILABILITY_TTL_SECONDS,
+            *driver_ids,
+        ],
+        client=redis,
+    )
+    if claimed is None:
+        return None
+    availability_writer.set(int(claimed), False)
+    return int(claimed)
+
+
+async def release_claim(driver_id: int, booking_id: int) -> bool:
+    """
+    Give a driver back if the claim is still held for booking_id, e.g. when
+    the booking is completed or cancelled.
+    """
+    redis = await get_redis_client()
+    release = get_script(redis, RELEASE_CLAIM_SCRIPT)
+    released = await release(
+        keys=[
+            driver_claim_key(driver_id),
+            f"driver:availability:{driver_id}",
+            DRIVER_CELLS_KEY,
+            DRIVER_BUSY_KEY,
+        ],
+        args=[booking_id, AVAILABILITY_TTL_SECONDS, driver_id],
+        client=redis,
+    )
+    if released:
+        availability_writer.set(int(driver_id), True)
+    return bool(released)
+
+
+async def claim_drivers(assignments: Dict[int, int]) -> Dict[int, int]:
+    """
+    Claim each driver for its booking (booking_id: driver_id) with the same
+    compare-and-set as claim_first_available, in one pipelined round trip.
+    Returns the assignments whose claim was won; drivers already claimed or
+    busy are left out.
+    """
+    if not assignments:
+        return {}
+    redis = await get_redis_client()
+    pipe = redis.pipeline(transaction=False)
+    claim = get_script(pipe, CLAIM_DRIVER_SCRIPT)
+    for booking_id, driver_id in assignments.items():
+        await claim(
+            keys=[DRIVER_CELLS_KEY, DRIVER_BUSY_KEY],
+            args=[
+                booking_id,
+                settings.DRIVER_CLAIM_TTL_SECONDS,
+                AVAILABILITY_TTL_SECONDS,
+                str(driver_id),
+            ],
+            client=pipe,
+        )
+    won = {
+        booking_id: int(driver_id)
+        for (booking_id, driver_id), claimed in zip(
+            assignments.items(), await pipe.execute()
+        )
+        if claimed is not None
+    }
+    for driver_id in won.values():
+        availability_writer.set(driver_id, False)
+    return won
+
+
+async def set_driver_availability(driver_id: int, is_available: bool):
+    """
+    Move a driver between the available and busy candidate sets as the
+    driver reports itself. Ignored while the driver holds a claim, which
+    only release_claim or the claim's expiry can free.
+    """
+    redis = await get_redis_client()
+    pipe = redis.pipeline(transaction=False)
+    set_availability = get_script(pipe, SET_AVAILABILITY_SCRIPT)
+    await set_availability(
+        keys=[
+            f"driver:availability:{driver_id}",
+            DRIVER_CELLS_KEY,
+            DRIVER_BUSY_KEY,
+            driver_claim_key(driver_id),
+        ],
+        args=[driver_id, str(bool(is_available)), AVAILABILITY_TTL_SECONDS],
+        client=pipe,
+    )
+    await pipe.execute()
+
+
+async def busy_drivers(driver_ids: List) -> Set[str]:
+    """
+    The subset of driver_ids that are busy, in one round trip.
+    """
+    if not driver_ids:
+        return set()
+    redis = await get_redis_client()
+    flags = await redis.smismember(DRIVER_BUSY_KEY, list(driver_ids))
+    return {str(driver_id) for driver_id, busy in zip(driver_ids, flags) if busy}
+
+
+availability_writer = AvailabilityWriteBehind(
+    batch_size=settings.DRIVER_CLAIM_WRITE_BATCH_SIZE,
+    flush_interval_ms=settings.DRIVER_CLAIM_WRITE_INTERVAL_MS,
+)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from app.models import Booking, BookingStatusEnum, BookingStatusHistory
+from app.services.messaging.kafka_service import (
+    KAFKA_TOPIC_BOOKING_UPDATES, KAFKA_TOPIC_DRIVER_OFFER_OUTCOMES,
+    kafka_service)
+from app.services.tracking.location_history import to_unix_seconds
+from db.database import async_session
+from sqlalchemy import func, select
+
+from .scoring import DriverFeatureStore, driver_features
+
+logger = logging.getLogger(__name__)
+
+# Offer outcomes that count towards a driver's acceptance rate. An offer
+# lost to a faster driver or revoked says nothing about this driver.
+OFFER_DECISIONS = ("accepted", "declined", "expired")
+
+
+def event_time(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return to_unix_seconds(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def apply_booking_event(event: dict, store: DriverFeatureStore = driver_features):
+    """
+    Fold one booking status event into the driver's features. Events
+    without a driver_id say nothing about a driver and are ignored.
+    """
+    driver_id = event.get("driver_id")
+    if driver_id is None:
+        return
+    if event.get("status") == BookingStatusEnum.confirmed:
+        store.record_assignment(driver_id, event_time(event.get("timestamp")))
+
+
+def apply_offer_outcome(event: dict, store: DriverFeatureStore = driver_features):
+    """
+    Count an offer the driver accepted, declined or let expire towards the
+    driver's acceptance rate.
+    """
+    if event.get("outcome") in OFFER_DECISIONS:
+        store.record_acceptance(event["driver_id"], event["outcome"] == "accepted")
+
+
+async def handle_driver_features_update(message):
+    try:
+        apply_booking_event(message.value)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Skipping malformed booking event: {e}")
+
+
+async def handle_offer_outcome(message):
+    try:
+        apply_offer_outcome(message.value)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Skipping malformed offer outcome: {e}")
+
+
+async def load_driver_features(store: DriverFeatureStore = driver_features):
+    """
+    Seed each driver's last assignment time from booking history with one
+    aggregate query, so a fresh process does not score every driver as
+    idle. Acceptance is not seeded: declined and expired offers are not
+    stored, and counting past bookings alone would only favour busy
+    drivers. It is learnt from offer outcomes as they happen.
+    """
+    async with async_session() as db:
+        rows = await db.execute(
+            select(Booking.driver_id, func.max(BookingStatusHistory.timestamp))
+            .join(BookingStatusHistory, BookingStatusHistory.booking_id == Booking.id)
+            .where(
+                Booking.driver_id.isnot(None),
+                BookingStatusHistory.status == BookingStatusEnum.confirmed,
+            )
+            .group_by(Booking.driver_id)
+        )
+        for driver_id, last_assigned in rows:
+            store.load(driver_id, last_assigned_at=to_unix_seconds(last_assigned))
+    logger.info(f"Loaded matching features for {len(store)} drivers")
+
+
+async def start_driver_features_consumer():
+    try:
+        await load_driver_features()
+    except Exception as e:
+        logger.error(f"Error loading driver features: {e}")
+    await asyncio.gather(
+        kafka_service.consume_broadcast(
+            KAFKA_TOPIC_BOOKING_UPDATES, handle_driver_features_update
+        ),
+        kafka_service.consume_broadcast(
+            KAFKA_TOPIC_DRIVER_OFFER_OUTCOMES, handle_offer_outcome
+        ),
+    )
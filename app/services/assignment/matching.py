@@ -1,10 +1,18 @@
-from typing import Optional
+import json
+from typing import Iterable, List, Optional, Tuple
 
-import h3
-from app.models import BookingRequest, Driver
-from app.services.assignment.driver_assignment import assign_driver
+import numpy as np
+from app.config import settings
+from app.models import Booking, Driver
+from app.schemas.booking import BookingRequest
+from app.services.assignment.driver_assignment import assign_first_available
+from app.services.assignment.driver_claims import release_claim
+from app.services.assignment.scoring import driver_scorer
 from app.services.caching.cache import get_redis_client
-from app.services.tracking.driver_tracking import get_driver_location
+from app.services.routing import road_router
+from app.services.tracking.proximity import proximity_backend
+from app.utils.geo import haversine_matrix
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .driver_assignment import get_driver_from_db
@@ -14,46 +22,140 @@ async def find_nearest_driver(
     booking_data: BookingRequest, db: AsyncSession
 ) -> Optional[Driver]:
     """
-    Assign the nearest available driver based on pickup location and vehicle type.
+    Assign the best scoring available driver near the pickup location with
+    the right vehicle type.
     """
     pickup_lat = booking_data.pickup_latitude
     pickup_lng = booking_data.pickup_longitude
     vehicle_type = booking_data.vehicle_type
 
-    pickup_h3 = h3.geo_to_h3(pickup_lat, pickup_lng, 9)
-
     redis = await get_redis_client()
+    ranked = await rank_candidates(pickup_lat, pickup_lng, vehicle_type, redis)
 
-    # Search for drivers in expanding hexagon rings
-    for k in range(5):  # Adjust the range based on coverage needs
-        hex_ring = h3.k_ring(pickup_h3, k)
-        for hex_index in hex_ring:
-            drivers = await redis.smembers(f"drivers:{hex_index}:{vehicle_type}")
-            if drivers:
-                nearest_driver = await select_nearest_driver(drivers, pickup_h3, redis)
-                if nearest_driver:
-                    # Assign driver to booking
-                    success = await assign_driver(nearest_driver, booking_data.id, db)
-                    if success:
-                        return await get_driver_from_db(nearest_driver, db)
+    # Claim conflicts fall through to the next-ranked driver in the same
+    # round trip
+    driver_id = await assign_first_available(ranked, booking_data.id)
+    if driver_id is not None:
+        driver = await get_driver_from_db(driver_id, db)
+        if driver is not None:
+            return driver
+        await release_claim(driver_id, booking_data.id)
 
     return None
 
 
-async def select_nearest_driver(drivers: set, pickup_h3: str, redis) -> Optional[int]:
+async def rank_candidates(
+    latitude: float, longitude: float, vehicle_type, redis
+) -> List[int]:
+    """
+    Available drivers near the point with the right vehicle type, best
+    scoring first.
+    """
+    vehicle_type = getattr(vehicle_type, "value", vehicle_type)
+    # One round trip per candidate lookup for the GEO backend, one per
+    # hexagon ring for the H3 set backend
+    candidates = await proximity_backend.find_candidates(
+        redis, latitude, longitude, vehicle_type
+    )
+    # One more round trip for all candidate locations, then every candidate
+    # is scored in one vectorized call
+    nearest = await rank_nearest_drivers(
+        candidates,
+        latitude,
+        longitude,
+        redis,
+        k=settings.PROXIMITY_CANDIDATE_COUNT,
+        by_road=settings.ROUTING_MATCHING_ENABLED,
+    )
+    return [driver_id for driver_id, _ in driver_scorer.rank(nearest)]
+
+
+async def pickup_coordinates(
+    booking_id: int, db: AsyncSession
+) -> Optional[Tuple[float, float]]:
     """
-    Select the nearest driver from a set of drivers based on H3 distance.
+    Latitude and longitude of a booking's pickup point.
     """
-    min_distance = float("inf")
-    nearest_driver = None
+    result = await db.execute(
+        select(
+            func.ST_Y(Booking.pickup_location), func.ST_X(Booking.pickup_location)
+        ).where(Booking.id == booking_id)
+    )
+    row = result.first()
+    if row is None or row[0] is None:
+        return None
+    return float(row[0]), float(row[1])
+
 
-    for driver_id in drivers:
-        location = await get_driver_location(int(driver_id))
-        if location:
-            driver_h3 = h3.geo_to_h3(location["lat"], location["lng"], 9)
-            distance = h3.h3_distance(pickup_h3, driver_h3)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_driver = int(driver_id)
+async def get_driver_locations(
+    driver_ids: Iterable, redis
+) -> Tuple[List[int], np.ndarray]:
+    """
+    Last known positions of the given drivers, fetched with a single MGET.
+    Returns the ids that have a position and an (n, 2) array of their
+    latitude, longitude in the same order.
+    """
+    driver_ids = list(driver_ids)
+    if not driver_ids:
+        return [], np.empty((0, 2))
+    values = await redis.mget(
+        [f"driver:location:{driver_id}" for driver_id in driver_ids]
+    )
+    found = []
+    coords = []
+    for driver_id, value in zip(driver_ids, values):
+        if not value:
+            continue
+        location = json.loads(value)
+        found.append(int(driver_id))
+        coords.append((location["latitude"], location["longitude"]))
+    return found, np.array(coords, dtype=float).reshape(-1, 2)
 
-    return nearest_driver
+
+async def rank_nearest_drivers(
+    drivers: Iterable,
+    latitude: float,
+    longitude: float,
+    redis,
+    k: int = None,
+    by_road: bool = False,
+) -> List[Tuple[int, float]]:
+    """
+    Return up to k (driver_id, distance_km) pairs for the drivers nearest
+    the point, nearest first. Drivers without a known position are left
+    out. With by_road and a road graph loaded, the k nearest by great-circle
+    distance are re-ranked by road distance to the point.
+    """
+    driver_ids, coords = await get_driver_locations(drivers, redis)
+    if not driver_ids:
+        return []
+    distances = haversine_matrix(np.array([[latitude, longitude]]), coords)[0]
+    if k is not None and k < len(distances):
+        nearest = np.argpartition(distances, k - 1)[:k]
+        order = nearest[np.argsort(distances[nearest], kind="stable")]
+    else:
+        order = np.argsort(distances, kind="stable")
+    ranked = [(driver_ids[i], float(distances[i])) for i in order]
+    if by_road and road_router.available:
+        routes = road_router.many_to_one(
+            [tuple(coords[i]) for i in order], latitude, longitude
+        )
+        # Drivers off the road graph keep their straight-line distance
+        ranked = sorted(
+            (
+                (driver_id, route.distance_km if route else distance)
+                for (driver_id, distance), route in zip(ranked, routes)
+            ),
+            key=lambda pair: pair[1],
+        )
+    return ranked
+
+
+async def select_nearest_driver(
+    drivers: Iterable, latitude: float, longitude: float, redis
+) -> Optional[int]:
+    """
+    Select the nearest driver from a set of drivers by great-circle distance.
+    """
+    ranking = await rank_nearest_drivers(drivers, latitude, longitude, redis, k=1)
+    return ranking[0][0] if ranking else None
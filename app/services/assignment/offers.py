@@ -0,0 +1,526 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Set
+
+from app.config import settings
+from app.models import (Booking, BookingStatusEnum, BookingStatusHistory,
+                        Vehicle)
+from app.services.assignment.driver_claims import (AVAILABILITY_TTL_SECONDS,
+                                                   availability_writer,
+                                                   release_claim)
+from app.services.caching.auth_cache import auth_cache
+from app.services.caching.cache import get_redis_client
+from app.services.messaging.kafka_service import (
+    KAFKA_TOPIC_DRIVER_OFFER_OUTCOMES, kafka_service)
+from app.services.tracking.location_scripts import (ACCEPT_OFFER_SCRIPT,
+                                                    DRIVER_BUSY_KEY,
+                                                    DRIVER_CELLS_KEY,
+                                                    get_script)
+from app.services.validation.validation import validate_booking
+from db.database import async_session
+from prometheus_client import Counter, Histogram
+from sqlalchemy import select, update
+
+logger = logging.getLogger(__name__)
+
+OFFER_EVENTS_CHANNEL = "offers:events"
+
+TIME_TO_CONFIRM = Histogram(
+    "booking_time_to_confirm_seconds",
+    "Time from a booking's first driver offer to a driver accepting it.",
+    buckets=(0.5, 1, 2, 3, 5, 8, 10, 15, 20, 30, 45, 60),
+)
+OFFERS = Counter(
+    "booking_offers_total",
+    "Driver offers by how they ended.",
+    ["outcome"],
+)
+
+
+def offered_drivers_key(booking_id: int) -> str:
+    return f"offer:{booking_id}:drivers"
+
+
+def offer_winner_key(booking_id: int) -> str:
+    return f"offer:{booking_id}:winner"
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel. Timers are bucketed into slots by expiry tick, so
+    scheduling and cancelling are O(1) and one ticking task serves every
+    timer, instead of a sleeping coroutine per timer. Timers fire at tick
+    granularity, never early.
+    """
+
+    def __init__(self, tick_ms: int = 100, slots: int = 512):
+        self.tick_seconds = tick_ms / 1000
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]
+        # key: slot holding it
+        self._where: Dict[Hashable, int] = {}
+        self._current = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key: Hashable, delay_seconds: float):
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay_seconds / self.tick_seconds))
+        slot = (self._current + ticks) % len(self._slots)
+        # Full turns of the wheel still to go when the slot comes round
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del self._slots[slot][key]
+        return True
+
+    def tick(self) -> List[Hashable]:
+        """
+        Advance one tick and return the keys that expired.
+        """
+        self._current = (self._current + 1) % len(self._slots)
+        bucket = self._slots[self._current]
+        expired = []
+        for key, rounds in list(bucket.items()):
+            if rounds == 0:
+                del bucket[key]
+                del self._where[key]
+                expired.append(key)
+            else:
+                bucket[key] = rounds - 1
+        return expired
+
+    async def run(self, on_expire: Callable[[Hashable], None]):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick_seconds
+        while True:
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            # Catch up on ticks missed while the loop was busy
+            while next_tick <= loop.time():
+                next_tick += self.tick_seconds
+                for key in self.tick():
+                    try:
+                        on_expire(key)
+                    except Exception as e:
+                        logger.error(f"Error handling expired timer {key}: {e}")
+
+
+@dataclass
+class _OfferState:
+    booking_id: int
+    candidates: List[int]
+    message: dict
+    future: asyncio.Future
+    started_at: float
+    next_index: int = 0
+    outstanding: Set[int] = field(default_factory=set)
+
+
+class OfferEngine:
+    """
+    Offers a booking to its top-ranked drivers and confirms the first who
+    accepts. Up to fan_out offers are outstanding at once, sent together,
+    or one every stagger_ms if set. An offer that is declined or not
+    accepted within accept_timeout_seconds is replaced by one to the next
+    candidate, up to max_offers in total. Accepting is atomic in Redis and
+    can happen on whichever node holds the driver's socket; outcomes reach
+    the node running the cascade over OFFER_EVENTS_CHANNEL, and the
+    remaining offers are revoked. Pub/sub can drop or delay an event, so
+    the winner recorded in Redis is checked before offering further, and
+    the whole cascade gives up after deadline_seconds. Offer timeouts live
+    on one timer wheel.
+    """
+
+    def __init__(
+        self,
+        fan_out: int = 3,
+        accept_timeout_seconds: float = 15.0,
+        stagger_ms: int = 0,
+        max_offers: int = 10,
+        tick_ms: int = 100,
+        deadline_seconds: float = 180.0,
+    ):
+        self.fan_out = fan_out
+        self.accept_timeout_seconds = accept_timeout_seconds
+        self.stagger_seconds = stagger_ms / 1000
+        self.max_offers = max_offers
+        self.deadline_seconds = deadline_seconds
+        self.wheel = TimerWheel(tick_ms=tick_ms)
+        self.manager = None
+        self._bookings: Dict[int, _OfferState] = {}
+        self._tasks = []
+
+    async def start(self, manager):
+        self.manager = manager
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self.wheel.run(self._on_timer)),
+                asyncio.create_task(self._listen()),
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for state in list(self._bookings.values()):
+            self._finish(state, None)
+
+    async def offer(
+        self, booking_id: int, candidates: List[int], message: dict
+    ) -> Optional[int]:
+        """
+        Run the offer cascade for a booking and wait for its outcome: the id
+        of the driver who accepted, or None if nobody did.
+        """
+        if not candidates:
+            return None
+        state = _OfferState(
+            booking_id=booking_id,
+            candidates=[int(driver_id) for driver_id in candidates],
+            message=message,
+            future=asyncio.get_running_loop().create_future(),
+            started_at=time.monotonic(),
+        )
+        self._bookings[booking_id] = state
+        try:
+            await self._refill(state)
+            try:
+                return await asyncio.wait_for(state.future, self.deadline_seconds)
+            except asyncio.TimeoutError:
+                logger.warning(f"Offer cascade for {booking_id} ran out of time")
+                # An accept whose event never arrived still counts
+                winner = await self._winner(booking_id)
+                await self._close(booking_id, winner)
+                return winner
+        finally:
+            self._finish(state, None)
+            # Late accepts find the offer gone
+            redis = await get_redis_client()
+            await redis.delete(offered_drivers_key(booking_id))
+
+    async def _winner(self, booking_id: int) -> Optional[int]:
+        redis = await get_redis_client()
+        winner = await redis.get(offer_winner_key(booking_id))
+        return int(winner) if winner else None
+
+    async def _refill(self, state: _OfferState):
+        if state.next_index:
+            # Never offer past a driver whose accept event is late or lost
+            winner = await self._winner(state.booking_id)
+            if state.future.done():
+                return
+            if winner is not None:
+                await self._close(state.booking_id, winner)
+                return
+        limit = min(len(state.candidates), self.max_offers)
+        wanted = self.fan_out - len(state.outstanding)
+        if self.stagger_seconds:
+            # One at a time; the stagger timer sends the rest
+            wanted = min(wanted, 1)
+        drivers = state.candidates[
+            state.next_index : min(state.next_index + wanted, limit)
+        ]
+        state.next_index += len(drivers)
+        if drivers:
+            await self._send_offers(state, drivers)
+        if not state.outstanding:
+            # Nobody left to ask
+            self._finish(state, None)
+        elif self.stagger_seconds and state.next_index < limit:
+            self.wheel.schedule(("stagger", state.booking_id), self.stagger_seconds)
+
+    async def _send_offers(self, state: _OfferState, drivers: List[int]):
+        redis = await get_redis_client()
+        pipe = redis.pipeline(transaction=False)
+        key = offered_drivers_key(state.booking_id)
+        pipe.sadd(key, *drivers)
+        pipe.expire(key, settings.DRIVER_CLAIM_TTL_SECONDS)
+        await pipe.execute()
+
+        message = {
+            **state.message,
+            "expires_in": self.accept_timeout_seconds,
+        }
+        for driver_id in drivers:
+            state.outstanding.add(driver_id)
+            self.wheel.schedule(
+                ("offer", state.booking_id, driver_id), self.accept_timeout_seconds
+            )
+        results = await asyncio.gather(
+            *(
+                self.manager.send_message_to_driver(
+                    str(driver_id), "booking_offer", message
+                )
+                for driver_id in drivers
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            OFFERS.labels(outcome="sent").inc()
+            if isinstance(result, Exception):
+                logger.error(f"Error sending offer for {state.booking_id}: {result}")
+
+    def _on_timer(self, key):
+        if key[0] == "stagger":
+            state = self._bookings.get(key[1])
+            if state is not None:
+                asyncio.create_task(self._stagger(state))
+        else:
+            _, booking_id, driver_id = key
+            asyncio.create_task(self._expire(booking_id, driver_id))
+
+    async def _stagger(self, state: _OfferState):
+        if len(state.outstanding) < self.fan_out:
+            await self._refill(state)
+
+    async def _expire(self, booking_id: int, driver_id: int):
+        redis = await get_redis_client()
+        # A late accept finds the offer gone
+        if not await redis.srem(offered_drivers_key(booking_id), driver_id):
+            # Accepted or declined already, but the event has not arrived:
+            # stop waiting on the driver and let _refill find any winner
+            await self._drop_offer(booking_id, driver_id, "offer_answered")
+            return
+        OFFERS.labels(outcome="expired").inc()
+        await publish_offer_outcome(driver_id, booking_id, "expired")
+        await self._drop_offer(booking_id, driver_id, "offer_expired")
+
+    async def _drop_offer(self, booking_id: int, driver_id: int, event: str):
+        state = self._bookings.get(booking_id)
+        if state is None or driver_id not in state.outstanding:
+            return
+        state.outstanding.discard(driver_id)
+        self.wheel.cancel(("offer", booking_id, driver_id))
+        if event == "offer_expired":
+            await self.manager.send_message_to_driver(
+                str(driver_id), event, {"booking_id": booking_id}
+            )
+        await self._refill(state)
+
+    async def _close(self, booking_id: int, driver_id: Optional[int]):
+        """
+        End the cascade with the driver who accepted, or None if the booking
+        is gone, and revoke every other outstanding offer.
+        """
+        state = self._bookings.get(booking_id)
+        if state is None:
+            return
+        others = state.outstanding - {driver_id}
+        if driver_id is not None:
+            TIME_TO_CONFIRM.observe(time.monotonic() - state.started_at)
+        self._finish(state, driver_id)
+        await asyncio.gather(
+            *(
+                self.manager.send_message_to_driver(
+                    str(other), "offer_revoked", {"booking_id": booking_id}
+                )
+                for other in others
+            ),
+            return_exceptions=True,
+        )
+        for _ in others:
+            OFFERS.labels(outcome="revoked").inc()
+
+    def _finish(self, state: _OfferState, driver_id: Optional[int]):
+        self._bookings.pop(state.booking_id, None)
+        self.wheel.cancel(("stagger", state.booking_id))
+        for other in state.outstanding:
+            self.wheel.cancel(("offer", state.booking_id, other))
+        if not state.future.done():
+            state.future.set_result(driver_id)
+
+    async def handle_event(self, event: dict):
+        booking_id = int(event["booking_id"])
+        driver_id = int(event["driver_id"])
+        if event["event"] == "accepted":
+            await self._close(booking_id, driver_id)
+        elif event["event"] == "failed":
+            # The booking is gone; the driver who tried to accept knows
+            state = self._bookings.get(booking_id)
+            if state is not None:
+                state.outstanding.discard(driver_id)
+                self.wheel.cancel(("offer", booking_id, driver_id))
+            await self._close(booking_id, None)
+        elif event["event"] == "declined":
+            await self._drop_offer(booking_id, driver_id, "offer_declined")
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                redis = await get_redis_client()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(OFFER_EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        await self.handle_event(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error listening for offer events: {e}")
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(OFFER_EVENTS_CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+async def publish_offer_outcome(driver_id: int, booking_id: int, outcome: str):
+    """
+    Report how a driver answered an offer to every node's driver feature
+    store, which turns these into the acceptance rate used in scoring.
+    """
+    try:
+        await kafka_service.send_message(
+            KAFKA_TOPIC_DRIVER_OFFER_OUTCOMES,
+            {
+                "driver_id": driver_id,
+                "booking_id": booking_id,
+                "outcome": outcome,
+                "timestamp": time.time(),
+            },
+            key=str(driver_id).encode("utf-8"),
+        )
+    except Exception as e:
+        logger.error(f"Error publishing offer outcome for {booking_id}: {e}")
+
+
+async def publish_offer_event(redis, event: str, booking_id: int, driver_id: int):
+    await redis.publish(
+        OFFER_EVENTS_CHANNEL,
+        json.dumps({"event": event, "booking_id": booking_id, "driver_id": driver_id}),
+    )
+
+
+async def check_vehicle_schedule(booking_id: int, driver_id: int):
+    """
+    Run the same vehicle checks as the inline assignment. Raises ValueError
+    if the driver's vehicle is under maintenance or already booked at the
+    booking's time.
+    """
+    async with async_session() as db:
+        booking = await db.get(Booking, booking_id)
+        vehicle_id = await db.scalar(
+            select(Vehicle.id).where(Vehicle.driver_id == driver_id).limit(1)
+        )
+        if booking is None or vehicle_id is None:
+            return
+        await validate_booking(db, vehicle_id, booking.date)
+
+
+async def confirm_booking(booking_id: int, driver_id: int) -> bool:
+    """
+    Assign the driver to the booking if it is still pending.
+    """
+    bookings = Booking.__table__
+    async with async_session() as db:
+        result = await db.execute(
+            update(bookings)
+            .where(
+                bookings.c.id == booking_id,
+                bookings.c.status == BookingStatusEnum.pending,
+            )
+            .values(
+                driver_id=driver_id,
+                status=BookingStatusEnum.confirmed,
+                version=bookings.c.version + 1,
+            )
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            return False
+        db.add(
+            BookingStatusHistory(
+                booking_id=booking_id,
+                status=BookingStatusEnum.confirmed,
+                timestamp=datetime.utcnow(),
+            )
+        )
+        await db.commit()
+    return True
+
+
+async def accept_offer(driver_id: int, booking_id: int) -> bool:
+    """
+    Accept an offer on behalf of a driver. Returns False if the offer had
+    expired, another driver accepted first or the driver's vehicle cannot
+    take the booking.
+    """
+    redis = await get_redis_client()
+    try:
+        await check_vehicle_schedule(booking_id, driver_id)
+    except ValueError as e:
+        # Checked before the accept so the driver never wins the booking:
+        # the cascade drops the offer and moves on as if it was declined
+        logger.info(f"Driver {driver_id} cannot take booking {booking_id}: {e}")
+        if await redis.srem(offered_drivers_key(booking_id), driver_id):
+            OFFERS.labels(outcome="unfit").inc()
+            await publish_offer_event(redis, "declined", booking_id, driver_id)
+        return False
+    accept = get_script(redis, ACCEPT_OFFER_SCRIPT)
+    outcome = await accept(
+        keys=[
+            offered_drivers_key(booking_id),
+            offer_winner_key(booking_id),
+            DRIVER_CELLS_KEY,
+            DRIVER_BUSY_KEY,
+        ],
+        args=[
+            driver_id,
+            booking_id,
+            settings.DRIVER_CLAIM_TTL_SECONDS,
+            AVAILABILITY_TTL_SECONDS,
+        ],
+        client=redis,
+    )
+    if outcome != 1:
+        OFFERS.labels(outcome="lost").inc()
+        return False
+    # The driver said yes either way, which is what acceptance rates count
+    await publish_offer_outcome(driver_id, booking_id, "accepted")
+    if not await confirm_booking(booking_id, driver_id):
+        # Cancelled while the offer was out: nobody has won, and the
+        # cascade stops rather than wait on this driver
+        OFFERS.labels(outcome="failed").inc()
+        await release_claim(driver_id, booking_id)
+        await redis.delete(offer_winner_key(booking_id))
+        await publish_offer_event(redis, "failed", booking_id, driver_id)
+        return False
+
+    OFFERS.labels(outcome="accepted").inc()
+    availability_writer.set(driver_id, False)
+    await auth_cache.invalidate("driver", driver_id)
+    await publish_offer_event(redis, "accepted", booking_id, driver_id)
+    return True
+
+
+async def decline_offer(driver_id: int, booking_id: int) -> bool:
+    redis = await get_redis_client()
+    if not await redis.srem(offered_drivers_key(booking_id), driver_id):
+        return False
+    OFFERS.labels(outcome="declined").inc()
+    await publish_offer_outcome(driver_id, booking_id, "declined")
+    await publish_offer_event(redis, "declined", booking_id, driver_id)
+    return True
+
+
+offer_engine = OfferEngine(
+    fan_out=settings.OFFER_FAN_OUT,
+    accept_timeout_seconds=settings.OFFER_ACCEPT_TIMEOUT_SECONDS,
+    stagger_ms=settings.OFFER_STAGGER_MS,
+    max_offers=settings.OFFER_MAX_OFFERS,
+    tick_ms=settings.OFFER_WHEEL_TICK_MS,
+    deadline_seconds=settings.OFFER_DEADLINE_SECONDS,
+)
@@ -2,12 +2,21 @@ import asyncio
 import json
 from datetime import datetime
 
+from app.models import BookingStatusEnum
+from app.services.assignment.driver_claims import release_claim
 from app.services.caching.cache import get_redis_client
 from app.services.communication.notification import notify_driver_assignment
 from app.services.messaging.kafka_service import (
     KAFKA_TOPIC_BOOKING_STATUS_UPDATES, KAFKA_TOPIC_BOOKING_UPDATES,
     kafka_service)
 
+# Statuses after which the booking's driver can take another job
+DRIVER_RELEASING_STATUSES = (
+    BookingStatusEnum.delivered,
+    BookingStatusEnum.completed,
+    BookingStatusEnum.cancelled,
+)
+
 
 async def handle_booking_update(booking_data):
     redis = await get_redis_client()
@@ -31,6 +40,9 @@ async def handle_booking_update(booking_data):
     if status == "confirmed":
         # Notify driver about the assignment
         await notify_driver_assignment(booking_data["driver_id"], booking_id)
+    elif status in DRIVER_RELEASING_STATUSES and booking_data.get("driver_id"):
+        # Back in the available candidate sets right away
+        await release_claim(booking_data["driver_id"], booking_id)
 
 
 async def start_booking_consumer():
@@ -1,12 +1,20 @@
 from datetime import datetime
+from typing import Optional, Tuple
 
+from app.config import settings
 from app.models import Booking, BookingStatusEnum, BookingStatusHistory
-from app.services.assignment.matching import find_nearest_driver
-from app.services.communication.notification import notify_driver_assignment
+from app.services.assignment.batch_matcher import batch_matcher
+from app.services.assignment.matching import (find_nearest_driver,
+                                              pickup_coordinates,
+                                              rank_candidates)
+from app.services.assignment.offers import offer_engine
+from app.services.caching.cache import get_redis_client
+from app.services.communication.notification import (notify_driver_assignment,
+                                                     notify_drivers_near)
 from app.services.messaging.kafka_service import (KAFKA_TOPIC_BOOKING_UPDATES,
                                                   kafka_service)
 from app.services.validation.validation import validate_booking
-from db.database import get_db
+from db.database import async_session, get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -21,40 +29,124 @@ async def process_immediate_booking(booking_id: int):
             # Booking is not in pending status, possibly already processed
             return
 
-        # Assign driver
-        assigned_driver = await find_nearest_driver(booking, db)
-        if not assigned_driver:
-            # Handle no available driver
-            booking.status = BookingStatusEnum.cancelled
-            await db.commit()
-            return
+        pickup = await pickup_coordinates(booking.id, db)
+        if pickup is not None:
+            # Let drivers around the pickup point know about the new booking
+            await notify_drivers_near(booking.id, *pickup)
 
-        # Validate booking time
-        await validate_booking(db, assigned_driver.vehicle.id, booking.date)
+        mode = settings.IMMEDIATE_MATCHING_MODE
+        if mode == "nearest":
+            await assign_nearest_driver(booking, db)
+            return
+        vehicle_type = booking.vehicle_type
 
-        # Update booking with driver assignment
-        booking.driver_id = assigned_driver.id
-        booking.status = BookingStatusEnum.confirmed
+    # Waiting for drivers takes seconds, so the session is closed first
+    # rather than holding a connection idle in a transaction
+    if mode == "offer":
+        await process_offered_booking(booking_id, vehicle_type, pickup)
+    elif mode == "batch":
+        await process_batched_booking(booking_id)
+    else:
+        raise ValueError(f"Unknown immediate matching mode: {mode}")
 
-        # Add status change to BookingStatusHistory
-        status_history_entry = BookingStatusHistory(
-            booking_id=booking.id,
-            status=BookingStatusEnum.confirmed,
-            timestamp=datetime.utcnow(),
-        )
-        db.add(status_history_entry)
 
+async def assign_nearest_driver(booking: Booking, db: AsyncSession):
+    # Assign driver
+    assigned_driver = await find_nearest_driver(booking, db)
+    if not assigned_driver:
+        # Handle no available driver
+        booking.status = BookingStatusEnum.cancelled
         await db.commit()
+        return
+
+    # Validate booking time
+    await validate_booking(db, assigned_driver.vehicle.id, booking.date)
+
+    # Update booking with driver assignment
+    booking.driver_id = assigned_driver.id
+    booking.status = BookingStatusEnum.confirmed
+
+    # Add status change to BookingStatusHistory
+    status_history_entry = BookingStatusHistory(
+        booking_id=booking.id,
+        status=BookingStatusEnum.confirmed,
+        timestamp=datetime.utcnow(),
+    )
+    db.add(status_history_entry)
+
+    await db.commit()
+
+    # Notify driver about the assignment
+    await notify_driver_assignment(assigned_driver.id, booking.id)
 
-        # Notify driver about the assignment
-        await notify_driver_assignment(assigned_driver.id, booking.id)
+    # Publish booking update to Kafka
+    await kafka_service.send_message(
+        KAFKA_TOPIC_BOOKING_UPDATES,
+        {
+            "booking_id": booking.id,
+            "status": BookingStatusEnum.confirmed,
+            "driver_id": assigned_driver.id,
+        },
+    )
 
-        # Publish booking update to Kafka
-        await kafka_service.send_message(
-            KAFKA_TOPIC_BOOKING_UPDATES,
+
+async def process_offered_booking(
+    booking_id: int, vehicle_type, pickup: Optional[Tuple[float, float]]
+):
+    """
+    Offer the booking to the best-ranked nearby drivers and wait for one to
+    accept. The accepting driver's node commits the assignment.
+    """
+    driver_id = None
+    if pickup is not None:
+        redis = await get_redis_client()
+        candidates = await rank_candidates(*pickup, vehicle_type, redis)
+        driver_id = await offer_engine.offer(
+            booking_id,
+            candidates,
             {
-                "booking_id": booking.id,
-                "status": BookingStatusEnum.confirmed,
-                "driver_id": assigned_driver.id,
+                "booking_id": booking_id,
+                "vehicle_type": getattr(vehicle_type, "value", vehicle_type),
+                "pickup_latitude": pickup[0],
+                "pickup_longitude": pickup[1],
             },
         )
+    await settle_booking(booking_id, driver_id)
+
+
+async def process_batched_booking(booking_id: int):
+    """
+    Hand the booking to the batch matcher, which commits the assignment
+    together with the rest of its batch, then notify the driver.
+    """
+    driver_id = await batch_matcher.submit(booking_id)
+    await settle_booking(booking_id, driver_id)
+
+
+async def settle_booking(booking_id: int, driver_id):
+    """
+    Follow up on an assignment committed elsewhere: notify the driver, or
+    cancel the booking if nobody took it. Reads the booking afresh in a
+    short session of its own.
+    """
+    if driver_id is None:
+        async with async_session() as db:
+            async with db.begin():
+                booking = await db.get(Booking, booking_id, with_for_update=True)
+                if booking is not None and booking.status == BookingStatusEnum.pending:
+                    # Handle no available driver
+                    booking.status = BookingStatusEnum.cancelled
+        return
+
+    # Notify driver about the assignment
+    await notify_driver_assignment(driver_id, booking_id)
+
+    # Publish booking update to Kafka
+    await kafka_service.send_message(
+        KAFKA_TOPIC_BOOKING_UPDATES,
+        {
+            "booking_id": booking_id,
+            "status": BookingStatusEnum.confirmed,
+            "driver_id": driver_id,
+        },
+    )
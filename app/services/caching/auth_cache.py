@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from app.config import settings
+from app.services.caching.cache import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+AUTH_INVALIDATION_CHANNEL = "auth:invalidate"
+
+
+@dataclass(frozen=True)
+class Identity:
+    """
+    What request handlers need to know about an authenticated user or
+    driver, without an ORM object or a database round trip. Also readable
+    like a dict (identity["id"], identity.get("is_driver")) for the socket
+    handlers.
+    """
+
+    id: int
+    kind: str  # "user" or "driver"
+    email: Optional[str] = None
+    role: Optional[str] = None
+    vehicle_type: Optional[str] = None
+    is_available: Optional[bool] = None
+
+    @property
+    def is_driver(self) -> bool:
+        return self.kind == "driver"
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+def token_digest(token: str) -> str:
+    # Only digests are stored, never the bearer tokens themselves
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class AuthCache:
+    """
+    Two-tier cache of verified tokens. The first tier is an in-process LRU of
+    token digest to Identity; the second is Redis, shared by every pod, so a
+    reconnect storm after a deploy verifies each token against Postgres
+    once. Entries never outlive the token's exp claim or ttl_seconds.
+    Changing a user or driver calls invalidate, which drops that identity's
+    Redis entries and tells every pod over pub/sub to drop its local ones.
+    """
+
+    def __init__(self, max_size: int = 50000, ttl_seconds: int = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # digest: (identity, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Identity, float]]" = OrderedDict()
+        # (kind, id): digests cached for that identity
+        self._by_identity: Dict[Tuple[str, int], Set[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _remember(self, digest: str, identity: Identity, expires_at: float):
+        self._entries[digest] = (identity, expires_at)
+        self._entries.move_to_end(digest)
+        self._by_identity.setdefault((identity.kind, identity.id), set()).add(digest)
+        while len(self._entries) > self.max_size:
+            evicted, (evicted_identity, _) = self._entries.popitem(last=False)
+            self._unlink(evicted, evicted_identity)
+
+    def _unlink(self, digest: str, identity: Identity):
+        key = (identity.kind, identity.id)
+        digests = self._by_identity.get(key)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_identity[key]
+
+    async def get(self, token: str, kind: str) -> Optional[Identity]:
+        digest = token_digest(token)
+        now = time.time()
+        entry = self._entries.get(digest)
+        if entry is not None:
+            identity, expires_at = entry
+            if expires_at > now and identity.kind == kind:
+                self._entries.move_to_end(digest)
+                return identity
+            del self._entries[digest]
+            self._unlink(digest, identity)
+
+        redis = await get_redis_client()
+        value = await redis.get(f"auth:token:{digest}")
+        if not value:
+            return None
+        data = json.loads(value)
+        expires_at = data.pop("expires_at")
+        identity = Identity(**data)
+        if expires_at <= now or identity.kind != kind:
+            return None
+        self._remember(digest, identity, expires_at)
+        return identity
+
+    async def put(self, token: str, identity: Identity, token_expires_at: float):
+        digest = token_digest(token)
+        expires_at = min(token_expires_at, time.time() + self.ttl_seconds)
+        ttl = int(expires_at - time.time())
+        if ttl <= 0:
+            return
+        self._remember(digest, identity, expires_at)
+        redis = await get_redis_client()
+        identity_key = f"auth:identity:{identity.kind}:{identity.id}"
+        pipe = redis.pipeline(transaction=False)
+        pipe.set(
+            f"auth:token:{digest}",
+            json.dumps({**asdict(identity), "expires_at": expires_at}),
+            ex=ttl,
+        )
+        pipe.sadd(identity_key, digest)
+        pipe.expire(identity_key, self.ttl_seconds)
+        await pipe.execute()
+
+    def forget(self, kind: str, identity_id: int):
+        for digest in self._by_identity.pop((kind, int(identity_id)), set()):
+            self._entries.pop(digest, None)
+
+    async def invalidate(self, kind: str, identity_id: int):
+        """
+        Drop every cached token of a user or driver on all pods. Call after
+        changing anything an Identity carries.
+        """
+        self.forget(kind, identity_id)
+        redis = await get_redis_client()
+        identity_key = f"auth:identity:{kind}:{identity_id}"
+        digests = await redis.smembers(identity_key)
+        pipe = redis.pipeline(transaction=False)
+        for digest in digests:
+            pipe.delete(f"auth:token:{digest}")
+        pipe.delete(identity_key)
+        pipe.publish(
+            AUTH_INVALIDATION_CHANNEL, json.dumps({"kind": kind, "id": identity_id})
+        )
+        await pipe.execute()
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                redis = await get_redis_client()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(AUTH_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = json.loads(message["data"])
+                        self.forget(data["kind"], data["id"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Anything cached while we were not listening may be stale
+                logger.error(f"Error listening for auth invalidations: {e}")
+                self._entries.clear()
+                self._by_identity.clear()
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(AUTH_INVALIDATION_CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+auth_cache = AuthCache(
+    max_size=settings.AUTH_CACHE_MAX_SIZE, ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS
+)
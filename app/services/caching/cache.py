@@ -2,9 +2,23 @@ import aioredis
 
 REDIS_URL = "redis://localhost"
 
+# Redis errors that batch consumers retry instead of treating the records as bad
+REDIS_TRANSIENT_ERRORS = (aioredis.ConnectionError, aioredis.TimeoutError)
+
+_redis_client = None
+
 
 async def get_redis_client():
-    return await aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+    """
+    Return the process-wide Redis client. The client owns a connection pool,
+    so callers share connections instead of opening a new client each time.
+    """
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = await aioredis.from_url(
+            REDIS_URL, encoding="utf-8", decode_responses=True
+        )
+    return _redis_client
 
 
 async def cache_driver_availability(driver_id: int, is_available: bool):
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiokafka import AIOKafkaConsumer, TopicPartition
+from aiokafka.partitioner import DefaultPartitioner
+from app.config import settings
+from app.services.messaging.kafka_service import KAFKA_TOPIC_DRIVER_ASSIGNMENTS
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+ASSIGNMENT_PUSH_LATENCY = Histogram(
+    "driver_assignment_push_seconds",
+    "Time from an assignment being published to reaching the driver's socket.",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+ASSIGNMENT_ACK_LATENCY = Histogram(
+    "driver_assignment_ack_seconds",
+    "Time from an assignment reaching the driver's socket to the driver's ack.",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ASSIGNMENTS = Counter(
+    "driver_assignments_total",
+    "Assignment events handled by this node's delivery consumer.",
+    ["outcome"],
+)
+
+_partitioner = DefaultPartitioner()
+
+
+def partition_for_driver(driver_id: str, partitions: List[int]) -> int:
+    """
+    The partition an assignment keyed by driver_id lands on, using the same
+    murmur2 partitioner as the producer.
+    """
+    return _partitioner(str(driver_id).encode("utf-8"), partitions, partitions)
+
+
+class AssignmentDeliveryConsumer:
+    """
+    Delivers driver_assignments events to the drivers connected to this node.
+    Events are keyed by driver_id, so the consumer assigns itself only the
+    partitions that hash from its local drivers, outside any consumer group,
+    and re-derives that set as drivers connect and disconnect. A partition
+    picked up for a newly connected driver is read from replay_seconds ago so
+    an assignment published just before the driver connected still arrives.
+    """
+
+    def __init__(
+        self,
+        topic: str = KAFKA_TOPIC_DRIVER_ASSIGNMENTS,
+        batch_size: int = 100,
+        linger_ms: int = 20,
+        replay_seconds: int = 30,
+        ack_timeout_seconds: int = 60,
+    ):
+        self.topic = topic
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self.replay_seconds = replay_seconds
+        self.ack_timeout_seconds = ack_timeout_seconds
+        self.manager = None
+        self.consumer: Optional[AIOKafkaConsumer] = None
+        self._partitions: List[int] = []
+        self._driver_partitions: Dict[str, int] = {}
+        self._assigned: Set[int] = set()
+        # (driver_id, booking_id): monotonic time the assignment was pushed
+        self._awaiting_ack: Dict[Tuple[str, int], float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, manager):
+        self.manager = manager
+        self.consumer = AIOKafkaConsumer(
+            bootstrap_servers=settings.KAFKA_URL,
+            value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+            group_id=None,
+            enable_auto_commit=False,
+        )
+        await self.consumer.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.consumer is not None:
+            await self.consumer.stop()
+            self.consumer = None
+
+    async def _load_partitions(self) -> List[int]:
+        if not self._partitions:
+            partitions = self.consumer.partitions_for_topic(self.topic)
+            if partitions is None:
+                # Fetches metadata for all topics, including ours
+                await self.consumer.topics()
+                partitions = self.consumer.partitions_for_topic(self.topic)
+            self._partitions = sorted(partitions or [])
+        return self._partitions
+
+    async def refresh_assignment(self):
+        partitions = await self._load_partitions()
+        if not partitions:
+            return
+        local_drivers = self.manager.active_drivers.keys()
+        for driver_id in list(self._driver_partitions):
+            if driver_id not in local_drivers:
+                del self._driver_partitions[driver_id]
+        for driver_id in local_drivers:
+            if driver_id not in self._driver_partitions:
+                self._driver_partitions[driver_id] = partition_for_driver(
+                    driver_id, partitions
+                )
+
+        wanted = set(self._driver_partitions.values())
+        if wanted == self._assigned:
+            return
+        added = wanted - self._assigned
+        # assign() replaces the whole assignment and forgets fetch positions,
+        # so partitions that stay are put back where they were
+        kept = {}
+        for partition in self._assigned & wanted:
+            tp = TopicPartition(self.topic, partition)
+            kept[tp] = await self.consumer.position(tp)
+        self.consumer.assign([TopicPartition(self.topic, p) for p in sorted(wanted)])
+        self._assigned = wanted
+        for tp, offset in kept.items():
+            self.consumer.seek(tp, offset)
+        if added:
+            await self._seek_recent([TopicPartition(self.topic, p) for p in added])
+
+    async def _seek_recent(self, topic_partitions: List[TopicPartition]):
+        since_ms = int((time.time() - self.replay_seconds) * 1000)
+        offsets = await self.consumer.offsets_for_times(
+            {tp: since_ms for tp in topic_partitions}
+        )
+        for tp in topic_partitions:
+            found = offsets.get(tp)
+            if found is None:
+                await self.consumer.seek_to_end(tp)
+            else:
+                self.consumer.seek(tp, found.offset)
+
+    async def deliver_batch(self, records: List):
+        """
+        Push every event in the batch whose driver is connected here, all at
+        once, and record how long each took to arrive.
+        """
+        deliveries = []
+        published_at = []
+        for record in records:
+            event = record.value
+            driver_id = str(event.get("driver_id"))
+            if driver_id not in self.manager.active_drivers:
+                # Another node on this partition holds the driver, or nobody
+                continue
+            deliveries.append(self._deliver(driver_id, event.get("message")))
+            published_at.append(record.timestamp / 1000)
+
+        results = await asyncio.gather(*deliveries, return_exceptions=True)
+        delivered_at = time.time()
+        for result, published in zip(results, published_at):
+            if result is True:
+                ASSIGNMENTS.labels(outcome="delivered").inc()
+                ASSIGNMENT_PUSH_LATENCY.observe(max(delivered_at - published, 0))
+            else:
+                ASSIGNMENTS.labels(outcome="failed").inc()
+                if isinstance(result, Exception):
+                    logger.error(f"Error delivering assignment: {result}")
+
+    async def _deliver(self, driver_id: str, message) -> bool:
+        delivered = await self.manager.deliver_local(
+            "driver", driver_id, "assignment", message
+        )
+        booking_id = ((message or {}).get("data") or {}).get("booking_id")
+        if delivered and booking_id is not None:
+            self._awaiting_ack[(driver_id, int(booking_id))] = time.monotonic()
+        return delivered
+
+    def record_ack(self, driver_id: str, booking_id: int):
+        pushed_at = self._awaiting_ack.pop((str(driver_id), int(booking_id)), None)
+        if pushed_at is not None:
+            ASSIGNMENTS.labels(outcome="acked").inc()
+            ASSIGNMENT_ACK_LATENCY.observe(time.monotonic() - pushed_at)
+
+    def _expire_acks(self):
+        cutoff = time.monotonic() - self.ack_timeout_seconds
+        for key, pushed_at in list(self._awaiting_ack.items()):
+            if pushed_at < cutoff:
+                del self._awaiting_ack[key]
+                ASSIGNMENTS.labels(outcome="unacked").inc()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_assignment()
+                self._expire_acks()
+                if not self._assigned:
+                    await asyncio.sleep(self.linger_ms / 1000)
+                    continue
+                batches = await self.consumer.getmany(
+                    timeout_ms=self.linger_ms, max_records=self.batch_size
+                )
+                records = [
+                    record
+                    for partition_records in batches.values()
+                    for record in partition_records
+                ]
+                if records:
+                    await self.deliver_batch(records)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in assignment delivery consumer: {e}")
+                await asyncio.sleep(1)
+
+
+assignment_delivery = AssignmentDeliveryConsumer(
+    batch_size=settings.ASSIGNMENT_DELIVERY_BATCH_SIZE,
+    linger_ms=settings.ASSIGNMENT_DELIVERY_LINGER_MS,
+    replay_seconds=settings.ASSIGNMENT_REPLAY_SECONDS,
+    ack_timeout_seconds=settings.ASSIGNMENT_ACK_TIMEOUT_SECONDS,
+)
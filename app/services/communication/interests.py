@@ -0,0 +1,153 @@
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import h3
+from app.models import Booking, BookingStatusEnum
+from app.services.tracking.h3_index import H3_RESOLUTION
+from db.database import async_session
+from sqlalchemy.future import select
+
+# (south, west, north, east) in degrees. west > east crosses the antimeridian.
+BoundingBox = Tuple[float, float, float, float]
+
+# Bounding boxes are indexed by the coarse H3 cells that cover them, so an
+# update is only checked against the boxes around its own cell. Boxes that
+# would need more than BBOX_MAX_SAMPLES points to cover are not indexed.
+BBOX_INDEX_RESOLUTION = 5
+BBOX_MAX_SAMPLES = 1024
+
+ACTIVE_BOOKING_STATUSES = (
+    BookingStatusEnum.confirmed,
+    BookingStatusEnum.en_route,
+    BookingStatusEnum.goods_collected,
+)
+
+
+@dataclass
+class Interest:
+    """
+    What a socket wants to hear about: specific drivers (from its bookings),
+    H3 cells at any resolution up to H3_RESOLUTION, or map bounding boxes.
+    An update matches if it matches any of them.
+    """
+
+    driver_ids: Set[str] = field(default_factory=set)
+    cells: Set[str] = field(default_factory=set)
+    bboxes: List[BoundingBox] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.driver_ids or self.cells or self.bboxes)
+
+    def in_bboxes(self, latitude: float, longitude: float) -> bool:
+        for south, west, north, east in self.bboxes:
+            if not south <= latitude <= north:
+                continue
+            if west <= east:
+                if west <= longitude <= east:
+                    return True
+            elif longitude >= west or longitude <= east:
+                return True
+        return False
+
+
+def parse_cells(cells: Iterable[Any], max_cells: int) -> Set[str]:
+    parsed = set()
+    for cell in cells:
+        if not isinstance(cell, str) or not h3.h3_is_valid(cell):
+            raise ValueError(f"Invalid H3 cell: {cell}")
+        if h3.h3_get_resolution(cell) > H3_RESOLUTION:
+            raise ValueError(
+                f"H3 cells finer than resolution {H3_RESOLUTION} are not supported."
+            )
+        parsed.add(cell)
+    if len(parsed) > max_cells:
+        raise ValueError(f"At most {max_cells} cells can be subscribed to.")
+    return parsed
+
+
+def bbox_cells(
+    bbox: BoundingBox, resolution: int = BBOX_INDEX_RESOLUTION
+) -> Optional[Set[str]]:
+    """
+    Return H3 cells at the given resolution that together cover the box, or
+    None if the box is too large to index.
+
+    The box is sampled on a grid finer than the cell edge and each sampled
+    cell is padded with its neighbours, so every point inside the box falls in
+    one of the returned cells. Extra cells only cost an exact in_bboxes check.
+    """
+    south, west, north, east = bbox
+    width = east - west if west <= east else east + 360 - west
+    # One degree of latitude is the most a degree of longitude can span
+    step = h3.edge_length(resolution, unit="km") / 111.0
+    rows = math.ceil((north - south) / step) + 1
+    columns = math.ceil(width / step) + 1
+    if rows * columns > BBOX_MAX_SAMPLES:
+        return None
+    cells = set()
+    for row in range(rows):
+        latitude = min(south + row * step, north)
+        for column in range(columns):
+            longitude = west + min(column * step, width)
+            if longitude > 180:
+                longitude -= 360
+            cells.update(h3.k_ring(h3.geo_to_h3(latitude, longitude, resolution), 1))
+    return cells
+
+
+def parse_bbox(bbox: Any) -> BoundingBox:
+    try:
+        south, west, north, east = (float(value) for value in bbox)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be [south, west, north, east].")
+    if not (
+        -90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180
+    ):
+        raise ValueError("bbox is out of range.")
+    return south, west, north, east
+
+
+async def get_booking_driver_ids(
+    user_id: int, booking_ids: Optional[Iterable[int]] = None
+) -> Set[str]:
+    """
+    Return the drivers assigned to the user's active bookings, optionally
+    limited to booking_ids. Bookings of other users are ignored.
+    """
+    query = select(Booking.driver_id).where(
+        Booking.user_id == user_id,
+        Booking.driver_id.isnot(None),
+        Booking.status.in_(ACTIVE_BOOKING_STATUSES),
+    )
+    if booking_ids is not None:
+        query = query.where(Booking.id.in_(list(booking_ids)))
+    async with async_session() as db:
+        result = await db.execute(query)
+        return {str(driver_id) for driver_id in result.scalars().all()}
+
+
+async def resolve_interest(
+    user_id: int, data: Dict[str, Any], max_cells: int
+) -> Interest:
+    """
+    Build an Interest from a client subscribe message such as
+    {"booking_ids": [12], "cells": ["89283082803ffff"],
+    "bbox": [37.70, -122.52, 37.83, -122.35]}.
+    Raises ValueError for malformed messages.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Subscribe message must be an object.")
+    interest = Interest()
+    booking_ids = data.get("booking_ids")
+    if booking_ids:
+        try:
+            booking_ids = [int(booking_id) for booking_id in booking_ids]
+        except (TypeError, ValueError):
+            raise ValueError("booking_ids must be a list of integers.")
+        interest.driver_ids = await get_booking_driver_ids(user_id, booking_ids)
+    if data.get("cells"):
+        interest.cells = parse_cells(data["cells"], max_cells)
+    if data.get("bbox"):
+        interest.bboxes = [parse_bbox(data["bbox"])]
+    return interest
@@ -1,8 +1,10 @@
-import json
 from datetime import datetime
 from typing import List
 
-from app.services.communication.websocket_service import manager
+import h3
+from app.config import settings
+from app.services.communication.presence import presence_registry
+from app.services.communication.websocket_service import hex_room, manager
 from app.services.messaging.kafka_service import (
     KAFKA_TOPIC_DRIVER_ASSIGNMENTS, kafka_service)
 
@@ -24,21 +26,54 @@ async def notify_driver_assignment(driver_id: int, booking_id: int):
         "message": message,
         "timestamp": datetime.utcnow().isoformat(),
     }
-    await kafka_service.send_message(KAFKA_TOPIC_DRIVER_ASSIGNMENTS, assignment_event)
+    # Keyed by driver so each socket node only reads the partitions of the
+    # drivers it holds
+    await kafka_service.send_message(
+        KAFKA_TOPIC_DRIVER_ASSIGNMENTS,
+        assignment_event,
+        key=str(driver_id).encode("utf-8"),
+    )
+
+
+def new_booking_message(booking_id: int) -> dict:
+    return {
+        "type": "new_booking",
+        "data": {
+            "booking_id": booking_id,
+            "message": "A new booking has been created near your location.",
+        },
+    }
 
 
 async def notify_nearby_drivers(booking_id: int, nearby_driver_ids: List[int]):
     """
-    Notify all nearby drivers about a new booking.
+    Notify all nearby drivers about a new booking with a single emit to
+    their driver rooms, so the message is encoded once.
+    """
+    if not nearby_driver_ids:
+        return
+    await manager.sio.emit(
+        "new_booking",
+        new_booking_message(booking_id),
+        room=[f"driver_{driver_id}" for driver_id in nearby_driver_ids],
+        namespace="/",
+    )
+
+
+async def notify_drivers_near(
+    booking_id: int,
+    latitude: float,
+    longitude: float,
+    ring_size: int = settings.HEX_ROOM_RING_SIZE,
+):
+    """
+    Offer a new booking to every driver whose socket sits in a hex room
+    within ring_size cells of the pickup point. The message for the whole
+    ring is published once and every node emits it to its own sockets.
     """
-    message = json.dumps(
-        {
-            "type": "new_booking",
-            "data": {
-                "booking_id": booking_id,
-                "message": "A new booking has been created near your location.",
-            },
-        }
+    center = h3.geo_to_h3(latitude, longitude, settings.HEX_ROOM_RESOLUTION)
+    await presence_registry.broadcast(
+        [hex_room(cell) for cell in h3.k_ring(center, ring_size)],
+        "new_booking",
+        new_booking_message(booking_id),
     )
-    for driver_id in nearby_driver_ids:
-        await manager.send_message_to_driver(str(driver_id), message)
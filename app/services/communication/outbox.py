@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+logger = logging.getLogger(__name__)
+
+
+class SlowConsumerError(Exception):
+    """
+    Raised by ConflatingOutbox.run when a socket has stayed behind for too
+    long and should be disconnected.
+    """
+
+
+class ConflatingOutbox:
+    """
+    Per-connection outbox. Messages are kept by key, so a newer message for
+    the same key (e.g. a driver's position) replaces the queued one, and
+    everything pending is sent as one batched frame per tick. At most
+    max_keys messages are held; beyond that the oldest key is dropped. A
+    socket whose send takes longer than a tick for max_lag_ticks ticks in a
+    row, or longer than max_send_seconds once, is treated as a slow consumer.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[Any]], Awaitable[None]],
+        tick_ms: int = 250,
+        max_keys: int = 1000,
+        max_lag_ticks: int = 20,
+        max_send_seconds: float = 5.0,
+    ):
+        self.send = send
+        self.tick_seconds = tick_ms / 1000
+        self.max_keys = max_keys
+        self.max_lag_ticks = max_lag_ticks
+        self.max_send_seconds = max_send_seconds
+        self.dropped = 0
+        self._pending: Dict[Hashable, Any] = {}
+        self._lagging_ticks = 0
+
+    def put(self, key: Hashable, message: Any):
+        # Re-inserting moves the key to the end, so eviction drops the key
+        # that has gone longest without an update
+        self._pending.pop(key, None)
+        self._pending[key] = message
+        if len(self._pending) > self.max_keys:
+            del self._pending[next(iter(self._pending))]
+            self.dropped += 1
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def flush(self) -> bool:
+        """
+        Send everything pending as one frame. Returns True if a frame was
+        sent.
+        """
+        if not self._pending:
+            return False
+        batch = list(self._pending.values())
+        self._pending = {}
+        await self.send(batch)
+        return True
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            started = loop.time()
+            try:
+                await asyncio.wait_for(self.flush(), self.max_send_seconds)
+            except asyncio.TimeoutError:
+                raise SlowConsumerError(
+                    f"Send blocked for more than {self.max_send_seconds}s"
+                )
+            if loop.time() - started > self.tick_seconds:
+                self._lagging_ticks += 1
+                if self._lagging_ticks >= self.max_lag_ticks:
+                    raise SlowConsumerError(
+                        f"Behind for {self._lagging_ticks} consecutive ticks"
+                    )
+            else:
+                self._lagging_ticks = 0
@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.caching.cache import get_redis_client
+from app.services.tracking.location_scripts import get_script
+
+logger = logging.getLogger(__name__)
+
+# Refresh the leases of every given presence key still owned by this node.
+# KEYS: presence keys
+# ARGV: lease seconds, then the expected value of each key
+# Returns the 1-based positions of keys this node no longer owns.
+REFRESH_LEASES_SCRIPT = """
+local lost = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == ARGV[i + 1] then
+        redis.call('EXPIRE', key, ARGV[1])
+    else
+        table.insert(lost, i)
+    end
+end
+return lost
+"""
+
+# Delete a presence key only if this node still owns it.
+# KEYS: presence key
+# ARGV: expected value
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+LocalSender = Callable[[str, str, str, Any], Awaitable[bool]]
+RoomSender = Callable[[List[str], str, Any], Awaitable[None]]
+
+# Every node listens here for messages addressed to Socket.IO rooms, whose
+# members may be connected to any node
+BROADCAST_CHANNEL = "presence:broadcast"
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def presence_key(kind: str, entity_id: str) -> str:
+    return f"presence:{kind}:{entity_id}"
+
+
+def node_channel(node_id: str) -> str:
+    return f"presence:node:{node_id}"
+
+
+class PresenceRegistry:
+    """
+    Cluster-wide map of connected drivers and users to the API node and
+    socket that holds them. Each entry is a Redis key leased for
+    lease_seconds and renewed by the owning node's heartbeat, so entries of
+    a crashed node expire on their own. Messages for an entity connected
+    elsewhere are published on that node's own channel, one routed hop
+    instead of a broadcast to every node. Messages for rooms go to every
+    node over one shared channel, and each node emits to its own members.
+    """
+
+    def __init__(
+        self,
+        node_id: Optional[str] = None,
+        lease_seconds: int = 30,
+        heartbeat_seconds: int = 10,
+    ):
+        self.node_id = node_id or default_node_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.local_sender: Optional[LocalSender] = None
+        self.room_sender: Optional[RoomSender] = None
+        # (kind, entity_id): stored value
+        self._local: Dict[Tuple[str, str], str] = {}
+        self._tasks = []
+
+    async def start(
+        self, local_sender: LocalSender, room_sender: Optional[RoomSender] = None
+    ):
+        self.local_sender = local_sender
+        self.room_sender = room_sender
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._heartbeat()),
+                asyncio.create_task(self._listen()),
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        redis = await get_redis_client()
+        release = get_script(redis, RELEASE_SCRIPT)
+        for (kind, entity_id), value in list(self._local.items()):
+            await release(
+                keys=[presence_key(kind, entity_id)], args=[value], client=redis
+            )
+        self._local.clear()
+
+    async def register(self, kind: str, entity_id: str, sid: Any):
+        value = json.dumps({"node": self.node_id, "sid": str(sid)})
+        self._local[(kind, entity_id)] = value
+        redis = await get_redis_client()
+        await redis.set(presence_key(kind, entity_id), value, ex=self.lease_seconds)
+
+    async def unregister(self, kind: str, entity_id: str):
+        value = self._local.pop((kind, entity_id), None)
+        if value is None:
+            return
+        redis = await get_redis_client()
+        release = get_script(redis, RELEASE_SCRIPT)
+        await release(keys=[presence_key(kind, entity_id)], args=[value], client=redis)
+
+    async def lookup(self, kind: str, entity_id: str) -> Optional[Dict[str, str]]:
+        redis = await get_redis_client()
+        value = await redis.get(presence_key(kind, entity_id))
+        return json.loads(value) if value else None
+
+    async def route(self, kind: str, entity_id: str, event: str, message: Any) -> bool:
+        """
+        Hand a message to the node holding the entity's socket. Returns False
+        if the entity is not connected anywhere.
+        """
+        presence = await self.lookup(kind, entity_id)
+        if presence is None:
+            return False
+        if presence["node"] == self.node_id:
+            return await self.local_sender(kind, entity_id, event, message)
+        redis = await get_redis_client()
+        envelope = json.dumps(
+            {"kind": kind, "id": entity_id, "event": event, "message": message}
+        )
+        return bool(await redis.publish(node_channel(presence["node"]), envelope))
+
+    async def broadcast(self, rooms: List[str], event: str, message: Any):
+        """
+        Emit to Socket.IO rooms on every node, this one included. The message
+        is encoded and published once however many rooms it covers.
+        """
+        redis = await get_redis_client()
+        envelope = json.dumps({"rooms": rooms, "event": event, "message": message})
+        await redis.publish(BROADCAST_CHANNEL, envelope)
+
+    async def _heartbeat(self):
+        redis = await get_redis_client()
+        refresh = get_script(redis, REFRESH_LEASES_SCRIPT)
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            entries = list(self._local.items())
+            if not entries:
+                continue
+            try:
+                lost = await refresh(
+                    keys=[
+                        presence_key(kind, entity_id)
+                        for (kind, entity_id), _ in entries
+                    ],
+                    args=[self.lease_seconds] + [value for _, value in entries],
+                    client=redis,
+                )
+                # Connected again on another node; that node owns it now
+                for position in lost:
+                    entry, value = entries[int(position) - 1]
+                    if self._local.get(entry) == value:
+                        del self._local[entry]
+            except Exception as e:
+                logger.error(f"Error renewing presence leases: {e}")
+
+    async def _listen(self):
+        channel = node_channel(self.node_id)
+        while True:
+            pubsub = None
+            try:
+                redis = await get_redis_client()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(channel, BROADCAST_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    envelope = json.loads(message["data"])
+                    if message["channel"] == BROADCAST_CHANNEL:
+                        if self.room_sender is not None:
+                            await self.room_sender(
+                                envelope["rooms"],
+                                envelope["event"],
+                                envelope["message"],
+                            )
+                        continue
+                    delivered = await self.local_sender(
+                        envelope["kind"],
+                        envelope["id"],
+                        envelope["event"],
+                        envelope["message"],
+                    )
+                    if not delivered:
+                        logger.warning(
+                            f"Routed {envelope['event']} for {envelope['kind']} "
+                            f"{envelope['id']} is no longer connected here"
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error listening on '{channel}': {e}")
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(channel, BROADCAST_CHANNEL)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+presence_registry = PresenceRegistry(
+    node_id=settings.NODE_ID,
+    lease_seconds=settings.PRESENCE_LEASE_SECONDS,
+    heartbeat_seconds=settings.PRESENCE_HEARTBEAT_SECONDS,
+)
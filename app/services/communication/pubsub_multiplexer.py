@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+from collections import Counter as CountMap
+from typing import Any, Dict, List, Optional, Set
+
+import h3
+from app.config import settings
+from app.services.caching.cache import get_redis_client
+from app.services.communication.interests import (BBOX_INDEX_RESOLUTION,
+                                                  bbox_cells)
+from app.services.tracking.h3_index import H3_RESOLUTION
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+# Redis channel the location consumer publishes driver positions on. Each
+# message is a JSON object or a JSON array of objects.
+DRIVER_LOCATIONS_CHANNEL = "driver_locations"
+
+DROPPED_UPDATES = Counter(
+    "pubsub_dropped_updates_total",
+    "Updates dropped because a local subscriber's queue was full.",
+    ["channel"],
+)
+
+
+class Subscription:
+    """
+    A local subscriber's bounded queue of decoded updates. When the socket
+    falls behind, the oldest queued update is dropped to make room, since a
+    newer position supersedes it.
+    """
+
+    def __init__(self, channel: str, maxsize: int = 100, interest=None):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.interest = interest
+
+    def deliver(self, update: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            DROPPED_UPDATES.labels(channel=self.channel).inc()
+        self.queue.put_nowait(update)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class PubSubMultiplexer:
+    """
+    One Redis pub/sub subscription per worker process, shared by every local
+    socket. Each message is decoded once and fanned out in memory, so Redis
+    sees one subscriber per worker rather than one per connected user. The
+    listener starts with the first local subscriber and stops with the last.
+
+    A subscription with interest=None receives every update. Otherwise an
+    update is delivered only if its driver, H3 cell or position matches the
+    subscription's Interest, looked up through per-driver and per-cell
+    indexes so dispatch cost follows the number of interested sockets.
+    Bounding boxes are indexed by the coarse cells covering them; only boxes
+    too large to cover are checked for every update.
+    """
+
+    def __init__(self, channel: str, queue_size: int = 100):
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._firehose: Set[Subscription] = set()
+        self._by_driver: Dict[str, Set[Subscription]] = {}
+        self._by_cell: Dict[str, Set[Subscription]] = {}
+        self._cell_resolutions: CountMap = CountMap()
+        self._by_bbox_cell: Dict[str, Set[Subscription]] = {}
+        self._bbox_cells: Dict[Subscription, Set[str]] = {}
+        self._wide_bboxes: Set[Subscription] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, interest=None) -> Subscription:
+        subscription = Subscription(self.channel, self.queue_size)
+        self._subscribers.add(subscription)
+        self.set_interest(subscription, interest)
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._unindex(subscription)
+        self._subscribers.discard(subscription)
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def set_interest(self, subscription: Subscription, interest):
+        """
+        Replace what a subscription receives.
+        """
+        self._unindex(subscription)
+        subscription.interest = interest
+        if interest is None:
+            self._firehose.add(subscription)
+            return
+        for driver_id in interest.driver_ids:
+            self._by_driver.setdefault(driver_id, set()).add(subscription)
+        for cell in interest.cells:
+            self._by_cell.setdefault(cell, set()).add(subscription)
+            self._cell_resolutions[h3.h3_get_resolution(cell)] += 1
+        if not interest.bboxes:
+            return
+        covering = set()
+        for bbox in interest.bboxes:
+            cells = bbox_cells(bbox)
+            if cells is None:
+                self._wide_bboxes.add(subscription)
+                return
+            covering |= cells
+        for cell in covering:
+            self._by_bbox_cell.setdefault(cell, set()).add(subscription)
+        self._bbox_cells[subscription] = covering
+
+    def _unindex(self, subscription: Subscription):
+        interest = subscription.interest
+        self._firehose.discard(subscription)
+        self._wide_bboxes.discard(subscription)
+        for cell in self._bbox_cells.pop(subscription, ()):
+            _discard(self._by_bbox_cell, cell, subscription)
+        if interest is None:
+            return
+        for driver_id in interest.driver_ids:
+            _discard(self._by_driver, driver_id, subscription)
+        for cell in interest.cells:
+            _discard(self._by_cell, cell, subscription)
+            resolution = h3.h3_get_resolution(cell)
+            self._cell_resolutions[resolution] -= 1
+            if not self._cell_resolutions[resolution]:
+                del self._cell_resolutions[resolution]
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def _matching(self, update: Dict[str, Any]) -> Set[Subscription]:
+        matched = set(self._firehose)
+        if not isinstance(update, dict):
+            return matched
+        driver_subscribers = self._by_driver.get(str(update.get("driver_id")))
+        if driver_subscribers:
+            matched |= driver_subscribers
+        latitude = update.get("latitude")
+        longitude = update.get("longitude")
+        if latitude is None or longitude is None:
+            return matched
+        if not (self._cell_resolutions or self._by_bbox_cell or self._wide_bboxes):
+            return matched
+        cell = update.get("h3_index") or h3.geo_to_h3(
+            latitude, longitude, H3_RESOLUTION
+        )
+        cell_resolution = h3.h3_get_resolution(cell)
+        if self._cell_resolutions:
+            for resolution in self._cell_resolutions:
+                if resolution > cell_resolution:
+                    continue
+                parent = (
+                    cell
+                    if resolution == cell_resolution
+                    else h3.h3_to_parent(cell, resolution)
+                )
+                cell_subscribers = self._by_cell.get(parent)
+                if cell_subscribers:
+                    matched |= cell_subscribers
+        bbox_subscribers = set(self._wide_bboxes)
+        if self._by_bbox_cell:
+            bbox_cell = (
+                h3.h3_to_parent(cell, BBOX_INDEX_RESOLUTION)
+                if cell_resolution >= BBOX_INDEX_RESOLUTION
+                else h3.geo_to_h3(latitude, longitude, BBOX_INDEX_RESOLUTION)
+            )
+            bbox_subscribers |= self._by_bbox_cell.get(bbox_cell, set())
+        for subscription in bbox_subscribers:
+            if subscription not in matched and subscription.interest.in_bboxes(
+                latitude, longitude
+            ):
+                matched.add(subscription)
+        return matched
+
+    def dispatch(self, data: str):
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring undecodable message on {self.channel}")
+            return
+        updates: List = payload if isinstance(payload, list) else [payload]
+        for update in updates:
+            for subscription in self._matching(update):
+                subscription.deliver(update)
+
+    async def _listen(self):
+        delay = 0.5
+        while True:
+            pubsub = None
+            try:
+                redis = await get_redis_client()
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                logger.info(f"Subscribed to '{self.channel}' for local sockets.")
+                delay = 0.5
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error listening on '{self.channel}': {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(self.channel)
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+
+def _discard(index: Dict[str, Set[Subscription]], key: str, subscription):
+    subscribers = index.get(key)
+    if subscribers is not None:
+        subscribers.discard(subscription)
+        if not subscribers:
+            del index[key]
+
+
+driver_location_multiplexer = PubSubMultiplexer(
+    DRIVER_LOCATIONS_CHANNEL, queue_size=settings.PUBSUB_SUBSCRIBER_QUEUE_SIZE
+)
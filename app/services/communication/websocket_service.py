@@ -1,13 +1,32 @@
+import asyncio
+import json
 import logging
 
 import aioredis
+import h3
 import socketio
-from app.dependencies import get_current_user
+from app.config import settings
+from app.dependencies import get_current_driver, get_current_user
 from app.models import LocationUpdate
+from app.services.assignment.offers import accept_offer, decline_offer
 from app.services.caching.cache import get_redis_client
+from app.services.communication.assignment_delivery import assignment_delivery
+from app.services.communication.interests import (Interest,
+                                                  get_booking_driver_ids,
+                                                  resolve_interest)
+from app.services.communication.outbox import (ConflatingOutbox,
+                                               SlowConsumerError)
+from app.services.communication.presence import presence_registry
+from app.services.communication.pubsub_multiplexer import \
+    driver_location_multiplexer
+from app.services.tracking.movement_filter import movement_filter
 from app.services.tracking.tracking_service import TrackingService
+from app.services.tracking.wire_format import (decode_frame,
+                                               negotiate_subprotocol,
+                                               to_location_updates,
+                                               validate_points)
 from circuitbreaker import circuit
-from fastapi import WebSocket, WebSocketDisconnect, status
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
 from opentelemetry import trace
 from pydantic import ValidationError
 
@@ -17,50 +36,124 @@ tracer = trace.get_tracer(__name__)
 sio = socketio.AsyncServer(
     async_mode="asgi",
     cors_allowed_origins="*",
-    client_manager=None,  # We'll use Redis for scaling
+    # Emits stay on this process; messages for sockets on other nodes go
+    # through the presence registry
+    client_manager=None,
 )
 app_sio = socketio.ASGIApp(sio)
 
-sio.redis = socketio.RedisManager("redis://localhost:6379")
+
+def hex_room(h3_index: str) -> str:
+    return f"hex:{h3_index}"
 
 
 class ConnectionManager:
     def __init__(self):
         self.sio = sio
         self.tracking_service = TrackingService(self)
-        self.active_drivers = {}  # driver_id: sid
-        self.active_users = {}  # user_id: sid
+        # Socket.IO sessions are held by sid, raw WebSocket sessions by the
+        # WebSocket itself
+        self.active_drivers = {}  # driver_id: sid or WebSocket
+        self.active_users = {}  # user_id: sid or WebSocket
+        self.driver_rooms = {}  # driver_id: hex room of the driver's cell
 
     async def broadcast_to_users(self, event, message):
         await self.sio.emit(event, message, namespace="/")
 
     async def send_message_to_driver(self, driver_id: str, event, message):
-        sid = self.active_drivers.get(driver_id)
-        if sid:
-            await self.sio.emit(event, message, room=driver_id, namespace="/")
-        else:
+        if await self.deliver_local("driver", driver_id, event, message):
+            return
+        if not await presence_registry.route("driver", driver_id, event, message):
             logger.warning(f"Attempted to send message to inactive driver: {driver_id}")
 
+    async def send_message_to_user(self, user_id: str, event, message):
+        if await self.deliver_local("user", user_id, event, message):
+            return
+        if not await presence_registry.route("user", user_id, event, message):
+            logger.warning(f"Attempted to send message to inactive user: {user_id}")
+
+    async def deliver_local(self, kind: str, entity_id: str, event, message) -> bool:
+        """
+        Send to a socket held by this process. Returns False if the driver or
+        user is not connected here.
+        """
+        connections = self.active_drivers if kind == "driver" else self.active_users
+        session = connections.get(entity_id)
+        if session is None:
+            return False
+        if isinstance(session, str):
+            await self.sio.emit(event, message, room=session, namespace="/")
+            return True
+        payload = (
+            {**message, "type": event}
+            if isinstance(message, dict)
+            else {"type": event, "message": message}
+        )
+        try:
+            await session.send_json(payload)
+        except Exception as e:
+            logger.warning(f"Error sending {event} to {kind} {entity_id}: {e}")
+            return False
+        return True
+
+    async def emit_to_rooms(self, rooms, event, message):
+        """
+        Emit to the members of the given rooms connected to this process.
+        """
+        await self.sio.emit(event, message, room=rooms, namespace="/")
+
     async def send_personal_message(self, event, message, target_sid: str):
         await self.sio.emit(event, message, room=target_sid, namespace="/")
 
-    async def connect_driver(self, driver_id: str, sid: str):
+    async def connect_driver(self, driver_id: str, sid):
         self.active_drivers[driver_id] = sid
+        await presence_registry.register("driver", driver_id, sid)
         logger.info(f"Driver {driver_id} connected with session ID {sid}")
 
-    async def disconnect_driver(self, driver_id: str):
-        if driver_id in self.active_drivers:
-            del self.active_drivers[driver_id]
-            logger.info(f"Driver {driver_id} disconnected")
-
-    async def connect_user(self, user_id: str, sid: str):
+    async def update_driver_room(
+        self, driver_id: str, latitude: float, longitude: float
+    ):
+        """
+        Keep a connected driver's socket in the hex room of its current cell,
+        so offers can be broadcast to an area with one emit.
+        """
+        sid = self.active_drivers.get(driver_id)
+        # Only Socket.IO sessions can join rooms
+        if not isinstance(sid, str):
+            return
+        room = hex_room(h3.geo_to_h3(latitude, longitude, settings.HEX_ROOM_RESOLUTION))
+        previous = self.driver_rooms.get(driver_id)
+        if room == previous:
+            return
+        if previous:
+            self.sio.leave_room(sid, previous, namespace="/")
+        self.sio.enter_room(sid, room, namespace="/")
+        self.driver_rooms[driver_id] = room
+
+    async def disconnect_driver(self, driver_id: str, sid):
+        """
+        Forget a driver's session. A session that closes after the driver
+        has reconnected leaves the newer one in place.
+        """
+        if self.active_drivers.get(driver_id) != sid:
+            return
+        del self.active_drivers[driver_id]
+        movement_filter.forget(driver_id)
+        self.driver_rooms.pop(driver_id, None)
+        await presence_registry.unregister("driver", driver_id)
+        logger.info(f"Driver {driver_id} disconnected")
+
+    async def connect_user(self, user_id: str, sid):
         self.active_users[user_id] = sid
+        await presence_registry.register("user", user_id, sid)
         logger.info(f"User {user_id} connected with session ID {sid}")
 
-    async def disconnect_user(self, user_id: str):
-        if user_id in self.active_users:
-            del self.active_users[user_id]
-            logger.info(f"User {user_id} disconnected")
+    async def disconnect_user(self, user_id: str, sid):
+        if self.active_users.get(user_id) != sid:
+            return
+        del self.active_users[user_id]
+        await presence_registry.unregister("user", user_id)
+        logger.info(f"User {user_id} disconnected")
 
 
 manager = ConnectionManager()
@@ -83,21 +176,26 @@ async def authenticate_websocket(websocket: WebSocket, is_driver: bool = False):
         token_type, token_value = token.split()
         if token_type.lower() != "bearer":
             raise ValueError("Invalid token type")
-        user = await get_current_user(token_value)
+        if is_driver:
+            user = await get_current_driver(token_value)
+        else:
+            user = await get_current_user(token_value)
         if not user:
             raise ValueError("Invalid token")
-        if is_driver and not user.get("is_driver"):
-            raise ValueError("User is not a driver")
         logger.info(f"Authenticated {'driver' if is_driver else 'user'}: {user['id']}")
         return user
-    except (ValueError, IndexError) as e:
+    except (ValueError, IndexError, HTTPException) as e:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
         logger.warning(f"WebSocket connection closed due to authentication error: {e}")
         return None
 
 
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
+    """
+    Authenticate a Socket.IO session. Drivers connect with
+    auth={"kind": "driver"} and a driver token; everyone else is a user.
+    """
     token = environ.get("HTTP_AUTHORIZATION")
     if not token:
         await sio.disconnect(sid)
@@ -107,7 +205,10 @@ async def connect(sid, environ):
         token_type, token_value = token.split()
         if token_type.lower() != "bearer":
             raise ValueError("Invalid token type")
-        user = await get_current_user(token_value)
+        if isinstance(auth, dict) and auth.get("kind") == "driver":
+            user = await get_current_driver(token_value)
+        else:
+            user = await get_current_user(token_value)
         if not user:
             raise ValueError("Invalid token")
         sio.environ[sid] = {"user": user}
@@ -120,7 +221,7 @@ async def connect(sid, environ):
             await manager.connect_driver(str(user["id"]), sid)
         else:
             await manager.connect_user(str(user["id"]), sid)
-    except (ValueError, IndexError) as e:
+    except (ValueError, IndexError, HTTPException) as e:
         await sio.disconnect(sid)
         logger.warning(f"Socket.IO connection closed due to authentication error: {e}")
 
@@ -131,10 +232,10 @@ async def disconnect(sid):
     if user:
         user_id = user["id"]
         if user.get("is_driver"):
-            await manager.disconnect_driver(str(user_id))
+            await manager.disconnect_driver(str(user_id), sid)
             logger.info(f"Driver {user_id} disconnected.")
         else:
-            await manager.disconnect_user(str(user_id))
+            await manager.disconnect_user(str(user_id), sid)
             logger.info(f"User {user_id} disconnected.")
     else:
         logger.info(f"Client {sid} disconnected without authenticated user.")
@@ -189,13 +290,60 @@ async def assign_booking(sid, booking):
         logger.error(f"Error assigning booking to driver {booking['driver_id']}: {e}")
 
 
+@sio.event
+async def assignment_ack(sid, data):
+    user = sio.environ.get(sid, {}).get("user")
+    if not user or not user.get("is_driver"):
+        await sio.emit("error", {"message": "Unauthorized"}, room=sid)
+        return
+    try:
+        assignment_delivery.record_ack(str(user["id"]), int(data["booking_id"]))
+    except (KeyError, TypeError, ValueError):
+        await manager.send_personal_message(
+            "error", {"message": "Invalid assignment ack."}, sid
+        )
+
+
+@sio.event
+async def offer_accept(sid, data):
+    user = sio.environ.get(sid, {}).get("user")
+    if not user or not user.get("is_driver"):
+        await sio.emit("error", {"message": "Unauthorized"}, room=sid)
+        return
+    try:
+        booking_id = int(data["booking_id"])
+    except (KeyError, TypeError, ValueError):
+        await manager.send_personal_message(
+            "error", {"message": "Invalid offer response."}, sid
+        )
+        return
+    accepted = await accept_offer(int(user["id"]), booking_id)
+    await manager.send_personal_message(
+        "offer_result", {"booking_id": booking_id, "accepted": accepted}, sid
+    )
+
+
+@sio.event
+async def offer_decline(sid, data):
+    user = sio.environ.get(sid, {}).get("user")
+    if not user or not user.get("is_driver"):
+        await sio.emit("error", {"message": "Unauthorized"}, room=sid)
+        return
+    try:
+        await decline_offer(int(user["id"]), int(data["booking_id"]))
+    except (KeyError, TypeError, ValueError):
+        await manager.send_personal_message(
+            "error", {"message": "Invalid offer response."}, sid
+        )
+
+
 async def handle_driver_connection(websocket: WebSocket):
     user = await authenticate_websocket(websocket, is_driver=True)
     if not user:
         return
 
     driver_id = str(user["id"])
-    await manager.connect_driver(driver_id, websocket.client)
+    await manager.connect_driver(driver_id, websocket)
     try:
         while True:
             data = await websocket.receive_text()
@@ -215,50 +363,119 @@ async def handle_driver_connection(websocket: WebSocket):
                 )
                 logger.error(f"Validation error from driver {driver_id}: {e}")
     except WebSocketDisconnect:
-        await manager.disconnect_driver(driver_id)
+        pass
     except Exception as e:
         logger.error(f"Error in handle_driver_connection: {str(e)}")
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        await manager.disconnect_driver(driver_id, websocket)
 
 
 async def handle_user_connection(websocket: WebSocket):
     user = await authenticate_websocket(websocket)
     if not user:
         return
+    await websocket.accept()
 
     user_id = str(user["id"])
-    await manager.connect_user(user_id, websocket.client)
+    await manager.connect_user(user_id, websocket)
+    # Until the client says otherwise, it only hears about the drivers on
+    # its active bookings
+    interest = Interest(driver_ids=await get_booking_driver_ids(user["id"]))
+    subscription = driver_location_multiplexer.subscribe(interest)
+
+    async def send_batch(updates):
+        await websocket.send_json(
+            {"type": "driver_location_updates", "updates": updates}
+        )
+
+    outbox = ConflatingOutbox(
+        send_batch,
+        tick_ms=settings.OUTBOX_TICK_MS,
+        max_keys=settings.OUTBOX_MAX_KEYS,
+        max_lag_ticks=settings.OUTBOX_MAX_LAG_TICKS,
+        max_send_seconds=settings.OUTBOX_MAX_SEND_SECONDS,
+    )
+    tasks = {
+        asyncio.create_task(receive_subscriptions(websocket, user, subscription)),
+        asyncio.create_task(forward_location_updates(subscription, outbox)),
+        asyncio.create_task(outbox.run()),
+    }
     try:
-        redis = await get_redis_client()
-        pubsub = redis.pubsub()
-        await pubsub.subscribe("driver_locations")
-        logger.info(f"User {user_id} subscribed to 'driver_locations' channel.")
-        async for message in pubsub.listen():
-            if message["type"] == "message":
-                await manager.send_personal_message(
-                    "driver_location_update", message["data"], websocket.client
-                )
+        logger.info(f"User {user_id} subscribed to driver location updates.")
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except WebSocketDisconnect:
-        await manager.disconnect_user(user_id)
+        pass
+    except SlowConsumerError as e:
+        logger.warning(f"Disconnecting slow user {user_id}: {e}")
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
     except Exception as e:
         logger.error(f"Error in handle_user_connection: {str(e)}")
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
     finally:
-        await pubsub.unsubscribe("driver_locations")
-        await pubsub.close()
+        for task in tasks:
+            task.cancel()
+        await manager.disconnect_user(user_id, websocket)
+        driver_location_multiplexer.unsubscribe(subscription)
         logger.info(f"User {user_id} unsubscribed and connection closed.")
 
 
+async def receive_subscriptions(websocket: WebSocket, user, subscription):
+    while True:
+        data = await websocket.receive_text()
+        try:
+            interest = await resolve_interest(
+                user["id"], json.loads(data), settings.SUBSCRIPTION_MAX_CELLS
+            )
+        except ValueError as e:
+            await websocket.send_json(
+                {"type": "error", "message": f"Invalid subscription: {str(e)}"}
+            )
+            continue
+        driver_location_multiplexer.set_interest(subscription, interest)
+        await websocket.send_json(
+            {
+                "type": "subscribed",
+                "driver_ids": sorted(interest.driver_ids),
+                "cells": sorted(interest.cells),
+                "bboxes": interest.bboxes,
+            }
+        )
+
+
+async def forward_location_updates(subscription, outbox: ConflatingOutbox):
+    # Only the latest position per driver is kept until the next tick
+    while True:
+        update = await subscription.get()
+        outbox.put(update.get("driver_id"), update)
+
+
 async def handle_driver_batch_connection(websocket: WebSocket):
     user = await authenticate_websocket(websocket, is_driver=True)
     if not user:
         return
 
+    # Devices that offer a binary subprotocol send packed frames; everyone
+    # else keeps sending JSON lists.
+    subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+    await websocket.accept(subprotocol=subprotocol)
+
     driver_id = str(user["id"])
-    await manager.connect_driver(driver_id, websocket.client)
+    await manager.connect_driver(driver_id, websocket)
     try:
         while True:
-            data = await websocket.receive_json()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if subprotocol and message.get("bytes") is not None:
+                await handle_binary_location_frame(
+                    websocket, user, message["bytes"], subprotocol
+                )
+                continue
+
+            data = json.loads(message.get("text") or "null")
             if isinstance(data, list):
                 for location in data:
                     try:
@@ -287,7 +504,54 @@ async def handle_driver_batch_connection(websocket: WebSocket):
                 )
                 logger.warning(f"Driver {driver_id} sent invalid batch data.")
     except WebSocketDisconnect:
-        await manager.disconnect_driver(driver_id)
+        pass
     except Exception as e:
         logger.error(f"Error in handle_driver_batch_connection: {str(e)}")
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        await manager.disconnect_driver(driver_id, websocket)
+
+
+async def handle_binary_location_frame(
+    websocket: WebSocket, user, payload: bytes, subprotocol: str
+):
+    """
+    Decode and validate a binary burst of location points in one pass and
+    publish the valid ones together.
+    """
+    driver_id = str(user["id"])
+    try:
+        points = decode_frame(payload, subprotocol)
+    except ValueError as e:
+        await websocket.send_json(
+            {"type": "error", "message": f"Invalid data format: {str(e)}"}
+        )
+        logger.error(f"Batch decode error from driver {driver_id}: {e}")
+        return
+
+    # A driver may only report its own position
+    foreign = points["driver_id"] != int(user["id"])
+    if foreign.any():
+        points = points[~foreign]
+        await websocket.send_json(
+            {
+                "type": "error",
+                "message": f"Rejected {int(foreign.sum())} location updates "
+                "for other drivers.",
+            }
+        )
+        logger.warning(f"Driver {driver_id} sent location updates for other drivers.")
+
+    points, rejected = validate_points(points)
+    if rejected:
+        await websocket.send_json(
+            {
+                "type": "error",
+                "message": f"Rejected {rejected} invalid location updates.",
+            }
+        )
+        logger.warning(f"Driver {driver_id} sent {rejected} invalid location updates.")
+
+    await manager.tracking_service.update_driver_location_batch(
+        to_location_updates(points, user["vehicle_type"]), user["is_available"]
+    )
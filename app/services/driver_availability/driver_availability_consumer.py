@@ -1,7 +1,7 @@
 import asyncio
 import json
 
-from app.services.caching.cache import cache_driver_availability
+from app.services.assignment.driver_claims import set_driver_availability
 from app.services.messaging.kafka_service import (
     KAFKA_TOPIC_DRIVER_AVAILABILITY_UPDATES, kafka_service)
 
@@ -18,8 +18,9 @@ async def handle_driver_availability_update(message):
             driver_id = data["driver_id"]
             is_available = data["is_available"]
 
-            # Update availability in cache or database
-            await cache_driver_availability(driver_id, is_available)
+            # Update availability in cache and move the driver between the
+            # available and busy candidate sets
+            await set_driver_availability(driver_id, is_available)
             break  # Exit loop if successful
 
         except Exception as e:
@@ -1,15 +1,29 @@
 import asyncio
+import dataclasses
 import json
+import logging
+from typing import Callable, Dict, Optional, Set, Tuple, Type
 
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka.structs import TopicPartition
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 KAFKA_TOPIC_DRIVER_LOCATIONS = "driver_locations"
 KAFKA_TOPIC_BOOKING_UPDATES = "booking_updates"
 KAFKA_TOPIC_DRIVER_ASSIGNMENTS = "driver_assignments"
 KAFKA_TOPIC_DRIVER_AVAILABILITY_UPDATES = "driver_availability_updates"
 KAFKA_TOPIC_BOOKING_STATUS_UPDATES = "booking_status_updates"
 KAFKA_TOPIC_ANALYTICS_UPDATES = "analytics_updates"
+KAFKA_TOPIC_DRIVER_OFFER_OUTCOMES = "driver_offer_outcomes"
+
+# Records consume_batches gives up on are sent to "<topic>_dead_letter"
+DEAD_LETTER_SUFFIX = "_dead_letter"
+
+# Errors that say nothing about the records themselves, so the batch is
+# retried until they clear. Callers add their clients' connection errors.
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (OSError, asyncio.TimeoutError)
 
 
 class KafkaService:
@@ -22,7 +36,9 @@ class KafkaService:
             acks="all",
             retries=5,
         )
-        self.consumer = None
+        # Every consumer currently running in this process. Each consume_*
+        # call owns its consumer; several run side by side in the API.
+        self.consumers: Set[AIOKafkaConsumer] = set()
 
     async def start(self):
         await self.producer.start()
@@ -30,14 +46,30 @@ class KafkaService:
     async def stop(self):
         if self.producer:
             await self.producer.stop()
-        if self.consumer:
-            await self.consumer.stop()
+        for consumer in list(self.consumers):
+            await consumer.stop()
+
+    async def _start_consumer(self, consumer: AIOKafkaConsumer):
+        await consumer.start()
+        self.consumers.add(consumer)
 
-    async def send_message(self, topic, message):
-        await self.producer.send_and_wait(topic, message)
+    async def _stop_consumer(self, consumer: AIOKafkaConsumer):
+        self.consumers.discard(consumer)
+        await consumer.stop()
+
+    async def send_message(self, topic, message, key: bytes = None):
+        await self.producer.send_and_wait(topic, message, key=key)
+
+    async def send_messages(self, topic, messages):
+        """
+        Enqueue several messages at once and wait for all of them to be
+        acknowledged, letting the producer batch them per partition.
+        """
+        futures = [await self.producer.send(topic, message) for message in messages]
+        await asyncio.gather(*futures)
 
     async def consume_messages(self, topic, message_handler):
-        self.consumer = AIOKafkaConsumer(
+        consumer = AIOKafkaConsumer(
             topic,
             bootstrap_servers=settings.KAFKA_URL,
             value_deserializer=lambda m: json.loads(m.decode("utf-8")),
@@ -45,12 +77,179 @@ class KafkaService:
             enable_auto_commit=True,
             auto_offset_reset="earliest",
         )
-        await self.consumer.start()
+        await self._start_consumer(consumer)
         try:
-            async for msg in self.consumer:
+            async for msg in consumer:
                 asyncio.create_task(message_handler(msg))
         finally:
-            await self.consumer.stop()
+            await self._stop_consumer(consumer)
+
+    async def consume_batches(
+        self,
+        topic,
+        batch_handler,
+        max_records: int = 500,
+        linger_ms: int = 50,
+        group_id: str = None,
+        transient_errors: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+        committable_offsets: Optional[Callable[[], Dict[TopicPartition, int]]] = None,
+    ):
+        """
+        Consume a topic in batches. A batch is handed to batch_handler once it
+        holds max_records messages or linger_ms has passed since the first
+        poll, whichever comes first. Offsets are committed only after the
+        batch is handled, see handle_batch for what happens when it fails.
+        Pass group_id to read the topic independently of its default
+        consumer group.
+
+        Handlers that hold records in memory past the batch pass
+        committable_offsets, returning the offsets that are safe to commit
+        after each batch, instead of everything consumed being committed.
+        """
+        consumer = AIOKafkaConsumer(
+            topic,
+            bootstrap_servers=settings.KAFKA_URL,
+            group_id=group_id or f"{topic}_group",
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        await self._start_consumer(consumer)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = []
+                deadline = loop.time() + linger_ms / 1000
+                while len(batch) < max_records:
+                    remaining_ms = max(int((deadline - loop.time()) * 1000), 0)
+                    if batch and remaining_ms == 0:
+                        break
+                    records = await consumer.getmany(
+                        timeout_ms=remaining_ms or linger_ms,
+                        max_records=max_records - len(batch),
+                    )
+                    for partition_records in records.values():
+                        batch.extend(partition_records)
+                if batch:
+                    batch = await self.decode_batch(topic, batch)
+                    if batch:
+                        await self.handle_batch(
+                            topic, batch, batch_handler, transient_errors
+                        )
+                    if committable_offsets is None:
+                        await consumer.commit()
+                    else:
+                        offsets = committable_offsets()
+                        if offsets:
+                            await consumer.commit(offsets)
+        finally:
+            await self._stop_consumer(consumer)
+
+    async def decode_batch(self, topic, records) -> list:
+        """
+        JSON-decode record values, dead-lettering records that are not JSON.
+        """
+        decoded = []
+        for record in records:
+            try:
+                value = json.loads(record.value.decode("utf-8"))
+            except (AttributeError, ValueError) as e:
+                await self.dead_letter(topic, record, e)
+                continue
+            decoded.append(dataclasses.replace(record, value=value))
+        return decoded
+
+    async def handle_batch(
+        self,
+        topic,
+        batch,
+        batch_handler,
+        transient_errors: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+    ):
+        """
+        Run batch_handler until it succeeds. Transient errors are retried
+        with backoff for as long as they last. Any other error is retried
+        KAFKA_BATCH_MAX_ATTEMPTS times, then the batch is split in halves to
+        find the records that can never succeed, which are dead-lettered.
+        """
+        attempt = failures = 0
+        while True:
+            try:
+                await batch_handler(batch)
+                return
+            except transient_errors as e:
+                failures += 1
+                logger.warning(
+                    f"Transient error handling {len(batch)} {topic} records: {e}"
+                )
+            except Exception as e:
+                attempt += 1
+                failures += 1
+                logger.warning(
+                    f"Error handling {len(batch)} {topic} records "
+                    f"(attempt {attempt}): {e}"
+                )
+                if attempt >= settings.KAFKA_BATCH_MAX_ATTEMPTS:
+                    if len(batch) == 1:
+                        await self.dead_letter(topic, batch[0], e)
+                        return
+                    middle = len(batch) // 2
+                    for half in (batch[:middle], batch[middle:]):
+                        await self.handle_batch(
+                            topic, half, batch_handler, transient_errors
+                        )
+                    return
+            backoff = settings.KAFKA_BATCH_RETRY_BACKOFF_MS / 1000
+            await asyncio.sleep(
+                min(
+                    backoff * 2 ** min(failures - 1, 10),
+                    settings.KAFKA_BATCH_MAX_BACKOFF_SECONDS,
+                )
+            )
+
+    async def dead_letter(self, topic, record, error: BaseException):
+        """
+        Park a record that cannot be handled on the topic's dead-letter
+        topic, with where it came from and why it failed.
+        """
+        value = record.value
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="replace")
+        logger.error(
+            f"Dead-lettering {topic} record {record.partition}:{record.offset}: "
+            f"{error!r}"
+        )
+        await self.send_message(
+            f"{topic}{DEAD_LETTER_SUFFIX}",
+            {
+                "topic": topic,
+                "partition": record.partition,
+                "offset": record.offset,
+                "value": value,
+                "error": repr(error),
+            },
+        )
+
+    async def consume_broadcast(self, topic, message_handler):
+        """
+        Consume every message on a topic in this process, outside any consumer
+        group, starting from the latest offset. Messages are handled in order,
+        so handlers must be quick; this is meant for per-process state such
+        as in-memory indexes rather than for work that should run once.
+        """
+        consumer = AIOKafkaConsumer(
+            topic,
+            bootstrap_servers=settings.KAFKA_URL,
+            value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+            group_id=None,
+            enable_auto_commit=False,
+            auto_offset_reset="latest",
+        )
+        await self._start_consumer(consumer)
+        try:
+            async for msg in consumer:
+                await message_handler(msg)
+        finally:
+            await self._stop_consumer(consumer)
 
 
 kafka_service = KafkaService()
@@ -4,8 +4,10 @@ from typing import Optional
 
 import h3
 import httpx
+from app.config import settings
 from app.schemas.pricing import PricingSchema
 from app.services.caching.cache import get_redis_client
+from app.services.routing import road_router
 
 # Configuration for pricing factors based on vehicle types
 BASE_FARE = {"refrigerated_truck": 15.0, "van": 10.0, "truck": 12.5}
@@ -26,8 +28,7 @@ PEAK_HOURS = [(6, 9), (17, 20)]
 PEAK_MULTIPLIER = 1.5
 OFF_PEAK_MULTIPLIER = 1.0
 
-# Google Maps API Configuration
-GOOGLE_MAPS_API_KEY = "YOUR_GOOGLE_MAPS_API_KEY"
+# Google Maps API Configuration, only used as a fallback to the road router
 GOOGLE_DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
 
 
@@ -59,6 +60,23 @@ def get_h3_index(lat: float, lon: float) -> str:
 
 async def get_distance_duration(
     pickup_lat: float, pickup_lng: float, dropoff_lat: float, dropoff_lng: float
+) -> Optional[dict]:
+    """
+    Road distance in kilometers and duration in minutes, from the in-process
+    road router, falling back to Google Maps if it has no route.
+    """
+    route = road_router.route(pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)
+    if route is not None:
+        return {"distance_km": route.distance_km, "duration_min": route.duration_min}
+    if not settings.ROUTING_GOOGLE_FALLBACK or not settings.GOOGLE_MAPS_API_KEY:
+        return None
+    return await get_google_distance_duration(
+        pickup_lat, pickup_lng, dropoff_lat, dropoff_lng
+    )
+
+
+async def get_google_distance_duration(
+    pickup_lat: float, pickup_lng: float, dropoff_lat: float, dropoff_lng: float
 ) -> Optional[dict]:
     """
     Use Google Maps Distance Matrix API to get distance in kilometers and duration in minutes.
@@ -67,7 +85,7 @@ async def get_distance_duration(
         "origins": f"{pickup_lat},{pickup_lng}",
         "destinations": f"{dropoff_lat},{dropoff_lng}",
         "units": "metric",
-        "key": GOOGLE_MAPS_API_KEY,
+        "key": settings.GOOGLE_MAPS_API_KEY,
     }
     async with httpx.AsyncClient() as client:
         response = await client.get(GOOGLE_DISTANCE_MATRIX_URL, params=params)
@@ -117,7 +135,7 @@ async def calculate_price(pricing_data: dict) -> float:
     vehicle_type = pricing_schema.vehicle_type
     scheduled_time = pricing_schema.scheduled_time
 
-    # Fetch distance and duration from Google Maps API
+    # Fetch road distance and duration
     distance_duration = await get_distance_duration(
         pickup_lat, pickup_lng, dropoff_lat, dropoff_lng
     )
@@ -0,0 +1,3 @@
+from .router import Route, road_router
+
+__all__ = ["Route", "road_router"]
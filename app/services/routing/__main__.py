@@ -0,0 +1,39 @@
+import argparse
+import logging
+import time
+
+from .contraction import contract
+from .osm import load_osm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.services.routing",
+        description="Build the road graph loaded from ROUTING_GRAPH_PATH.",
+    )
+    parser.add_argument("extract", help="OSM XML extract (.osm, .osm.gz, .osm.bz2)")
+    parser.add_argument("output", help="Where to write the graph (.npz)")
+    parser.add_argument(
+        "--settle-limit",
+        type=int,
+        default=500,
+        help="Nodes a witness search may settle before giving up",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("app.services.routing")
+
+    started = time.monotonic()
+    network = load_osm(args.extract)
+    logger.info(f"Contracting {len(network)} road nodes")
+    graph = contract(network, settle_limit=args.settle_limit)
+    graph.save(args.output)
+    logger.info(
+        f"Wrote {args.output}: {len(graph)} nodes, "
+        f"{len(graph.forward_targets) + len(graph.backward_targets)} upward edges "
+        f"in {time.monotonic() - started:.0f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
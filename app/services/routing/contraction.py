@@ -0,0 +1,185 @@
+import heapq
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .osm import RoadNetwork
+
+logger = logging.getLogger(__name__)
+
+# (duration_s, length_m) of an edge or shortcut
+EdgeCost = Tuple[float, float]
+
+
+@dataclass
+class ContractedGraph:
+    """
+    A contraction hierarchy. Each node keeps only its edges towards nodes
+    contracted after it: forward_* are its outgoing upward edges and
+    backward_* the upward edges leading into it, both in CSR form (the
+    edges of node v are offsets[v]:offsets[v + 1]). Edge weights are
+    durations; lengths are carried along so a fastest route also has a
+    distance.
+    """
+
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    forward_offsets: np.ndarray
+    forward_targets: np.ndarray
+    forward_durations: np.ndarray
+    forward_lengths: np.ndarray
+    backward_offsets: np.ndarray
+    backward_targets: np.ndarray
+    backward_durations: np.ndarray
+    backward_lengths: np.ndarray
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def save(self, path: str):
+        np.savez_compressed(path, **self.__dict__)
+
+    @classmethod
+    def load(cls, path: str) -> "ContractedGraph":
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in cls.__dataclass_fields__})
+
+
+def _csr(upward: List[List[Tuple[int, EdgeCost]]]):
+    offsets = np.zeros(len(upward) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(edges) for edges in upward])
+    edges = [edge for node_edges in upward for edge in node_edges]
+    targets = np.array([target for target, _ in edges], dtype=np.int64)
+    durations = np.array([cost[0] for _, cost in edges], dtype=float)
+    lengths = np.array([cost[1] for _, cost in edges], dtype=float)
+    return offsets, targets, durations, lengths
+
+
+class _Contractor:
+    def __init__(self, network: RoadNetwork, settle_limit: int):
+        n = len(network)
+        self.network = network
+        self.settle_limit = settle_limit
+        self.out: List[Dict[int, EdgeCost]] = [{} for _ in range(n)]
+        self.into: List[Dict[int, EdgeCost]] = [{} for _ in range(n)]
+        self.deleted_neighbors = [0] * n
+        for source, target, duration, length in zip(
+            network.sources.tolist(),
+            network.targets.tolist(),
+            network.durations_s.tolist(),
+            network.lengths_m.tolist(),
+        ):
+            if source != target:
+                self._add_edge(source, target, (duration, length))
+
+    def _add_edge(self, source: int, target: int, cost: EdgeCost):
+        current = self.out[source].get(target)
+        if current is None or cost[0] < current[0]:
+            self.out[source][target] = cost
+            self.into[target][source] = cost
+
+    def _witness_durations(
+        self, source: int, skip: int, limit: float, targets
+    ) -> Dict[int, float]:
+        """
+        Shortest durations from source without passing through skip,
+        searched only as far as limit and settle_limit nodes.
+        """
+        settled: Dict[int, float] = {}
+        heap = [(0.0, source)]
+        remaining = len(targets)
+        while heap and len(settled) < self.settle_limit:
+            duration, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if duration > limit:
+                break
+            settled[node] = duration
+            if node in targets:
+                remaining -= 1
+                if not remaining:
+                    break
+            for neighbor, (edge_duration, _) in self.out[node].items():
+                if neighbor != skip and neighbor not in settled:
+                    heapq.heappush(heap, (duration + edge_duration, neighbor))
+        return settled
+
+    def _shortcuts(self, node: int) -> List[Tuple[int, int, EdgeCost]]:
+        """
+        Shortcuts needed to keep all shortest paths through node once it is
+        contracted.
+        """
+        shortcuts = []
+        for source, (in_duration, in_length) in self.into[node].items():
+            via = {
+                target: (in_duration + out_duration, in_length + out_length)
+                for target, (out_duration, out_length) in self.out[node].items()
+                if target != source
+            }
+            if not via:
+                continue
+            limit = max(duration for duration, _ in via.values())
+            witnesses = self._witness_durations(source, node, limit, via)
+            for target, cost in via.items():
+                if witnesses.get(target, math.inf) > cost[0]:
+                    shortcuts.append((source, target, cost))
+        return shortcuts
+
+    def _priority(self, node: int, shortcuts: List) -> int:
+        edge_difference = len(shortcuts) - len(self.into[node]) - len(self.out[node])
+        return edge_difference + self.deleted_neighbors[node]
+
+    def contract(self) -> ContractedGraph:
+        n = len(self.out)
+        forward_up: List[List[Tuple[int, EdgeCost]]] = [[] for _ in range(n)]
+        backward_up: List[List[Tuple[int, EdgeCost]]] = [[] for _ in range(n)]
+        heap = [
+            (self._priority(node, self._shortcuts(node)), node) for node in range(n)
+        ]
+        heapq.heapify(heap)
+        done = 0
+        while heap:
+            _, node = heapq.heappop(heap)
+            # Lazy update: contract only if still no worse than the next node
+            shortcuts = self._shortcuts(node)
+            priority = self._priority(node, shortcuts)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, node))
+                continue
+
+            # Every neighbor left is contracted later, so these edges point up
+            forward_up[node] = list(self.out[node].items())
+            backward_up[node] = list(self.into[node].items())
+            for source, target, cost in shortcuts:
+                self._add_edge(source, target, cost)
+            for target in self.out[node]:
+                del self.into[target][node]
+                self.deleted_neighbors[target] += 1
+            for source in self.into[node]:
+                del self.out[source][node]
+                self.deleted_neighbors[source] += 1
+            self.out[node] = {}
+            self.into[node] = {}
+
+            done += 1
+            if done % 10000 == 0:
+                logger.info(f"Contracted {done} of {n} road nodes")
+
+        forward = _csr(forward_up)
+        backward = _csr(backward_up)
+        return ContractedGraph(
+            self.network.latitudes, self.network.longitudes, *forward, *backward
+        )
+
+
+def contract(network: RoadNetwork, settle_limit: int = 500) -> ContractedGraph:
+    """
+    Build a contraction hierarchy over the network, ordering nodes by edge
+    difference plus contracted neighbors with lazy updates. Witness
+    searches give up after settle_limit nodes, which can only add
+    redundant shortcuts, never drop a needed one.
+    """
+    return _Contractor(network, settle_limit).contract()
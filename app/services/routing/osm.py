@@ -0,0 +1,189 @@
+import bz2
+import gzip
+import logging
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from app.utils.geo import haversine_pairs
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+logger = logging.getLogger(__name__)
+
+# Free-flow speed in km/h by highway class, for ways without a maxspeed
+HIGHWAY_SPEEDS_KMH = {
+    "motorway": 100,
+    "motorway_link": 60,
+    "trunk": 80,
+    "trunk_link": 50,
+    "primary": 60,
+    "primary_link": 45,
+    "secondary": 50,
+    "secondary_link": 40,
+    "tertiary": 40,
+    "tertiary_link": 35,
+    "unclassified": 30,
+    "residential": 25,
+    "road": 25,
+    "living_street": 10,
+    "service": 15,
+}
+BLOCKED_ACCESS = {"no", "private"}
+MPH_TO_KMH = 1.609344
+
+
+@dataclass
+class RoadNetwork:
+    """
+    Directed road graph: node coordinates plus one entry per drivable edge.
+    """
+
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    sources: np.ndarray
+    targets: np.ndarray
+    lengths_m: np.ndarray
+    durations_s: np.ndarray
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def largest_component(self) -> "RoadNetwork":
+        """
+        The largest strongly connected part of the network, so that every
+        node can reach every other one.
+        """
+        n = len(self)
+        adjacency = coo_matrix(
+            (np.ones(len(self.sources)), (self.sources, self.targets)), shape=(n, n)
+        )
+        _, labels = connected_components(adjacency, directed=True, connection="strong")
+        keep = labels == np.bincount(labels).argmax()
+        index = np.full(n, -1)
+        index[keep] = np.arange(keep.sum())
+        edges = keep[self.sources] & keep[self.targets]
+        return RoadNetwork(
+            latitudes=self.latitudes[keep],
+            longitudes=self.longitudes[keep],
+            sources=index[self.sources[edges]],
+            targets=index[self.targets[edges]],
+            lengths_m=self.lengths_m[edges],
+            durations_s=self.durations_s[edges],
+        )
+
+
+def parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*(mph)?", value)
+    if not match:
+        return None
+    speed = float(match.group(1))
+    return speed * MPH_TO_KMH if match.group(2) else speed
+
+
+def way_speed_kmh(tags: Dict[str, str]) -> Optional[float]:
+    """
+    Speed to drive a way at, or None if cars cannot use it.
+    """
+    highway = tags.get("highway")
+    if highway not in HIGHWAY_SPEEDS_KMH or tags.get("area") == "yes":
+        return None
+    for access_tag in ("access", "motor_vehicle", "motorcar"):
+        if tags.get(access_tag) in BLOCKED_ACCESS:
+            return None
+    return parse_maxspeed(tags.get("maxspeed")) or HIGHWAY_SPEEDS_KMH[highway]
+
+
+def way_direction(tags: Dict[str, str]) -> int:
+    """
+    1 if the way is one way along its nodes, -1 if one way against them,
+    0 if both ways.
+    """
+    oneway = tags.get("oneway")
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "-1":
+        return -1
+    if oneway == "no":
+        return 0
+    if tags.get("junction") in ("roundabout", "circular"):
+        return 1
+    if tags.get("highway") in ("motorway", "motorway_link"):
+        return 1
+    return 0
+
+
+def _open(path: str):
+    if path.endswith(".pbf"):
+        raise ValueError(
+            "PBF extracts are not supported, convert to OSM XML first, e.g. "
+            "osmium cat extract.osm.pbf -o extract.osm"
+        )
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb")
+
+
+def load_osm(path: str) -> RoadNetwork:
+    """
+    Read the drivable road network out of an OSM XML extract (.osm,
+    optionally .gz or .bz2 compressed), keeping its largest strongly
+    connected component.
+    """
+    coordinates: Dict[int, tuple] = {}
+    ways: List[tuple] = []
+    with _open(path) as f:
+        for _, element in ET.iterparse(f, events=("end",)):
+            if element.tag == "node":
+                coordinates[int(element.get("id"))] = (
+                    float(element.get("lat")),
+                    float(element.get("lon")),
+                )
+            elif element.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                speed = way_speed_kmh(tags)
+                if speed is not None:
+                    refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                    ways.append((refs, speed, way_direction(tags)))
+            else:
+                continue
+            element.clear()
+
+    node_index: Dict[int, int] = {}
+    sources, targets, speeds = [], [], []
+    for refs, speed, direction in ways:
+        refs = [ref for ref in refs if ref in coordinates]
+        for a, b in zip(refs, refs[1:]):
+            a = node_index.setdefault(a, len(node_index))
+            b = node_index.setdefault(b, len(node_index))
+            if direction >= 0:
+                sources.append(a)
+                targets.append(b)
+                speeds.append(speed)
+            if direction <= 0:
+                sources.append(b)
+                targets.append(a)
+                speeds.append(speed)
+
+    points = np.array(
+        [coordinates[osm_id] for osm_id in node_index], dtype=float
+    ).reshape(-1, 2)
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    lengths_m = 1000 * haversine_pairs(points[sources], points[targets])
+    network = RoadNetwork(
+        latitudes=points[:, 0],
+        longitudes=points[:, 1],
+        sources=sources,
+        targets=targets,
+        lengths_m=lengths_m,
+        durations_s=lengths_m / (np.array(speeds, dtype=float) / 3.6),
+    )
+    logger.info(f"Read {len(network)} road nodes and {len(sources)} edges from {path}")
+    return network.largest_component()
@@ -0,0 +1,229 @@
+import heapq
+import logging
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from app.config import settings
+from app.utils.geo import EARTH_RADIUS_KM
+from scipy.spatial import cKDTree
+
+from .contraction import ContractedGraph
+
+logger = logging.getLogger(__name__)
+
+# node: (duration_s, length_m) from the search origin
+SearchSpace = Dict[int, Tuple[float, float]]
+
+
+class Route(NamedTuple):
+    distance_km: float
+    duration_min: float
+
+
+class _Direction(NamedTuple):
+    offsets: List[int]
+    targets: List[int]
+    durations: List[float]
+    lengths: List[float]
+
+
+class RoadRouter:
+    """
+    In-process road distances and durations over a contraction hierarchy
+    built offline from an OSM extract (see python -m app.services.routing).
+    Points are snapped to the nearest road node with a KD-tree; the walk or
+    drive to that node is added in a straight line at access_speed_kmh.
+    Points further than max_snap_meters from any road are not routable.
+    """
+
+    def __init__(self, max_snap_meters: float = 500.0, access_speed_kmh: float = 15.0):
+        self.max_snap_meters = max_snap_meters
+        self.access_speed_mps = access_speed_kmh / 3.6
+        self.graph: Optional[ContractedGraph] = None
+        self._tree: Optional[cKDTree] = None
+
+    @property
+    def available(self) -> bool:
+        return self.graph is not None
+
+    def load(self, path: str):
+        self.use(ContractedGraph.load(path))
+        logger.info(f"Loaded road graph of {len(self.graph)} nodes from {path}")
+
+    def use(self, graph: ContractedGraph):
+        # Plain lists index several times faster than numpy scalars in the
+        # search loops
+        self._forward = _Direction(
+            graph.forward_offsets.tolist(),
+            graph.forward_targets.tolist(),
+            graph.forward_durations.tolist(),
+            graph.forward_lengths.tolist(),
+        )
+        self._backward = _Direction(
+            graph.backward_offsets.tolist(),
+            graph.backward_targets.tolist(),
+            graph.backward_durations.tolist(),
+            graph.backward_lengths.tolist(),
+        )
+        self._cos_latitude = math.cos(math.radians(float(np.mean(graph.latitudes))))
+        self._tree = cKDTree(self._project(graph.latitudes, graph.longitudes))
+        self.graph = graph
+
+    def _project(self, latitudes, longitudes) -> np.ndarray:
+        # Equirectangular meters, accurate enough for snapping within a city
+        scale = 1000 * EARTH_RADIUS_KM
+        return np.column_stack(
+            [
+                np.radians(np.asarray(longitudes, dtype=float))
+                * scale
+                * self._cos_latitude,
+                np.radians(np.asarray(latitudes, dtype=float)) * scale,
+            ]
+        )
+
+    def snap(self, points: Sequence[Tuple[float, float]]) -> List[Optional[tuple]]:
+        """
+        (node, distance_m) of the nearest road node to each (latitude,
+        longitude) point, or None if it is too far from any road.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        distances, nodes = self._tree.query(self._project(points[:, 0], points[:, 1]))
+        return [
+            (int(node), float(distance)) if distance <= self.max_snap_meters else None
+            for node, distance in zip(nodes, distances)
+        ]
+
+    def _search(self, start: int, direction: _Direction) -> SearchSpace:
+        """
+        Every node reachable from start along upward edges, with its fastest
+        duration and that route's length.
+        """
+        offsets, targets, durations, lengths = direction
+        settled: SearchSpace = {}
+        heap = [(0.0, 0.0, start)]
+        while heap:
+            duration, length, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = (duration, length)
+            for i in range(offsets[node], offsets[node + 1]):
+                target = targets[i]
+                if target not in settled:
+                    heapq.heappush(
+                        heap, (duration + durations[i], length + lengths[i], target)
+                    )
+        return settled
+
+    def _meet(
+        self, other: SearchSpace, start: int, direction: _Direction
+    ) -> Optional[Tuple[float, float]]:
+        """
+        Search upward from start until it cannot improve on the best meeting
+        point with a finished search from the other end.
+        """
+        offsets, targets, durations, lengths = direction
+        best = (math.inf, 0.0)
+        settled = set()
+        heap = [(0.0, 0.0, start)]
+        while heap:
+            duration, length, node = heapq.heappop(heap)
+            if duration >= best[0]:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            meeting = other.get(node)
+            if meeting is not None and duration + meeting[0] < best[0]:
+                best = (duration + meeting[0], length + meeting[1])
+            for i in range(offsets[node], offsets[node + 1]):
+                target = targets[i]
+                if target not in settled:
+                    heapq.heappush(
+                        heap, (duration + durations[i], length + lengths[i], target)
+                    )
+        return best if best[0] < math.inf else None
+
+    def _route(self, origin, target, best) -> Optional[Route]:
+        if best is None:
+            return None
+        access_m = origin[1] + target[1]
+        return Route(
+            distance_km=(best[1] + access_m) / 1000,
+            duration_min=(best[0] + access_m / self.access_speed_mps) / 60,
+        )
+
+    def route(
+        self,
+        origin_lat: float,
+        origin_lng: float,
+        target_lat: float,
+        target_lng: float,
+    ) -> Optional[Route]:
+        """
+        Fastest road route between two points, or None if either point is
+        off the road network.
+        """
+        if not self.available:
+            return None
+        origin, target = self.snap([(origin_lat, origin_lng), (target_lat, target_lng)])
+        if origin is None or target is None:
+            return None
+        forward = self._search(origin[0], self._forward)
+        return self._route(
+            origin, target, self._meet(forward, target[0], self._backward)
+        )
+
+    def one_to_many(
+        self, latitude: float, longitude: float, targets: Sequence[Tuple[float, float]]
+    ) -> List[Optional[Route]]:
+        """
+        Fastest routes from one point to each of the targets: one full
+        upward search from the origin, then a pruned one per target.
+        """
+        if not self.available or not len(targets):
+            return [None] * len(targets)
+        origin, *snapped = self.snap([(latitude, longitude), *targets])
+        if origin is None:
+            return [None] * len(targets)
+        forward = self._search(origin[0], self._forward)
+        return [
+            (
+                self._route(
+                    origin, target, self._meet(forward, target[0], self._backward)
+                )
+                if target is not None
+                else None
+            )
+            for target in snapped
+        ]
+
+    def many_to_one(
+        self, origins: Sequence[Tuple[float, float]], latitude: float, longitude: float
+    ) -> List[Optional[Route]]:
+        """
+        Fastest routes from each of the origins to one point, e.g. from
+        candidate drivers to a pickup.
+        """
+        if not self.available or not len(origins):
+            return [None] * len(origins)
+        target, *snapped = self.snap([(latitude, longitude), *origins])
+        if target is None:
+            return [None] * len(origins)
+        backward = self._search(target[0], self._backward)
+        return [
+            (
+                self._route(
+                    origin, target, self._meet(backward, origin[0], self._forward)
+                )
+                if origin is not None
+                else None
+            )
+            for origin in snapped
+        ]
+
+
+road_router = RoadRouter(
+    max_snap_meters=settings.ROUTING_MAX_SNAP_METERS,
+    access_speed_kmh=settings.ROUTING_ACCESS_SPEED_KMH,
+)
@@ -1,4 +1,5 @@
 from .driver_tracking import driver_tracker
+from .h3_index import driver_index
 from .location_update import update_driver_locations
 
-__all__ = ["update_driver_locations", "driver_tracker"]
+__all__ = ["update_driver_locations", "driver_tracker", "driver_index"]
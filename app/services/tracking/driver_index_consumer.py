@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from app.config import settings
+from app.services.messaging.kafka_service import (KAFKA_TOPIC_DRIVER_LOCATIONS,
+                                                  kafka_service)
+
+from .h3_index import driver_index
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_timestamp(value) -> float:
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+async def handle_driver_index_update(message):
+    """
+    Apply a driver_locations event to the in-process driver index.
+    """
+    location_data = message.value
+    try:
+        driver_index.upsert(
+            str(location_data["driver_id"]),
+            float(location_data["latitude"]),
+            float(location_data["longitude"]),
+            location_data.get("vehicle_type", "unknown"),
+            # Staleness is judged by server receive time, not the device clock
+            timestamp=_parse_timestamp(location_data.get("received_at")),
+            h3_index=location_data.get("h3_index"),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Skipping malformed driver location event: {e}")
+
+
+async def sweep_stale_drivers():
+    """
+    Periodically drop drivers that stopped reporting their location.
+    """
+    while True:
+        await asyncio.sleep(settings.DRIVER_INDEX_SWEEP_INTERVAL_SECONDS)
+        evicted = driver_index.evict_stale(settings.DRIVER_INDEX_STALE_SECONDS)
+        if evicted:
+            logger.info(f"Evicted {evicted} stale drivers from the driver index")
+
+
+async def start_driver_index_consumer():
+    asyncio.create_task(sweep_stale_drivers())
+    await kafka_service.consume_broadcast(
+        KAFKA_TOPIC_DRIVER_LOCATIONS, handle_driver_index_update
+    )
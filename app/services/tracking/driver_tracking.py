@@ -1,41 +1,138 @@
 import asyncio
-from typing import Dict, List
+import logging
+from typing import Dict, List, Optional
+
+from app.config import settings
 
 from .location_update import update_driver_locations
 
+logger = logging.getLogger(__name__)
+
 
 class DriverTracker:
-    def __init__(self, batch_size: int = 10, batch_interval: int = 5):
-        self.location_update_queue: Dict[str, Dict] = {}
+    """
+    Shared ingestion path for driver location updates. A single background
+    flusher publishes pending updates once batch_size are pending or
+    linger_ms has passed since the first pending update, whichever comes
+    first, in publishes of at most batch_size updates. Every point is kept,
+    so history sees bursts in full; the Redis latest-position writer keeps
+    only the newest point per driver itself. Callers wait when max_pending
+    updates are already queued.
+    """
+
+    def __init__(
+        self, batch_size: int = 200, linger_ms: int = 100, max_pending: int = 50000
+    ):
         self.batch_size = batch_size
-        self.batch_interval = batch_interval
-        self.loop = asyncio.get_event_loop()
-        self.loop.create_task(self.process_batch_updates())
+        self.linger_seconds = linger_ms / 1000
+        self.max_pending = max_pending
+        self.location_update_queue: List[Dict] = []
+        self._first_pending_at: Optional[float] = None
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
 
-    def add_location_update(
-        self, driver_id: str, latitude: float, longitude: float, vehicle_type: str
+    async def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self.process_batch_updates())
+
+    async def stop(self):
+        """
+        Let the flusher publish everything pending, including a flush in
+        progress, before it exits.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._has_pending.set()
+            self._batch_full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def add_location_update(
+        self,
+        driver_id: str,
+        latitude: float,
+        longitude: float,
+        vehicle_type: str,
+        **extra,
     ):
-        self.location_update_queue[driver_id] = {
-            "driver_id": driver_id,
-            "latitude": latitude,
-            "longitude": longitude,
-            "vehicle_type": vehicle_type,
-        }
+        while len(self.location_update_queue) >= self.max_pending:
+            self._drained.clear()
+            self._batch_full.set()
+            await self._drained.wait()
+
+        if not self.location_update_queue:
+            self._first_pending_at = asyncio.get_running_loop().time()
+        self.location_update_queue.append(
+            {
+                "driver_id": driver_id,
+                "latitude": latitude,
+                "longitude": longitude,
+                "vehicle_type": vehicle_type,
+                **extra,
+            }
+        )
+        self._has_pending.set()
         if len(self.location_update_queue) >= self.batch_size:
-            self.loop.create_task(self.process_batch_updates())
+            self._batch_full.set()
 
-    def get_batch_updates(self, batch_size: int) -> List[Dict]:
-        updates = list(self.location_update_queue.values())[:batch_size]
-        for update in updates:
-            self.location_update_queue.pop(update["driver_id"], None)
+    def get_batch_updates(self) -> List[Dict]:
+        """
+        Take up to batch_size of the oldest pending updates.
+        """
+        updates = self.location_update_queue[: self.batch_size]
+        del self.location_update_queue[: self.batch_size]
+        if not self.location_update_queue:
+            self._first_pending_at = None
+            self._has_pending.clear()
+            self._batch_full.clear()
+        elif len(self.location_update_queue) < self.batch_size:
+            self._batch_full.clear()
+        if len(self.location_update_queue) < self.max_pending:
+            self._drained.set()
         return updates
 
+    async def flush(self):
+        """
+        Publish the updates pending when called, batch_size at a time.
+        """
+        remaining = len(self.location_update_queue)
+        while remaining > 0:
+            updates = self.get_batch_updates()
+            remaining -= len(updates)
+            await update_driver_locations(updates)
+
     async def process_batch_updates(self):
-        while True:
-            updates = self.get_batch_updates(self.batch_size)
-            if updates:
-                await update_driver_locations(updates)
-            await asyncio.sleep(self.batch_interval)
+        loop = asyncio.get_running_loop()
+        while not (self._stopping and not self.location_update_queue):
+            await self._has_pending.wait()
+            if not self.location_update_queue:
+                self._has_pending.clear()
+                continue
+            deadline = self._first_pending_at + self.linger_seconds
+            timeout = deadline - loop.time()
+            if (
+                not self._stopping
+                and timeout > 0
+                and len(self.location_update_queue) < self.batch_size
+            ):
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error publishing driver location batch: {e}")
 
 
-driver_tracker = DriverTracker()
+driver_tracker = DriverTracker(
+    batch_size=settings.TRACKER_BATCH_SIZE,
+    linger_ms=settings.TRACKER_LINGER_MS,
+    max_pending=settings.TRACKER_MAX_PENDING,
+)
@@ -0,0 +1,311 @@
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import h3
+from app.config import settings
+from app.utils.geo import haversine_km
+
+H3_RESOLUTION = 9
+
+# Coarser levels whose per-cell driver counts let a search skip empty areas
+# before descending to H3_RESOLUTION.
+COARSE_RESOLUTIONS = (7, 8)
+
+
+def ring_distance_km(resolution: int) -> float:
+    """
+    Centre-to-centre distance between neighbouring cells, used to turn a
+    search radius into a k-ring size.
+    """
+    return h3.edge_length(resolution, unit="km") * math.sqrt(3)
+
+
+H3_RING_DISTANCE_KM = ring_distance_km(H3_RESOLUTION)
+
+
+@dataclass
+class DriverPosition:
+    driver_id: str
+    latitude: float
+    longitude: float
+    vehicle_type: str
+    h3_index: str
+    timestamp: float
+
+
+class _DriverShard:
+    __slots__ = ("lock", "positions")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions: Dict[str, DriverPosition] = {}
+
+
+class _CellShard:
+    __slots__ = ("lock", "cells", "typed_cells", "parent_counts")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cells: Dict[str, Set[str]] = {}
+        self.typed_cells: Dict[Tuple[str, str], Set[str]] = {}
+        # (coarse cell, vehicle type or None for all types) -> driver count
+        self.parent_counts: Dict[Tuple[str, Optional[str]], int] = {}
+
+
+class ShardedH3Index:
+    """
+    In-memory index of live driver positions keyed by H3 cell.
+
+    Driver positions and cell memberships live in separate lock shards so
+    concurrent writers only contend when they touch the same shard. A cell
+    move always takes the driver's shard lock first and the cell shard locks
+    inside it; readers never hold two locks at once, so there is no ordering
+    that can deadlock.
+
+    Driver counts are also kept for the parent cells at COARSE_RESOLUTIONS,
+    so a radius search walks a small ring of coarse cells and only descends
+    into the ones that hold drivers.
+    """
+
+    def __init__(self, num_shards: int = 64, resolution: int = H3_RESOLUTION):
+        self.resolution = resolution
+        self.num_shards = num_shards
+        self._driver_shards = [_DriverShard() for _ in range(num_shards)]
+        self._cell_shards = [_CellShard() for _ in range(num_shards)]
+
+    def _driver_shard(self, driver_id: str) -> _DriverShard:
+        return self._driver_shards[hash(driver_id) % self.num_shards]
+
+    def _cell_shard(self, h3_index: str) -> _CellShard:
+        return self._cell_shards[hash(h3_index) % self.num_shards]
+
+    def _adjust_parent_counts(self, position: DriverPosition, delta: int):
+        for resolution in COARSE_RESOLUTIONS:
+            if resolution >= self.resolution:
+                continue
+            parent = h3.h3_to_parent(position.h3_index, resolution)
+            shard = self._cell_shard(parent)
+            with shard.lock:
+                for key in ((parent, None), (parent, position.vehicle_type)):
+                    count = shard.parent_counts.get(key, 0) + delta
+                    if count > 0:
+                        shard.parent_counts[key] = count
+                    else:
+                        shard.parent_counts.pop(key, None)
+
+    def _add_to_cell(self, position: DriverPosition):
+        shard = self._cell_shard(position.h3_index)
+        with shard.lock:
+            shard.cells.setdefault(position.h3_index, set()).add(position.driver_id)
+            shard.typed_cells.setdefault(
+                (position.h3_index, position.vehicle_type), set()
+            ).add(position.driver_id)
+        self._adjust_parent_counts(position, 1)
+
+    def _remove_from_cell(self, position: DriverPosition):
+        shard = self._cell_shard(position.h3_index)
+        with shard.lock:
+            drivers = shard.cells.get(position.h3_index)
+            if drivers is not None:
+                drivers.discard(position.driver_id)
+                if not drivers:
+                    del shard.cells[position.h3_index]
+            typed_key = (position.h3_index, position.vehicle_type)
+            typed_drivers = shard.typed_cells.get(typed_key)
+            if typed_drivers is not None:
+                typed_drivers.discard(position.driver_id)
+                if not typed_drivers:
+                    del shard.typed_cells[typed_key]
+        self._adjust_parent_counts(position, -1)
+
+    def upsert(
+        self,
+        driver_id: str,
+        latitude: float,
+        longitude: float,
+        vehicle_type: str,
+        timestamp: Optional[float] = None,
+        h3_index: Optional[str] = None,
+    ) -> bool:
+        """
+        Record a driver's latest position. Returns True if the driver entered
+        a new cell. Updates older than the stored position are ignored.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if h3_index is None:
+            h3_index = h3.geo_to_h3(latitude, longitude, self.resolution)
+
+        position = DriverPosition(
+            driver_id=driver_id,
+            latitude=latitude,
+            longitude=longitude,
+            vehicle_type=vehicle_type,
+            h3_index=h3_index,
+            timestamp=timestamp,
+        )
+        shard = self._driver_shard(driver_id)
+        with shard.lock:
+            previous = shard.positions.get(driver_id)
+            if previous is not None and previous.timestamp > timestamp:
+                return False
+            shard.positions[driver_id] = position
+            moved = previous is None or (
+                previous.h3_index != h3_index or previous.vehicle_type != vehicle_type
+            )
+            if moved:
+                if previous is not None:
+                    self._remove_from_cell(previous)
+                self._add_to_cell(position)
+        return moved
+
+    def remove(self, driver_id: str) -> Optional[DriverPosition]:
+        """
+        Drop a driver from the index, returning its last known position.
+        """
+        shard = self._driver_shard(driver_id)
+        with shard.lock:
+            previous = shard.positions.pop(driver_id, None)
+            if previous is not None:
+                self._remove_from_cell(previous)
+        return previous
+
+    def get(self, driver_id: str) -> Optional[DriverPosition]:
+        shard = self._driver_shard(driver_id)
+        with shard.lock:
+            return shard.positions.get(driver_id)
+
+    def drivers_in_cell(
+        self, h3_index: str, vehicle_type: Optional[str] = None
+    ) -> Set[str]:
+        shard = self._cell_shard(h3_index)
+        with shard.lock:
+            if vehicle_type is None:
+                drivers = shard.cells.get(h3_index)
+            else:
+                drivers = shard.typed_cells.get((h3_index, vehicle_type))
+            return set(drivers) if drivers else set()
+
+    def drivers_in_cells(
+        self, cells: Iterable[str], vehicle_type: Optional[str] = None
+    ) -> List[DriverPosition]:
+        """
+        Return the current positions of all drivers in the given cells.
+        """
+        positions = []
+        for h3_index in cells:
+            for driver_id in self.drivers_in_cell(h3_index, vehicle_type):
+                position = self.get(driver_id)
+                # A concurrent move may have relocated the driver since the
+                # cell set was copied; only report drivers still in the cell.
+                if position is not None and position.h3_index == h3_index:
+                    positions.append(position)
+        return positions
+
+    def count_in_cell(self, h3_index: str, vehicle_type: Optional[str] = None) -> int:
+        """
+        Number of drivers in a cell at the index resolution or at one of the
+        COARSE_RESOLUTIONS.
+        """
+        if h3.h3_get_resolution(h3_index) == self.resolution:
+            return len(self.drivers_in_cell(h3_index, vehicle_type))
+        shard = self._cell_shard(h3_index)
+        with shard.lock:
+            return shard.parent_counts.get((h3_index, vehicle_type), 0)
+
+    def _populated_cells(
+        self,
+        h3_index: str,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        vehicle_type: Optional[str],
+    ) -> List[str]:
+        """
+        Depth-first walk from a coarse cell down to the index resolution,
+        skipping empty cells and cells entirely outside the search radius.
+        """
+        resolution = h3.h3_get_resolution(h3_index)
+        if not self.count_in_cell(h3_index, vehicle_type):
+            return []
+        # The cell's circumradius is about one edge length
+        cell_lat, cell_lng = h3.h3_to_geo(h3_index)
+        if haversine_km(
+            latitude, longitude, cell_lat, cell_lng
+        ) > radius_km + h3.edge_length(resolution, unit="km"):
+            return []
+        if resolution == self.resolution:
+            return [h3_index]
+        next_resolution = min(
+            [r for r in COARSE_RESOLUTIONS if r > resolution] + [self.resolution]
+        )
+        cells = []
+        for child in h3.h3_to_children(h3_index, next_resolution):
+            cells.extend(
+                self._populated_cells(
+                    child, latitude, longitude, radius_km, vehicle_type
+                )
+            )
+        return cells
+
+    def search(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        vehicle_type: Optional[str] = None,
+    ) -> List[Tuple[DriverPosition, float]]:
+        """
+        Return (position, distance_km) for drivers within radius_km of the
+        point, nearest first.
+        """
+        coarse = [r for r in COARSE_RESOLUTIONS if r < self.resolution]
+        start_resolution = min(coarse) if coarse else self.resolution
+        origin = h3.geo_to_h3(latitude, longitude, start_resolution)
+        k = math.ceil(radius_km / ring_distance_km(start_resolution)) + 1
+
+        cells = []
+        for h3_index in h3.k_ring(origin, k):
+            cells.extend(
+                self._populated_cells(
+                    h3_index, latitude, longitude, radius_km, vehicle_type
+                )
+            )
+
+        results = []
+        for position in self.drivers_in_cells(cells, vehicle_type):
+            distance = haversine_km(
+                latitude, longitude, position.latitude, position.longitude
+            )
+            if distance <= radius_km:
+                results.append((position, distance))
+        results.sort(key=lambda result: result[1])
+        return results
+
+    def evict_stale(self, max_age_seconds: float) -> int:
+        """
+        Remove drivers that have not reported within max_age_seconds.
+        """
+        cutoff = time.time() - max_age_seconds
+        evicted = 0
+        for shard in self._driver_shards:
+            with shard.lock:
+                stale = [
+                    position
+                    for position in shard.positions.values()
+                    if position.timestamp < cutoff
+                ]
+                for position in stale:
+                    del shard.positions[position.driver_id]
+                    self._remove_from_cell(position)
+            evicted += len(stale)
+        return evicted
+
+    def __len__(self) -> int:
+        return sum(len(shard.positions) for shard in self._driver_shards)
+
+
+driver_index = ShardedH3Index(num_shards=settings.DRIVER_INDEX_SHARDS)
@@ -1,34 +1,131 @@
 import asyncio
 import json
+import logging
+import time
+from typing import Any, Dict, List
 
-from app.services.caching.cache import get_redis_client
+import h3
+from app.config import settings
+from app.services.caching.cache import REDIS_TRANSIENT_ERRORS, get_redis_client
+from app.services.communication.pubsub_multiplexer import \
+    DRIVER_LOCATIONS_CHANNEL
 from app.services.messaging.kafka_service import (KAFKA_TOPIC_DRIVER_LOCATIONS,
+                                                  TRANSIENT_ERRORS,
                                                   kafka_service)
 
+from .h3_index import H3_RESOLUTION
+from .location_scripts import (DRIVER_CELLS_KEY, DRIVER_GEO_TYPES_KEY,
+                               DRIVER_LAST_SEEN_KEY,
+                               SWEEP_STALE_DRIVERS_SCRIPT, get_script)
+from .proximity import h3_set_backend, proximity_backend
 
-async def handle_location_update(location_data):
-    redis = await get_redis_client()
+logger = logging.getLogger(__name__)
+
+LOCATION_TTL_SECONDS = 300  # 5 minutes
+
+
+async def queue_location_update(pipe, location_data: Dict[str, Any]):
+    """
+    Queue the Redis writes for one location update on a pipeline.
+    """
     driver_id = location_data["driver_id"]
-    h3_index = location_data["h3_index"]
     vehicle_type = location_data["vehicle_type"]
+    h3_index = location_data.get("h3_index") or h3.geo_to_h3(
+        location_data["latitude"], location_data["longitude"], H3_RESOLUTION
+    )
 
     # Update driver's location
-    location_key = f"driver:location:{driver_id}"
-    await redis.set(location_key, json.dumps(location_data))
-    await redis.expire(location_key, 300)  # 5 minutes
+    pipe.set(
+        f"driver:location:{driver_id}",
+        json.dumps(location_data),
+        ex=LOCATION_TTL_SECONDS,
+    )
+
+    # Move the driver between H3 index sets, plus the configured proximity
+    # index if different
+    # Last-seen is judged by server receive time, never the device clock
+    timestamp = location_data.get("received_at")
+    if not isinstance(timestamp, (int, float)):
+        timestamp = time.time()
+    for backend in {h3_set_backend, proximity_backend}:
+        await backend.queue_update(
+            pipe,
+            driver_id,
+            location_data["latitude"],
+            location_data["longitude"],
+            h3_index,
+            vehicle_type,
+            timestamp,
+        )
+
+
+async def handle_location_update(location_data):
+    redis = await get_redis_client()
+    pipe = redis.pipeline(transaction=False)
+    await queue_location_update(pipe, location_data)
+    pipe.publish(DRIVER_LOCATIONS_CHANNEL, json.dumps(location_data))
+    await pipe.execute()
 
-    # Update H3 index sets
-    await redis.sadd(f"drivers:{h3_index}:{vehicle_type}", driver_id)
-    await redis.expire(f"drivers:{h3_index}:{vehicle_type}", 300)
 
-    await redis.set(f"driver:h3:{driver_id}", h3_index)
-    await redis.expire(f"driver:h3:{driver_id}", 300)
+async def handle_location_batch(messages: List):
+    """
+    Write a batch of location updates in a single pipelined round trip.
+    Only the newest update per driver in the batch is written, and those
+    are published together as one list message.
+    """
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for message in messages:
+        location_data = message.value
+        latest[location_data["driver_id"]] = location_data
+    if not latest:
+        return
+
+    redis = await get_redis_client()
+    pipe = redis.pipeline(transaction=False)
+    for location_data in latest.values():
+        await queue_location_update(pipe, location_data)
+    pipe.publish(DRIVER_LOCATIONS_CHANNEL, json.dumps(list(latest.values())))
+    await pipe.execute()
+
+
+async def sweep_stale_driver_locations():
+    """
+    Periodically evict drivers that stopped reporting from the candidate
+    sets, in bulk, using the drivers:last_seen sorted set.
+    """
+    redis = await get_redis_client()
+    sweep = get_script(redis, SWEEP_STALE_DRIVERS_SCRIPT)
+    while True:
+        await asyncio.sleep(settings.LOCATION_SWEEP_INTERVAL_SECONDS)
+        cutoff = time.time() - settings.LOCATION_STALE_SECONDS
+        try:
+            evicted = settings.LOCATION_SWEEP_BATCH_SIZE
+            while evicted == settings.LOCATION_SWEEP_BATCH_SIZE:
+                evicted = await sweep(
+                    keys=[DRIVER_LAST_SEEN_KEY, DRIVER_CELLS_KEY, DRIVER_GEO_TYPES_KEY],
+                    args=[cutoff, settings.LOCATION_SWEEP_BATCH_SIZE],
+                    client=redis,
+                )
+                if evicted:
+                    logger.info(f"Evicted {evicted} stale drivers from H3 sets")
+        except Exception as e:
+            logger.error(f"Error sweeping stale driver locations: {e}")
 
 
 async def start_location_consumer():
-    await kafka_service.consume_messages(
-        KAFKA_TOPIC_DRIVER_LOCATIONS, handle_location_update
-    )
+    asyncio.create_task(sweep_stale_driver_locations())
+    if settings.LOCATION_CONSUMER_BATCH_MODE:
+        await kafka_service.consume_batches(
+            KAFKA_TOPIC_DRIVER_LOCATIONS,
+            handle_location_batch,
+            max_records=settings.LOCATION_CONSUMER_BATCH_SIZE,
+            linger_ms=settings.LOCATION_CONSUMER_LINGER_MS,
+            transient_errors=TRANSIENT_ERRORS + REDIS_TRANSIENT_ERRORS,
+        )
+    else:
+        await kafka_service.consume_messages(
+            KAFKA_TOPIC_DRIVER_LOCATIONS, handle_location_update
+        )
 
 
 # Run this function in a separate process or thread
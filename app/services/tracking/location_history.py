@@ -0,0 +1,437 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+from aiokafka.structs import TopicPartition
+from app.config import settings
+from app.models import (Booking, BookingStatusEnum, BookingStatusHistory,
+                        LocationTraceChunk)
+from app.services.messaging.kafka_service import (KAFKA_TOPIC_DRIVER_LOCATIONS,
+                                                  kafka_service)
+from db.database import async_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .wire_format import MILLISECONDS_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# 1e-5 degrees is about 1.1 m at the equator
+COORDINATE_SCALE = 100000
+
+# (latitude * COORDINATE_SCALE, longitude * COORDINATE_SCALE, unix seconds)
+QuantizedPoint = Tuple[int, int, int]
+TracePoint = Tuple[float, float, int]
+
+
+def quantize(latitude: float, longitude: float, timestamp: float) -> QuantizedPoint:
+    timestamp = float(timestamp)
+    if timestamp > MILLISECONDS_THRESHOLD:
+        timestamp /= 1000
+    if not 0 < timestamp < MILLISECONDS_THRESHOLD:
+        raise ValueError(f"Timestamp {timestamp} is out of range")
+    return (
+        round(latitude * COORDINATE_SCALE),
+        round(longitude * COORDINATE_SCALE),
+        int(timestamp),
+    )
+
+
+def to_unix_seconds(value: datetime) -> float:
+    # Naive datetimes in this codebase are UTC (datetime.utcnow)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _write_varint(out: bytearray, value: int):
+    # Zigzag so small negative deltas stay small
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), offset
+
+
+def encode_points(points: List[QuantizedPoint]) -> bytes:
+    """
+    Encode quantized points as zigzag varint deltas from the previous point.
+    A driver moving normally costs 3 to 6 bytes per point.
+    """
+    out = bytearray()
+    previous = (0, 0, 0)
+    for point in points:
+        for value, last in zip(point, previous):
+            _write_varint(out, value - last)
+        previous = point
+    return bytes(out)
+
+
+def decode_points(data: bytes) -> List[TracePoint]:
+    points = []
+    latitude = longitude = timestamp = 0
+    offset = 0
+    while offset < len(data):
+        delta, offset = _read_varint(data, offset)
+        latitude += delta
+        delta, offset = _read_varint(data, offset)
+        longitude += delta
+        delta, offset = _read_varint(data, offset)
+        timestamp += delta
+        points.append(
+            (latitude / COORDINATE_SCALE, longitude / COORDINATE_SCALE, timestamp)
+        )
+    return points
+
+
+def downsample(
+    points: List[TracePoint],
+    min_interval_seconds: Optional[int] = None,
+    max_points: Optional[int] = None,
+) -> List[TracePoint]:
+    """
+    Thin a trace by minimum spacing in time, then by stride to at most
+    max_points. The first and last points are always kept.
+    """
+    if min_interval_seconds and points:
+        thinned = [points[0]]
+        for point in points[1:]:
+            if point[2] - thinned[-1][2] >= min_interval_seconds:
+                thinned.append(point)
+        if thinned[-1] is not points[-1]:
+            thinned.append(points[-1])
+        points = thinned
+    if max_points and len(points) > max_points:
+        if max_points == 1:
+            return [points[-1]]
+        stride = (len(points) - 1) / (max_points - 1)
+        points = [points[round(i * stride)] for i in range(max_points)]
+    return points
+
+
+@dataclass(eq=False)
+class HistoryChunk:
+    driver_id: int
+    points: List[QuantizedPoint]
+    # Source (e.g. a Kafka partition) -> lowest offset among the points
+    offsets: Dict[Hashable, int]
+    attempts: int = 0
+    retry_at: float = 0.0
+
+
+class LocationHistoryBuffer:
+    """
+    Per-driver ring buffers of quantized points. A driver's buffer is cut
+    into a chunk once it holds chunk_points points or its oldest point is
+    chunk_seconds old. Buffers are bounded, so if the database stalls the
+    oldest points are dropped rather than growing memory.
+
+    Points may carry the source and offset they were read from, and
+    committable_offsets only moves past a point once its chunk is saved.
+    Chunks that fail to save are retried every retry_seconds, up to
+    max_attempts times.
+    """
+
+    def __init__(
+        self,
+        buffer_points: int = 720,
+        chunk_points: int = 240,
+        chunk_seconds: int = 300,
+        retry_seconds: int = 60,
+        max_attempts: int = 10,
+    ):
+        self.buffer_points = buffer_points
+        self.chunk_points = chunk_points
+        self.chunk_seconds = chunk_seconds
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self._buffers: Dict[int, Deque[QuantizedPoint]] = {}
+        self._offsets: Dict[int, Dict[Hashable, int]] = {}
+        self._consumed: Dict[Hashable, int] = {}
+        self._unsaved: List[HistoryChunk] = []
+        self._failed: List[HistoryChunk] = []
+
+    def append(
+        self,
+        driver_id: int,
+        latitude: float,
+        longitude: float,
+        timestamp,
+        source: Hashable = None,
+        offset: Optional[int] = None,
+    ):
+        if offset is not None:
+            self._consumed[source] = offset + 1
+        point = quantize(latitude, longitude, timestamp)
+        buffer = self._buffers.get(driver_id)
+        if buffer is None:
+            buffer = self._buffers[driver_id] = deque(maxlen=self.buffer_points)
+        if buffer and point == buffer[-1]:
+            return
+        buffer.append(point)
+        if offset is not None:
+            offsets = self._offsets.setdefault(driver_id, {})
+            offsets.setdefault(source, offset)
+
+    def drain_ready(
+        self, now: Optional[float] = None, force: bool = False
+    ) -> List[HistoryChunk]:
+        """
+        Remove and return a chunk for every buffer due a flush, plus failed
+        chunks due a retry. Pass the chunks to saved or failed afterwards.
+        """
+        if now is None:
+            now = time.time()
+        ready = []
+        for driver_id, buffer in list(self._buffers.items()):
+            if not buffer:
+                del self._buffers[driver_id]
+                continue
+            if (
+                force
+                or len(buffer) >= self.chunk_points
+                or now - buffer[0][2] >= self.chunk_seconds
+            ):
+                points = sorted(buffer, key=lambda point: point[2])
+                buffer.clear()
+                ready.append(
+                    HistoryChunk(driver_id, points, self._offsets.pop(driver_id, {}))
+                )
+        retry = [chunk for chunk in self._failed if force or chunk.retry_at <= now]
+        self._failed = [chunk for chunk in self._failed if chunk not in retry]
+        ready.extend(retry)
+        self._unsaved.extend(ready)
+        return ready
+
+    def saved(self, chunks: List[HistoryChunk]):
+        self._unsaved = [chunk for chunk in self._unsaved if chunk not in chunks]
+
+    def failed(self, chunks: List[HistoryChunk], now: Optional[float] = None):
+        """
+        Schedule chunks that could not be saved for a retry, dropping those
+        that have used up their attempts.
+        """
+        if now is None:
+            now = time.time()
+        self.saved(chunks)
+        for chunk in chunks:
+            chunk.attempts += 1
+            if chunk.attempts >= self.max_attempts:
+                logger.error(
+                    f"Dropping {len(chunk.points)} history points of driver "
+                    f"{chunk.driver_id} after {chunk.attempts} failed saves"
+                )
+                continue
+            chunk.retry_at = now + self.retry_seconds
+            self._failed.append(chunk)
+
+    def committable_offsets(self) -> Dict[Hashable, int]:
+        """
+        Per source, the offset after the last point appended, held back to
+        the oldest point that is buffered or in a chunk not yet saved.
+        """
+        offsets = dict(self._consumed)
+        pending = [
+            *self._offsets.values(),
+            *(chunk.offsets for chunk in self._unsaved),
+            *(chunk.offsets for chunk in self._failed),
+        ]
+        for chunk_offsets in pending:
+            for source, offset in chunk_offsets.items():
+                if offset < offsets.get(source, offset + 1):
+                    offsets[source] = offset
+        return offsets
+
+
+async def save_chunks(chunks: List[HistoryChunk]):
+    if not chunks:
+        return
+    async with async_session() as db:
+        for chunk in chunks:
+            db.add(
+                LocationTraceChunk(
+                    driver_id=chunk.driver_id,
+                    start_time=datetime.utcfromtimestamp(chunk.points[0][2]),
+                    end_time=datetime.utcfromtimestamp(chunk.points[-1][2]),
+                    point_count=len(chunk.points),
+                    points=encode_points(chunk.points),
+                )
+            )
+        await db.commit()
+
+
+async def persist_chunks(buffer: LocationHistoryBuffer, chunks: List[HistoryChunk]):
+    """
+    Save chunks in one transaction. If that fails, save them one at a time
+    so one bad chunk cannot hold back the others, and leave the ones that
+    still fail to the buffer's retries.
+    """
+    if not chunks:
+        return
+    try:
+        await save_chunks(chunks)
+        buffer.saved(chunks)
+        return
+    except Exception as e:
+        logger.error(f"Error persisting {len(chunks)} location history chunks: {e}")
+    failed = []
+    for chunk in chunks:
+        try:
+            await save_chunks([chunk])
+        except Exception as e:
+            logger.warning(
+                f"Error persisting location history of driver {chunk.driver_id}: {e}"
+            )
+            failed.append(chunk)
+    buffer.saved([chunk for chunk in chunks if chunk not in failed])
+    buffer.failed(failed)
+
+
+async def get_location_trace(
+    db: AsyncSession,
+    driver_id: int,
+    start_time: datetime,
+    end_time: datetime,
+    min_interval_seconds: Optional[int] = None,
+    max_points: Optional[int] = None,
+) -> List[TracePoint]:
+    """
+    Return a driver's (latitude, longitude, unix seconds) points between
+    start_time and end_time, oldest first.
+    """
+    result = await db.execute(
+        select(LocationTraceChunk)
+        .where(
+            LocationTraceChunk.driver_id == driver_id,
+            LocationTraceChunk.start_time <= end_time,
+            LocationTraceChunk.end_time >= start_time,
+        )
+        .order_by(LocationTraceChunk.start_time)
+    )
+    start_ts = to_unix_seconds(start_time)
+    end_ts = to_unix_seconds(end_time)
+    # A set, since chunks replayed after a restart may be saved twice
+    points = {
+        point
+        for chunk in result.scalars().all()
+        for point in decode_points(chunk.points)
+        if start_ts <= point[2] <= end_ts
+    }
+    points = sorted(points, key=lambda point: point[2])
+    return downsample(points, min_interval_seconds, max_points)
+
+
+async def get_booking_trace(
+    db: AsyncSession,
+    booking: Booking,
+    min_interval_seconds: Optional[int] = None,
+    max_points: Optional[int] = None,
+) -> Tuple[datetime, datetime, List[TracePoint]]:
+    """
+    Return (start_time, end_time, points) for the booking's driver from
+    confirmation until the booking reached a final status, or until now if
+    it has not.
+    """
+    result = await db.execute(
+        select(BookingStatusHistory)
+        .where(BookingStatusHistory.booking_id == booking.id)
+        .order_by(BookingStatusHistory.timestamp)
+    )
+    history = result.scalars().all()
+    final_statuses = {
+        BookingStatusEnum.delivered,
+        BookingStatusEnum.completed,
+        BookingStatusEnum.cancelled,
+    }
+    start_time = next(
+        (
+            entry.timestamp
+            for entry in history
+            if entry.status == BookingStatusEnum.confirmed
+        ),
+        booking.date,
+    )
+    end_time = next(
+        (entry.timestamp for entry in history if entry.status in final_statuses),
+        datetime.utcnow(),
+    )
+    points = await get_location_trace(
+        db,
+        booking.driver_id,
+        start_time,
+        end_time,
+        min_interval_seconds=min_interval_seconds,
+        max_points=max_points,
+    )
+    return start_time, end_time, points
+
+
+location_history = LocationHistoryBuffer(
+    buffer_points=settings.LOCATION_HISTORY_BUFFER_POINTS,
+    chunk_points=settings.LOCATION_HISTORY_CHUNK_POINTS,
+    chunk_seconds=settings.LOCATION_HISTORY_CHUNK_SECONDS,
+    retry_seconds=settings.LOCATION_HISTORY_FLUSH_INTERVAL_SECONDS,
+    max_attempts=settings.LOCATION_HISTORY_MAX_SAVE_ATTEMPTS,
+)
+
+
+async def handle_location_history_batch(messages: List):
+    for message in messages:
+        location_data = message.value
+        try:
+            location_history.append(
+                int(location_data["driver_id"]),
+                float(location_data["latitude"]),
+                float(location_data["longitude"]),
+                location_data.get("timestamp") or time.time(),
+                source=TopicPartition(message.topic, message.partition),
+                offset=message.offset,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed driver location event: {e}")
+    await persist_chunks(location_history, location_history.drain_ready())
+
+
+async def flush_idle_location_history():
+    """
+    Periodically persist buffers of drivers that have stopped reporting,
+    and retry chunks that failed to save.
+    """
+    while True:
+        await asyncio.sleep(settings.LOCATION_HISTORY_FLUSH_INTERVAL_SECONDS)
+        try:
+            await persist_chunks(location_history, location_history.drain_ready())
+        except Exception as e:
+            logger.error(f"Error persisting location history: {e}")
+
+
+async def start_location_history_consumer():
+    asyncio.create_task(flush_idle_location_history())
+    await kafka_service.consume_batches(
+        KAFKA_TOPIC_DRIVER_LOCATIONS,
+        handle_location_history_batch,
+        group_id=f"{KAFKA_TOPIC_DRIVER_LOCATIONS}_history_group",
+        committable_offsets=location_history.committable_offsets,
+    )
+
+
+# Run this function in a separate process or thread
+if __name__ == "__main__":
+    asyncio.run(start_location_history_consumer())
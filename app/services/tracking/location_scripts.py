@@ -0,0 +1,235 @@
+# Server-side scripts that keep the drivers:{h3}:{vehicle_type} sets exact.
+#
+# Each driver's current "{h3}|{vehicle_type}" membership is kept in the
+# drivers:cells hash, which has no TTL, so a move or an eviction always knows
+# which set to remove the driver from even after driver:h3:{id} has expired.
+#
+# The sets are partitioned by availability. drivers:{h3}:{vehicle_type} and
+# drivers:geo:{vehicle_type} hold only drivers who can take a job, which is
+# all candidate lookup reads; busy drivers sit in the matching
+# drivers:busy:{h3}:{vehicle_type} and drivers:geo:busy:{vehicle_type}
+# instead. Whether a driver is busy is membership of the drivers:busy set,
+# and every availability change moves the driver between partitions in the
+# same script. Set names are derived inside the scripts, so these assume a
+# single Redis node rather than Redis Cluster.
+
+DRIVER_CELLS_KEY = "drivers:cells"
+DRIVER_LAST_SEEN_KEY = "drivers:last_seen"
+DRIVER_BUSY_KEY = "drivers:busy"
+# driver_id -> the vehicle type whose GEO sets hold the driver
+DRIVER_GEO_TYPES_KEY = "drivers:geo:types"
+
+
+def driver_claim_key(driver_id) -> str:
+    return f"driver:claim:{driver_id}"
+
+
+# Shared by the scripts that change a driver's availability: moves the
+# driver into the given partition of its current cell and GEO set.
+_SET_PARTITION = """
+local function set_partition(cells, driver_id, available)
+    local member = redis.call('HGET', cells, driver_id)
+    if not member then
+        return
+    end
+    local sep = string.find(member, '|', 1, true)
+    local cell_key = string.sub(member, 1, sep - 1) .. ':'
+        .. string.sub(member, sep + 1)
+    local vehicle_type = string.sub(member, sep + 1)
+    local from_set = 'drivers:' .. cell_key
+    local to_set = 'drivers:busy:' .. cell_key
+    local from_geo = 'drivers:geo:' .. vehicle_type
+    local to_geo = 'drivers:geo:busy:' .. vehicle_type
+    if available then
+        from_set, to_set = to_set, from_set
+        from_geo, to_geo = to_geo, from_geo
+    end
+    redis.call('SMOVE', from_set, to_set, driver_id)
+    local position = redis.call('GEOPOS', from_geo, driver_id)[1]
+    if position then
+        redis.call('GEOADD', to_geo, position[1], position[2], driver_id)
+        redis.call('ZREM', from_geo, driver_id)
+    end
+end
+"""
+
+# KEYS: driver:h3:{id}, drivers:{h3}:{vehicle_type}, drivers:cells,
+#       drivers:last_seen, drivers:busy
+# ARGV: driver_id, h3_index, vehicle_type, ttl_seconds, now
+# Returns 1 if the driver changed cell, 0 otherwise.
+MOVE_DRIVER_SCRIPT = """
+local member = ARGV[2] .. '|' .. ARGV[3]
+local busy_set = 'drivers:busy:' .. ARGV[2] .. ':' .. ARGV[3]
+local previous = redis.call('HGET', KEYS[3], ARGV[1])
+if previous and previous ~= member then
+    local sep = string.find(previous, '|', 1, true)
+    local cell_key = string.sub(previous, 1, sep - 1) .. ':'
+        .. string.sub(previous, sep + 1)
+    redis.call('SREM', 'drivers:' .. cell_key, ARGV[1])
+    redis.call('SREM', 'drivers:busy:' .. cell_key, ARGV[1])
+end
+if redis.call('SISMEMBER', KEYS[5], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    redis.call('SADD', busy_set, ARGV[1])
+else
+    redis.call('SREM', busy_set, ARGV[1])
+    redis.call('SADD', KEYS[2], ARGV[1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], member)
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[4])
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+if previous == member then
+    return 0
+end
+return 1
+"""
+
+# Removes the driver from the GEO sets of its previous vehicle type, if it
+# changed, before adding it to the right partition of the current one.
+# KEYS: drivers:geo:{vehicle_type}, drivers:geo:busy:{vehicle_type},
+#       drivers:busy, drivers:geo:types
+# ARGV: driver_id, longitude, latitude, vehicle_type
+GEO_ADD_DRIVER_SCRIPT = """
+local previous = redis.call('HGET', KEYS[4], ARGV[1])
+if previous and previous ~= ARGV[4] then
+    redis.call('ZREM', 'drivers:geo:' .. previous, ARGV[1])
+    redis.call('ZREM', 'drivers:geo:busy:' .. previous, ARGV[1])
+end
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[4])
+local target, other = KEYS[1], KEYS[2]
+if redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 1 then
+    target, other = KEYS[2], KEYS[1]
+end
+redis.call('ZREM', other, ARGV[1])
+return redis.call('GEOADD', target, ARGV[2], ARGV[3], ARGV[1])
+"""
+
+# KEYS: drivers:last_seen, drivers:cells, drivers:geo:types
+# ARGV: cutoff timestamp, max drivers to evict
+# Returns the number of drivers evicted.
+SWEEP_STALE_DRIVERS_SCRIPT = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+    'LIMIT', 0, ARGV[2])
+for _, driver_id in ipairs(stale) do
+    local member = redis.call('HGET', KEYS[2], driver_id)
+    if member then
+        local sep = string.find(member, '|', 1, true)
+        local cell_key = string.sub(member, 1, sep - 1) .. ':'
+            .. string.sub(member, sep + 1)
+        redis.call('SREM', 'drivers:' .. cell_key, driver_id)
+        redis.call('SREM', 'drivers:busy:' .. cell_key, driver_id)
+        redis.call('HDEL', KEYS[2], driver_id)
+    end
+    local geo_type = redis.call('HGET', KEYS[3], driver_id)
+    if geo_type then
+        redis.call('ZREM', 'drivers:geo:' .. geo_type, driver_id)
+        redis.call('ZREM', 'drivers:geo:busy:' .. geo_type, driver_id)
+        redis.call('HDEL', KEYS[3], driver_id)
+    end
+    redis.call('ZREM', KEYS[1], driver_id)
+end
+return #stale
+"""
+
+# Claim the first driver in ranked order that is neither claimed nor busy:
+# adding it to drivers:busy is the compare-and-set, an existing claim is
+# never overwritten, and the driver leaves the available partition in the
+# same step.
+# KEYS: drivers:cells, drivers:busy
+# ARGV: booking_id, claim ttl seconds, availability ttl seconds, driver ids
+# Returns the claimed driver id, or nil if every driver was taken.
+CLAIM_DRIVER_SCRIPT = _SET_PARTITION + """
+for i = 4, #ARGV do
+    local driver_id = ARGV[i]
+    if redis.call('EXISTS', 'driver:claim:' .. driver_id) == 0
+        and redis.call('SADD', KEYS[2], driver_id) == 1 then
+        set_partition(KEYS[1], driver_id, false)
+        redis.call('SET', 'driver:claim:' .. driver_id, ARGV[1], 'EX', ARGV[2])
+        redis.call('SET', 'driver:availability:' .. driver_id, 'False',
+            'EX', ARGV[3])
+        return driver_id
+    end
+end
+return false
+"""
+
+# Release a claim if it is still held for the given booking, putting the
+# driver straight back in the available partition.
+# KEYS: driver:claim:{id}, driver:availability:{id}, drivers:cells,
+#       drivers:busy
+# ARGV: booking_id, availability ttl seconds, driver_id
+RELEASE_CLAIM_SCRIPT = _SET_PARTITION + """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[4], ARGV[3])
+    set_partition(KEYS[3], ARGV[3], true)
+    redis.call('SET', KEYS[2], 'True', 'EX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Accept an outstanding offer. Only a driver still holding the offer can
+# accept, only the first accept per booking wins, and the winner is claimed
+# like CLAIM_DRIVER_SCRIPT would. The winner's offer is consumed, so its
+# timeout cannot expire it after the fact.
+# KEYS: offer:{booking_id}:drivers, offer:{booking_id}:winner, drivers:cells,
+#       drivers:busy
+# ARGV: driver_id, booking_id, claim ttl seconds, availability ttl seconds
+# Returns 1 if accepted, 0 if another driver won, -1 if the offer is gone
+# (expired, declined or revoked) and -2 if the driver is busy elsewhere.
+ACCEPT_OFFER_SCRIPT = _SET_PARTITION + """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+if redis.call('SADD', KEYS[4], ARGV[1]) == 0 then
+    return -2
+end
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[3])
+redis.call('SREM', KEYS[1], ARGV[1])
+set_partition(KEYS[3], ARGV[1], false)
+redis.call('SET', 'driver:claim:' .. ARGV[1], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', 'driver:availability:' .. ARGV[1], 'False', 'EX', ARGV[4])
+return 1
+"""
+
+# Mark a driver available or busy, as reported by the driver or decided by
+# a committed assignment. A report never overrides a held claim: the driver
+# stays busy until the booking lifecycle releases it with
+# RELEASE_CLAIM_SCRIPT or the claim expires.
+# KEYS: driver:availability:{id}, drivers:cells, drivers:busy,
+#       driver:claim:{id}
+# ARGV: driver_id, "True" or "False", availability ttl seconds
+# Returns 1 if applied, 0 if ignored because the driver is claimed.
+SET_AVAILABILITY_SCRIPT = _SET_PARTITION + """
+if redis.call('EXISTS', KEYS[4]) == 1 then
+    return 0
+end
+local available = ARGV[2] == 'True'
+if available then
+    redis.call('SREM', KEYS[3], ARGV[1])
+else
+    redis.call('SADD', KEYS[3], ARGV[1])
+end
+set_partition(KEYS[2], ARGV[1], available)
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+_registered = {}
+
+
+def get_script(redis, source: str):
+    """
+    Return the Script for the given source, registering it on first use.
+    Callers always pass client= when invoking it, so the same Script can be
+    queued on any pipeline.
+    """
+    script = _registered.get(source)
+    if script is None:
+        script = redis.register_script(source)
+        _registered[source] = script
+    return script
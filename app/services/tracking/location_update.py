@@ -3,15 +3,26 @@ import time
 from typing import Any, Dict, List
 
 import h3
+from app.config import settings
 from app.services.messaging.kafka_service import kafka_service
 
+from .movement_filter import movement_filter
+from .wire_format import trusted_timestamp
+
 KAFKA_TOPIC_DRIVER_LOCATIONS = "driver_locations"
 
 
 async def update_driver_locations(driver_updates: List[Dict[str, Any]]):
     """
-    Update multiple drivers' locations and publish to Kafka.
+    Update multiple drivers' locations and publish to Kafka. Updates that
+    carry no new information are dropped by the movement filter.
+
+    "timestamp" is when the device took the point, falling back to the
+    server's receive time if the device clock is missing or not trusted.
+    "received_at" is always server time and is what staleness is judged by.
     """
+    received_at = time.time()
+    messages = []
     for update in driver_updates:
         driver_id = update["driver_id"]
         latitude = update["latitude"]
@@ -26,8 +37,25 @@ async def update_driver_locations(driver_updates: List[Dict[str, Any]]):
             "longitude": longitude,
             "vehicle_type": vehicle_type,
             "h3_index": h3_index,
-            "timestamp": int(time.time()),
+            "timestamp": int(
+                trusted_timestamp(update.get("timestamp"), received_at) or received_at
+            ),
+            "received_at": int(received_at),
         }
+        for optional_field in ("heading", "speed"):
+            if update.get(optional_field) is not None:
+                location_data[optional_field] = update[optional_field]
+
+        if settings.LOCATION_FILTER_ENABLED and not movement_filter.should_forward(
+            driver_id,
+            latitude,
+            longitude,
+            h3_index,
+            heading=update.get("heading"),
+            timestamp=received_at,
+        ):
+            continue
+        messages.append(location_data)
 
-        # Publish location update to Kafka
-        await kafka_service.send_message(KAFKA_TOPIC_DRIVER_LOCATIONS, location_data)
+    # Publish location updates to Kafka
+    await kafka_service.send_messages(KAFKA_TOPIC_DRIVER_LOCATIONS, messages)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+from app.config import settings
+from app.services.messaging.kafka_service import (KAFKA_TOPIC_DRIVER_LOCATIONS,
+                                                  TRANSIENT_ERRORS,
+                                                  kafka_service)
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+LOCATION_POINTS_TABLE = "driver_location_points"
+LOCATION_POINT_COLUMNS = (
+    "driver_id",
+    "recorded_at",
+    "latitude",
+    "longitude",
+    "heading",
+    "speed",
+)
+
+# (driver_id, recorded_at, latitude, longitude, heading, speed)
+LocationRecord = Tuple[int, datetime, float, float, Optional[float], Optional[float]]
+
+# drivers.id and driver_location_points.driver_id are integer columns
+INT4_MAX = 2**31 - 1
+
+# Errors that say the server went away, is overloaded or rolled the
+# transaction back, none of which is about the rows being written. Anything
+# else, such as a constraint violation or a value asyncpg cannot encode, will
+# fail the same way every time.
+POSTGRES_TRANSIENT_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.InsufficientResourcesError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.TransactionRollbackError,
+)
+
+CREATE_LATEST_TABLE = """
+CREATE TEMP TABLE driver_location_latest (
+    driver_id integer PRIMARY KEY,
+    latitude double precision NOT NULL,
+    longitude double precision NOT NULL
+) ON COMMIT DROP
+"""
+
+UPDATE_DRIVER_LOCATIONS = """
+UPDATE drivers
+SET location = ST_MakePoint(latest.longitude, latest.latitude)
+FROM driver_location_latest AS latest
+WHERE drivers.id = latest.driver_id
+"""
+
+
+def to_record(location_data: Dict) -> LocationRecord:
+    """
+    Convert a driver_locations event into a row for LOCATION_POINT_COLUMNS.
+    Raises KeyError, TypeError or ValueError for malformed events, including
+    values the columns cannot hold.
+    """
+    driver_id = int(location_data["driver_id"])
+    if not 0 < driver_id <= INT4_MAX:
+        raise ValueError(f"driver_id {driver_id} is out of range")
+    try:
+        recorded_at = datetime.utcfromtimestamp(float(location_data["timestamp"]))
+    except (OverflowError, OSError):
+        raise ValueError(f"timestamp {location_data['timestamp']} is out of range")
+    latitude = float(location_data["latitude"])
+    longitude = float(location_data["longitude"])
+    if not (
+        math.isfinite(latitude)
+        and math.isfinite(longitude)
+        and abs(latitude) <= 90
+        and abs(longitude) <= 180
+    ):
+        raise ValueError(f"Position {latitude}, {longitude} is out of range")
+    heading = location_data.get("heading")
+    speed = location_data.get("speed")
+    return (
+        driver_id,
+        recorded_at,
+        latitude,
+        longitude,
+        float(heading) if heading is not None else None,
+        float(speed) if speed is not None else None,
+    )
+
+
+def latest_positions(records: List[LocationRecord]) -> List[Tuple[int, float, float]]:
+    latest = {}
+    for record in records:
+        current = latest.get(record[0])
+        if current is None or record[1] >= current[1]:
+            latest[record[0]] = record
+    return [(driver_id, record[2], record[3]) for driver_id, record in latest.items()]
+
+
+class LocationPointWriter:
+    """
+    Bulk loader for driver_location_points. Each batch is written with a
+    single COPY, and when update_drivers is set the newest point per driver
+    is copied into a temporary table and applied to drivers.location with one
+    UPDATE in the same transaction. Delivery is at least once, so a batch
+    redelivered after a crash between COPY and the offset commit is written
+    twice.
+    """
+
+    def __init__(self, dsn: str, pool_size: int = 2, update_drivers: bool = True):
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.update_drivers = update_drivers
+        self._pool: Optional[asyncpg.Pool] = None
+
+    async def start(self):
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(
+                self.dsn, min_size=1, max_size=self.pool_size
+            )
+
+    async def stop(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def write(self, records: List[LocationRecord]):
+        if not records:
+            return
+        await self.start()
+        async with self._pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.copy_records_to_table(
+                    LOCATION_POINTS_TABLE,
+                    records=records,
+                    columns=LOCATION_POINT_COLUMNS,
+                )
+                if self.update_drivers:
+                    await connection.execute(CREATE_LATEST_TABLE)
+                    await connection.copy_records_to_table(
+                        "driver_location_latest",
+                        records=latest_positions(records),
+                        columns=("driver_id", "latitude", "longitude"),
+                    )
+                    await connection.execute(UPDATE_DRIVER_LOCATIONS)
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    # DATABASE_URL names the SQLAlchemy dialect, e.g. postgresql+asyncpg://
+    url = make_url(database_url).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+location_writer = LocationPointWriter(
+    asyncpg_dsn(settings.DATABASE_URL),
+    update_drivers=settings.LOCATION_WRITER_UPDATE_DRIVERS,
+)
+
+
+async def handle_location_point_batch(messages: List):
+    records = []
+    for message in messages:
+        try:
+            records.append(to_record(message.value))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping malformed driver location event: {e}")
+
+    # Errors propagate to consume_batches, so offsets are only committed once
+    # the batch is in Postgres: POSTGRES_TRANSIENT_ERRORS are retried until
+    # the server is back, anything else narrows the batch down to the events
+    # that cannot be written and dead-letters them
+    await location_writer.write(records)
+
+
+async def start_location_writer():
+    await location_writer.start()
+    try:
+        await kafka_service.consume_batches(
+            KAFKA_TOPIC_DRIVER_LOCATIONS,
+            handle_location_point_batch,
+            max_records=settings.LOCATION_WRITER_FLUSH_ROWS,
+            linger_ms=settings.LOCATION_WRITER_FLUSH_INTERVAL_MS,
+            group_id=f"{KAFKA_TOPIC_DRIVER_LOCATIONS}_writer_group",
+            transient_errors=TRANSIENT_ERRORS + POSTGRES_TRANSIENT_ERRORS,
+        )
+    finally:
+        await location_writer.stop()
+
+
+# Run this function in a separate process or thread
+if __name__ == "__main__":
+    asyncio.run(start_location_writer())
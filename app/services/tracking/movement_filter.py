@@ -0,0 +1,117 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.config import settings
+from app.utils.geo import haversine_km, heading_change_deg
+from prometheus_client import Counter
+
+LOCATION_UPDATES = Counter(
+    "driver_location_updates_total",
+    "Driver location updates seen by the movement filter.",
+    ["outcome", "reason"],
+)
+
+
+@dataclass
+class _AcceptedPoint:
+    h3_index: str
+    latitude: float
+    longitude: float
+    heading: Optional[float]
+    timestamp: float
+
+
+class MovementFilter:
+    """
+    Server-side filter that forwards a driver's location only when it says
+    something new: the driver entered another H3 cell, moved further than
+    min_distance_m, turned by more than min_heading_change_deg, or has been
+    quiet for max_silence_seconds. Everything else is suppressed.
+    """
+
+    def __init__(
+        self,
+        min_distance_m: float = 25.0,
+        min_heading_change_deg: float = 30.0,
+        max_silence_seconds: float = 30.0,
+    ):
+        self.min_distance_km = min_distance_m / 1000
+        self.min_heading_change_deg = min_heading_change_deg
+        self.max_silence_seconds = max_silence_seconds
+        self._last_accepted: Dict[str, _AcceptedPoint] = {}
+
+    def _forward_reason(
+        self,
+        last: Optional[_AcceptedPoint],
+        latitude: float,
+        longitude: float,
+        h3_index: str,
+        heading: Optional[float],
+        timestamp: float,
+    ) -> Optional[str]:
+        if last is None:
+            return "first"
+        if h3_index != last.h3_index:
+            return "cell_change"
+        if timestamp - last.timestamp >= self.max_silence_seconds:
+            return "heartbeat"
+        if (
+            haversine_km(last.latitude, last.longitude, latitude, longitude)
+            >= self.min_distance_km
+        ):
+            return "distance"
+        if (
+            heading is not None
+            and last.heading is not None
+            and heading_change_deg(heading, last.heading) >= self.min_heading_change_deg
+        ):
+            return "heading"
+        return None
+
+    def should_forward(
+        self,
+        driver_id: str,
+        latitude: float,
+        longitude: float,
+        h3_index: str,
+        heading: Optional[float] = None,
+        timestamp: Optional[float] = None,
+    ) -> bool:
+        if timestamp is None:
+            timestamp = time.time()
+        driver_id = str(driver_id)
+        reason = self._forward_reason(
+            self._last_accepted.get(driver_id),
+            latitude,
+            longitude,
+            h3_index,
+            heading,
+            timestamp,
+        )
+        if reason is None:
+            LOCATION_UPDATES.labels(outcome="suppressed", reason="unchanged").inc()
+            return False
+
+        self._last_accepted[driver_id] = _AcceptedPoint(
+            h3_index=h3_index,
+            latitude=latitude,
+            longitude=longitude,
+            heading=heading,
+            timestamp=timestamp,
+        )
+        LOCATION_UPDATES.labels(outcome="forwarded", reason=reason).inc()
+        return True
+
+    def forget(self, driver_id: str):
+        """
+        Drop a driver's state so its next update is always forwarded.
+        """
+        self._last_accepted.pop(str(driver_id), None)
+
+
+movement_filter = MovementFilter(
+    min_distance_m=settings.LOCATION_FILTER_MIN_DISTANCE_M,
+    min_heading_change_deg=settings.LOCATION_FILTER_MIN_HEADING_CHANGE_DEG,
+    max_silence_seconds=settings.LOCATION_FILTER_MAX_SILENCE_SECONDS,
+)
@@ -0,0 +1,165 @@
+from typing import List
+
+import h3
+from app.config import settings
+
+from .h3_index import H3_RESOLUTION
+from .location_scripts import (DRIVER_BUSY_KEY, DRIVER_CELLS_KEY,
+                               DRIVER_GEO_TYPES_KEY, DRIVER_LAST_SEEN_KEY,
+                               GEO_ADD_DRIVER_SCRIPT, MOVE_DRIVER_SCRIPT,
+                               get_script)
+
+PROXIMITY_KEY_TTL_SECONDS = 300  # 5 minutes
+
+
+class H3SetProximityBackend:
+    """
+    Candidate lookup over the drivers:{h3}:{vehicle_type} sets, which only
+    hold available drivers. Each hexagon ring around the pickup is fetched in
+    one pipelined round trip, expanding outwards until a ring yields drivers.
+
+    Updates move the driver between sets atomically and stamp its last-seen
+    time; silent drivers are evicted by the location consumer's sweeper
+    rather than by expiring whole sets.
+    """
+
+    ranks_by_distance = False
+
+    def __init__(self, max_k: int = 5):
+        self.max_k = max_k
+
+    async def queue_update(
+        self,
+        pipe,
+        driver_id,
+        latitude: float,
+        longitude: float,
+        h3_index: str,
+        vehicle_type: str,
+        timestamp: float,
+    ):
+        move_driver = get_script(pipe, MOVE_DRIVER_SCRIPT)
+        await move_driver(
+            keys=[
+                f"driver:h3:{driver_id}",
+                f"drivers:{h3_index}:{vehicle_type}",
+                DRIVER_CELLS_KEY,
+                DRIVER_LAST_SEEN_KEY,
+                DRIVER_BUSY_KEY,
+            ],
+            args=[
+                driver_id,
+                h3_index,
+                vehicle_type,
+                PROXIMITY_KEY_TTL_SECONDS,
+                timestamp,
+            ],
+            client=pipe,
+        )
+
+    async def find_candidates(
+        self,
+        redis,
+        latitude: float,
+        longitude: float,
+        vehicle_type: str,
+        radius_km: float = None,
+        count: int = None,
+    ) -> List[str]:
+        pickup_h3 = h3.geo_to_h3(latitude, longitude, H3_RESOLUTION)
+        candidates: List[str] = []
+        for k in range(self.max_k):
+            pipe = redis.pipeline(transaction=False)
+            for hex_index in h3.hex_ring(pickup_h3, k):
+                pipe.smembers(f"drivers:{hex_index}:{vehicle_type}")
+            for drivers in await pipe.execute():
+                candidates.extend(drivers)
+            if candidates:
+                break
+        return candidates[:count] if count else candidates
+
+
+class GeoProximityBackend:
+    """
+    Candidate lookup over per-vehicle-type Redis GEO sets of available
+    drivers. A single GEOSEARCH returns the nearest drivers within the radius,
+    closest first.
+    """
+
+    ranks_by_distance = True
+
+    def __init__(self, radius_km: float = 5.0, count: int = 20):
+        self.radius_km = radius_km
+        self.count = count
+
+    @staticmethod
+    def key(vehicle_type: str) -> str:
+        return f"drivers:geo:{vehicle_type}"
+
+    @staticmethod
+    def busy_key(vehicle_type: str) -> str:
+        return f"drivers:geo:busy:{vehicle_type}"
+
+    async def queue_update(
+        self,
+        pipe,
+        driver_id,
+        latitude: float,
+        longitude: float,
+        h3_index: str,
+        vehicle_type: str,
+        timestamp: float,
+    ):
+        # Stale members are removed by the same sweep that evicts drivers
+        # from the H3 sets
+        geo_add_driver = get_script(pipe, GEO_ADD_DRIVER_SCRIPT)
+        await geo_add_driver(
+            keys=[
+                self.key(vehicle_type),
+                self.busy_key(vehicle_type),
+                DRIVER_BUSY_KEY,
+                DRIVER_GEO_TYPES_KEY,
+            ],
+            args=[driver_id, longitude, latitude, vehicle_type],
+            client=pipe,
+        )
+
+    async def find_candidates(
+        self,
+        redis,
+        latitude: float,
+        longitude: float,
+        vehicle_type: str,
+        radius_km: float = None,
+        count: int = None,
+    ) -> List[str]:
+        return await redis.execute_command(
+            "GEOSEARCH",
+            self.key(vehicle_type),
+            "FROMLONLAT",
+            longitude,
+            latitude,
+            "BYRADIUS",
+            radius_km or self.radius_km,
+            "km",
+            "ASC",
+            "COUNT",
+            count or self.count,
+        )
+
+
+h3_set_backend = H3SetProximityBackend()
+
+
+def get_proximity_backend(name: str):
+    if name == "h3":
+        return h3_set_backend
+    if name == "geo":
+        return GeoProximityBackend(
+            radius_km=settings.PROXIMITY_SEARCH_RADIUS_KM,
+            count=settings.PROXIMITY_CANDIDATE_COUNT,
+        )
+    raise ValueError(f"Unknown proximity backend: {name}")
+
+
+proximity_backend = get_proximity_backend(settings.PROXIMITY_BACKEND)
@@ -1,16 +1,15 @@
 import json
 import logging
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List
 
-import h3
 from app.models import Driver
 from app.services.booking.booking_service import update_booking_status
 from app.services.messaging.kafka_service import (
-    KAFKA_TOPIC_DRIVER_AVAILABILITY_UPDATES, KAFKA_TOPIC_DRIVER_LOCATIONS,
-    kafka_service)
+    KAFKA_TOPIC_DRIVER_AVAILABILITY_UPDATES, kafka_service)
 from app.services.tracking import verify_token
-from app.services.tracking.location_update import update_driver_locations
+from app.services.tracking.driver_tracking import driver_tracker
+from app.services.tracking.h3_index import driver_index
 from fastapi import WebSocketDisconnect
 from sqlalchemy.orm import Session
 
@@ -18,6 +17,7 @@ from sqlalchemy.orm import Session
 class TrackingService:
     def __init__(self, manager):
         self.manager = manager
+        self._last_availability: Dict[str, bool] = {}
 
     async def handle_acknowledgment(self, driver_id: str, data: Dict[str, Any]):
         booking_id = data.get("booking_id")
@@ -42,15 +42,8 @@ class TrackingService:
 
         vehicle_type = data.get("vehicle_type", "unknown")
 
-        await update_driver_locations(
-            [
-                {
-                    "driver_id": driver_id,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "vehicle_type": vehicle_type,
-                }
-            ]
+        await driver_tracker.add_location_update(
+            driver_id, latitude, longitude, vehicle_type
         )
 
     async def process_websocket_message(self, driver_id: str, data: Dict[str, Any]):
@@ -79,10 +72,10 @@ class TrackingService:
                 except Exception as e:
                     await websocket.send_text(f"Error processing data: {e}")
         except WebSocketDisconnect:
-            await self.manager.disconnect_driver(driver_id)
+            await self.manager.disconnect_driver(driver_id, websocket)
         except Exception as e:
             await self.manager.send_personal_message(f"Error: {str(e)}", websocket)
-            await self.manager.disconnect_driver(driver_id)
+            await self.manager.disconnect_driver(driver_id, websocket)
 
     async def get_nearby_drivers(
         self,
@@ -94,28 +87,20 @@ class TrackingService:
     ) -> Dict[str, Any]:
         nearby_drivers = []
         current_radius = initial_radius_km
+        filter_type = None if vehicle_type.lower() == "all" else vehicle_type
 
         while current_radius <= max_radius_km and not nearby_drivers:
-            h3_index = h3.geo_to_h3(lat, lng, self.manager.h3_resolution)
-            search_indexes = h3.k_ring(
-                h3_index, int(current_radius / self.manager.h3_ring_distance)
-            )
-
-            for index in search_indexes:
-                drivers = self.manager.h3_index_to_drivers.get(index, [])
-                for driver_id in drivers:
-                    driver_info = self.manager.driver_locations.get(driver_id)
-                    if driver_info and (
-                        vehicle_type.lower() == "all"
-                        or driver_info["vehicle_type"] == vehicle_type
-                    ):
-                        nearby_drivers.append(
-                            {
-                                "driver_id": driver_id,
-                                "location": driver_info["h3_index"],
-                                "vehicle_type": driver_info["vehicle_type"],
-                            }
-                        )
+            for position, distance_km in driver_index.search(
+                lat, lng, current_radius, filter_type
+            ):
+                nearby_drivers.append(
+                    {
+                        "driver_id": position.driver_id,
+                        "location": position.h3_index,
+                        "vehicle_type": position.vehicle_type,
+                        "distance_km": distance_km,
+                    }
+                )
 
             if not nearby_drivers:
                 current_radius *= 2  # Double the radius for the next iteration
@@ -133,31 +118,41 @@ class TrackingService:
         """
         Update the driver's location and availability.
         """
-        # Update in Redis or database as needed
-        await update_driver_locations(
-            [
-                {
-                    "driver_id": driver_id,
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    "vehicle_type": vehicle_type,
-                }
-            ]
+        await driver_tracker.add_location_update(
+            driver_id, latitude, longitude, vehicle_type
         )
+        await self.manager.update_driver_room(driver_id, latitude, longitude)
 
-        # Publish location update to Kafka
-        location_update_event = {
-            "driver_id": driver_id,
-            "latitude": latitude,
-            "longitude": longitude,
-            "vehicle_type": vehicle_type,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-        await kafka_service.send_message(
-            KAFKA_TOPIC_DRIVER_LOCATIONS, location_update_event
-        )
+        await self.publish_availability(driver_id, is_available)
 
-        # If availability status has changed, publish to Kafka
+    async def update_driver_location_batch(
+        self, driver_updates: List[Dict[str, Any]], is_available: bool
+    ):
+        """
+        Queue a burst of location updates, with at most one availability
+        event per driver in the burst.
+        """
+        latest = {}
+        for update in driver_updates:
+            await driver_tracker.add_location_update(**update)
+            latest[update["driver_id"]] = update
+
+        for driver_id, update in latest.items():
+            await self.manager.update_driver_room(
+                driver_id, update["latitude"], update["longitude"]
+            )
+            await self.publish_availability(driver_id, is_available)
+
+    async def publish_availability(self, driver_id: str, is_available: bool):
+        """
+        Publish the driver's availability to Kafka if it has changed since
+        the last location update from this process. The value is the
+        socket's snapshot from connect time, so it is sent once rather than
+        refreshed; claims, not these reports, keep a driver on a trip busy.
+        """
+        if self._last_availability.get(driver_id) == is_available:
+            return
+        self._last_availability[driver_id] = is_available
         availability_update_event = {
             "driver_id": driver_id,
             "is_available": is_available,
@@ -0,0 +1,162 @@
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+import numpy as np
+from app.config import settings
+
+# WebSocket subprotocols a driver client may offer for batched location
+# frames. Clients that negotiate neither keep sending JSON lists.
+SUBPROTOCOL_STRUCT = "location.struct.v1"
+SUBPROTOCOL_MSGPACK = "location.msgpack.v1"
+SUPPORTED_SUBPROTOCOLS = (SUBPROTOCOL_STRUCT, SUBPROTOCOL_MSGPACK)
+
+# Fixed-width little-endian record, 40 bytes per point
+LOCATION_DTYPE = np.dtype(
+    [
+        ("driver_id", "<u8"),
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        ("timestamp", "<f8"),
+        ("heading", "<f4"),
+        ("speed", "<f4"),
+    ]
+)
+
+
+# Device timestamps above this are in milliseconds; in seconds it would be
+# the year 5138
+MILLISECONDS_THRESHOLD = 1e11
+
+
+def negotiate_subprotocol(offered: List[str]) -> Optional[str]:
+    """
+    Pick the first binary format the client offered that we support.
+    """
+    for subprotocol in offered:
+        if subprotocol in SUPPORTED_SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+def decode_struct(payload: bytes) -> np.ndarray:
+    """
+    Decode a frame of packed LOCATION_DTYPE records without copying.
+    """
+    if len(payload) % LOCATION_DTYPE.itemsize:
+        raise ValueError(
+            f"Frame length {len(payload)} is not a multiple of "
+            f"{LOCATION_DTYPE.itemsize} bytes."
+        )
+    return np.frombuffer(payload, dtype=LOCATION_DTYPE)
+
+
+def decode_msgpack(payload: bytes) -> np.ndarray:
+    """
+    Decode a msgpack array of [driver_id, lat, lng, ts, heading, speed]
+    arrays.
+    """
+    rows = msgpack.unpackb(payload)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a msgpack array of location updates.")
+    try:
+        values = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Location updates must be numeric arrays.")
+    if values.size == 0:
+        return np.empty(0, dtype=LOCATION_DTYPE)
+    if values.ndim != 2 or values.shape[1] != len(LOCATION_DTYPE.names):
+        raise ValueError(
+            f"Each location update must have {len(LOCATION_DTYPE.names)} fields."
+        )
+    points = np.empty(len(values), dtype=LOCATION_DTYPE)
+    for column, name in enumerate(LOCATION_DTYPE.names):
+        points[name] = values[:, column]
+    return points
+
+
+def decode_frame(payload: bytes, subprotocol: str) -> np.ndarray:
+    if subprotocol == SUBPROTOCOL_STRUCT:
+        return decode_struct(payload)
+    if subprotocol == SUBPROTOCOL_MSGPACK:
+        return decode_msgpack(payload)
+    raise ValueError(f"Unsupported location frame format: {subprotocol}")
+
+
+def trusted_timestamp(value, now: float) -> Optional[float]:
+    """
+    A device timestamp in unix seconds, converted from milliseconds if need
+    be, or None if it is missing or outside the window around server time
+    that device clocks are trusted in.
+    """
+    try:
+        timestamp = float(value)
+    except (TypeError, ValueError):
+        return None
+    if timestamp > MILLISECONDS_THRESHOLD:
+        timestamp /= 1000
+    if not (
+        now - settings.LOCATION_TIMESTAMP_MAX_AGE_SECONDS
+        <= timestamp
+        <= now + settings.LOCATION_TIMESTAMP_MAX_SKEW_SECONDS
+    ):
+        return None
+    return timestamp
+
+
+def validate_points(
+    points: np.ndarray, now: Optional[float] = None
+) -> Tuple[np.ndarray, int]:
+    """
+    Drop points with out-of-range or non-finite values in one vectorized
+    pass, including timestamps outside the window trusted_timestamp allows
+    around now. Millisecond timestamps are converted to seconds. Returns the
+    valid points and the number rejected.
+    """
+    if now is None:
+        now = time.time()
+    latitude = points["latitude"]
+    longitude = points["longitude"]
+    heading = points["heading"]
+    speed = points["speed"]
+    timestamp = points["timestamp"]
+    timestamp = np.where(
+        timestamp > MILLISECONDS_THRESHOLD, timestamp / 1000, timestamp
+    )
+    valid = (
+        np.isfinite(latitude)
+        & np.isfinite(longitude)
+        & (np.abs(latitude) <= 90.0)
+        & (np.abs(longitude) <= 180.0)
+        & (timestamp >= now - settings.LOCATION_TIMESTAMP_MAX_AGE_SECONDS)
+        & (timestamp <= now + settings.LOCATION_TIMESTAMP_MAX_SKEW_SECONDS)
+        & (np.isnan(heading) | ((heading >= 0.0) & (heading < 360.0)))
+        & (np.isnan(speed) | (speed >= 0.0))
+    )
+    # Boolean indexing copies, so the frame's read-only buffer is untouched
+    valid_points = points[valid]
+    valid_points["timestamp"] = timestamp[valid]
+    return valid_points, int(len(points) - np.count_nonzero(valid))
+
+
+def to_location_updates(points: np.ndarray, vehicle_type: str) -> List[Dict[str, Any]]:
+    """
+    Convert decoded points into the dicts accepted by update_driver_locations.
+    NaN heading or speed means the device did not report it.
+    """
+    updates = []
+    for driver_id, latitude, longitude, timestamp, heading, speed in points.tolist():
+        update = {
+            "driver_id": str(driver_id),
+            "latitude": latitude,
+            "longitude": longitude,
+            "vehicle_type": vehicle_type,
+            "timestamp": timestamp,
+        }
+        if not math.isnan(heading):
+            update["heading"] = heading
+        if not math.isnan(speed):
+            update["speed"] = speed
+        updates.append(update)
+    return updates
@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 
 import aioredis
 from app.models import Booking, BookingStatusEnum, Driver, User
+from app.services.assignment.driver_claims import release_claim
+from app.services.caching.auth_cache import auth_cache
 from celery import Celery
 from db.database import engine
 from sqlalchemy import desc, func, select
@@ -98,12 +100,17 @@ async def handle_booking_completion(self, booking_id: int):
                 BookingStatusEnum.cancelled,
                 BookingStatusEnum.completed,
             ]:
+                if booking.driver_id:
+                    # Back in the available candidate sets right away
+                    await release_claim(booking.driver_id, booking.id)
+
                 # Update driver's availability
                 driver = await db.get(Driver, booking.driver_id)
                 if driver:
                     driver.is_available = True
                     await db.commit()
                     await db.refresh(driver)
+                    await auth_cache.invalidate("driver", driver.id)
 
                 # Update analytics
                 await compute_analytics()
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    Great-circle distance between two points in kilometers.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_matrix(origins: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in kilometers from every origin (rows) to every
+    target (columns). Both arguments are (n, 2) arrays of latitude,
+    longitude.
+    """
+    lat1 = np.radians(origins[:, 0])[:, None]
+    lng1 = np.radians(origins[:, 1])[:, None]
+    lat2 = np.radians(targets[:, 0])[None, :]
+    lng2 = np.radians(targets[:, 1])[None, :]
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_pairs(origins: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in kilometers from each origin to the target in
+    the same row. Both arguments are (n, 2) arrays of latitude, longitude.
+    """
+    lat1, lng1 = np.radians(origins[:, 0]), np.radians(origins[:, 1])
+    lat2, lng2 = np.radians(targets[:, 0]), np.radians(targets[:, 1])
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def heading_change_deg(heading1: float, heading2: float) -> float:
+    """
+    Smallest angle between two compass headings, in degrees.
+    """
+    change = abs(heading1 - heading2) % 360.0
+    return min(change, 360.0 - change)
@@ -0,0 +1,11 @@
+"""
+Synthetic city benchmarks for driver matching and tracking.
+
+    python -m benchmarks --drivers 5000 --bookings 1000 --json run.json
+    python -m benchmarks --baseline run.json --tolerance 0.2
+
+Runs the real matching and tracking code against in-process fakes of Redis
+and Kafka and reports p50/p95/p99 latency, candidates scanned and Redis
+round trips per call. Needs the packages in benchmarks/requirements.txt on
+top of the app's own.
+"""
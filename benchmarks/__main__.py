@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from .city import CityConfig
+from .matching import run
+from .report import compare, format_table, load_baseline
+
+
+def parse_args(argv=None):
+    defaults = CityConfig()
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark driver matching and tracking on a synthetic city.",
+    )
+    parser.add_argument("--drivers", type=int, default=defaults.num_drivers)
+    parser.add_argument("--bookings", type=int, default=defaults.num_bookings)
+    parser.add_argument("--radius-km", type=float, default=defaults.radius_km)
+    parser.add_argument("--hotspots", type=int, default=defaults.num_hotspots)
+    parser.add_argument(
+        "--hotspot-intensity", type=float, default=defaults.hotspot_intensity
+    )
+    parser.add_argument("--busy-fraction", type=float, default=defaults.busy_fraction)
+    parser.add_argument(
+        "--moves-per-booking", type=int, default=defaults.moves_per_booking
+    )
+    parser.add_argument("--trip-length", type=int, default=defaults.trip_length)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--json", help="Write the summary to this file")
+    parser.add_argument(
+        "--baseline", help="Summary of an earlier run to check for regressions"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown against the baseline, as a fraction",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    config = CityConfig(
+        num_drivers=args.drivers,
+        num_bookings=args.bookings,
+        radius_km=args.radius_km,
+        num_hotspots=args.hotspots,
+        hotspot_intensity=args.hotspot_intensity,
+        busy_fraction=args.busy_fraction,
+        moves_per_booking=args.moves_per_booking,
+        trip_length=args.trip_length,
+        seed=args.seed,
+    )
+    stats = asyncio.run(run(config))
+    print(format_table(list(stats.values())))
+
+    summaries = {name: operation.summary() for name, operation in stats.items()}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "operations": summaries}, f, indent=2)
+
+    if args.baseline:
+        regressions = compare(summaries, load_baseline(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
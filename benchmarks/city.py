@@ -0,0 +1,163 @@
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import h3
+import numpy as np
+from app.services.tracking.h3_index import ring_distance_km
+from app.utils.geo import haversine_matrix
+
+KM_PER_DEGREE = 111.32
+
+
+@dataclass
+class CityConfig:
+    """
+    Shape of a synthetic city. Drivers and bookings are spread over the H3
+    cells within radius_km of the center; each hotspot multiplies the weight
+    of the cells around it, so demand (and, less sharply, supply) clusters
+    the way it does around stations and shopping districts.
+    """
+
+    center: Tuple[float, float] = (12.9716, 77.5946)
+    radius_km: float = 15.0
+    resolution: int = 8
+    num_drivers: int = 5000
+    num_bookings: int = 1000
+    vehicle_types: Dict[str, float] = field(
+        default_factory=lambda: {"van": 0.5, "truck": 0.35, "refrigerated_truck": 0.15}
+    )
+    # Share of the fleet already busy when the run starts
+    busy_fraction: float = 0.2
+    num_hotspots: int = 5
+    hotspot_radius_km: float = 1.5
+    # Peak weight of a hotspot cell relative to an ordinary one
+    hotspot_intensity: float = 20.0
+    # How strongly drivers follow the hotspots, from 0 (uniform) to 1
+    driver_hotspot_bias: float = 0.5
+    # Drivers relocated to a neighbouring cell before each booking
+    moves_per_booking: int = 20
+    # Bookings a matched driver stays busy for before being released
+    trip_length: int = 50
+    seed: int = 0
+
+
+@dataclass
+class SyntheticDriver:
+    driver_id: int
+    latitude: float
+    longitude: float
+    vehicle_type: str
+    is_available: bool
+
+
+@dataclass
+class SyntheticBooking:
+    # Field names match BookingRequest so find_nearest_driver accepts it
+    id: int
+    pickup_latitude: float
+    pickup_longitude: float
+    vehicle_type: str
+
+
+class SyntheticCity:
+    """
+    Weighted H3 cells to sample driver and booking positions from.
+    """
+
+    def __init__(self, config: CityConfig):
+        self.config = config
+        self.rng = np.random.default_rng(config.seed)
+        origin = h3.geo_to_h3(*config.center, config.resolution)
+        k = math.ceil(config.radius_km / ring_distance_km(config.resolution))
+        cells = sorted(h3.k_ring(origin, k))
+        centers = np.array([h3.h3_to_geo(cell) for cell in cells])
+        # Trim the hexagonal ring to a disc
+        from_center = haversine_matrix(centers, np.array([config.center]))[:, 0]
+        inside = from_center <= config.radius_km
+        self.cells = [cell for cell, keep in zip(cells, inside) if keep]
+        self.centers = centers[inside]
+        self.edge_km = h3.edge_length(config.resolution, unit="km")
+
+        hotspots = self.centers[
+            self.rng.choice(len(self.cells), config.num_hotspots, replace=False)
+        ]
+        distances = haversine_matrix(self.centers, hotspots)
+        self.hotspot_weight = config.hotspot_intensity * np.exp(
+            -((distances / config.hotspot_radius_km) ** 2)
+        ).sum(axis=1)
+        self.vehicle_types = list(config.vehicle_types)
+        shares = np.array(list(config.vehicle_types.values()), dtype=float)
+        self.vehicle_shares = shares / shares.sum()
+
+    def _weights(self, bias: float) -> np.ndarray:
+        weights = 1.0 + bias * self.hotspot_weight
+        return weights / weights.sum()
+
+    def sample_points(self, n: int, bias: float = 1.0) -> np.ndarray:
+        """
+        n (latitude, longitude) points: a cell drawn by weight, then a point
+        spread uniformly over a disc about the size of the cell.
+        """
+        cells = self.rng.choice(len(self.cells), n, p=self._weights(bias))
+        return self.jitter(self.centers[cells])
+
+    def jitter(self, points: np.ndarray) -> np.ndarray:
+        radius_km = self.edge_km * np.sqrt(self.rng.random(len(points)))
+        angle = self.rng.random(len(points)) * 2 * np.pi
+        d_lat = radius_km * np.cos(angle) / KM_PER_DEGREE
+        d_lng = (
+            radius_km
+            * np.sin(angle)
+            / (KM_PER_DEGREE * np.cos(np.radians(points[:, 0])))
+        )
+        return points + np.column_stack([d_lat, d_lng])
+
+    def sample_vehicle_types(self, n: int) -> List[str]:
+        picks = self.rng.choice(len(self.vehicle_types), n, p=self.vehicle_shares)
+        return [self.vehicle_types[i] for i in picks]
+
+    def fleet(self) -> List[SyntheticDriver]:
+        n = self.config.num_drivers
+        points = self.sample_points(n, self.config.driver_hotspot_bias)
+        available = self.rng.random(n) >= self.config.busy_fraction
+        return [
+            SyntheticDriver(
+                driver_id=i + 1,
+                latitude=float(lat),
+                longitude=float(lng),
+                vehicle_type=vehicle_type,
+                is_available=bool(is_available),
+            )
+            for i, ((lat, lng), vehicle_type, is_available) in enumerate(
+                zip(points, self.sample_vehicle_types(n), available)
+            )
+        ]
+
+    def bookings(self) -> List[SyntheticBooking]:
+        n = self.config.num_bookings
+        points = self.sample_points(n)
+        return [
+            SyntheticBooking(
+                id=i + 1,
+                pickup_latitude=float(lat),
+                pickup_longitude=float(lng),
+                vehicle_type=vehicle_type,
+            )
+            for i, ((lat, lng), vehicle_type) in enumerate(
+                zip(points, self.sample_vehicle_types(n))
+            )
+        ]
+
+    def move(self, drivers: List[SyntheticDriver]) -> List[SyntheticDriver]:
+        """
+        Relocate a random sample of drivers by up to about one cell.
+        """
+        n = min(self.config.moves_per_booking, len(drivers))
+        if not n:
+            return []
+        moved = [drivers[i] for i in self.rng.choice(len(drivers), n, replace=False)]
+        points = self.jitter(np.array([(d.latitude, d.longitude) for d in moved]))
+        for driver, (lat, lng) in zip(moved, points):
+            driver.latitude, driver.longitude = float(lat), float(lng)
+        return moved
@@ -0,0 +1,125 @@
+import asyncio
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.caching import cache
+from app.services.messaging.kafka_service import kafka_service
+from fakeredis.aioredis import FakeRedis
+
+
+class CountingRedis(FakeRedis):
+    """
+    In-memory Redis (with Lua, via fakeredis[lua]) that counts round trips:
+    one per command sent on its own and one per pipeline executed, however
+    many commands the pipeline holds.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("decode_responses", True)
+        super().__init__(**kwargs)
+        self.round_trips = 0
+        self.commands: Counter = Counter()
+
+    async def execute_command(self, *args, **options):
+        self.round_trips += 1
+        self.commands[str(args[0]).upper()] += 1
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+
+        async def counted_execute(raise_on_error: bool = True):
+            if pipe.command_stack:
+                self.round_trips += 1
+                for args, _ in pipe.command_stack:
+                    self.commands[str(args[0]).upper()] += 1
+            return await execute(raise_on_error)
+
+        pipe.execute = counted_execute
+        return pipe
+
+
+@dataclass
+class FakeRecord:
+    # The parts of an aiokafka ConsumerRecord the handlers read
+    topic: str
+    value: Any
+    key: Optional[bytes] = None
+
+
+class FakeProducer:
+    """
+    Stands in for the AIOKafkaProducer inside kafka_service. Messages are
+    held per topic until drain() hands them to the subscribed handlers, the
+    way the consumers would receive them.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, List[FakeRecord]] = defaultdict(list)
+        self.sent: Counter = Counter()
+        self._handlers: Dict[str, List[Callable]] = defaultdict(list)
+        self._batch_handlers: Dict[str, List[Callable]] = defaultdict(list)
+
+    def subscribe(self, topic: str, handler: Callable, batch: bool = False):
+        (self._batch_handlers if batch else self._handlers)[topic].append(handler)
+
+    async def send(self, topic, value, key: bytes = None):
+        self.pending[topic].append(FakeRecord(topic, value, key))
+        self.sent[topic] += 1
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def send_and_wait(self, topic, value, key: bytes = None):
+        await self.send(topic, value, key)
+
+    async def drain(self):
+        while any(self.pending.values()):
+            pending, self.pending = self.pending, defaultdict(list)
+            for topic, records in pending.items():
+                for handler in self._batch_handlers[topic]:
+                    await handler(records)
+                for handler in self._handlers[topic]:
+                    for record in records:
+                        await handler(record)
+
+
+class _FakeResult:
+    def __init__(self, row):
+        self._row = row
+
+    def scalar_one_or_none(self):
+        return self._row
+
+
+class FakeSession:
+    """
+    Just enough of an AsyncSession for find_nearest_driver's lookup of the
+    claimed driver by id.
+    """
+
+    def __init__(self, drivers: Dict[int, Any]):
+        self.drivers = drivers
+
+    async def execute(self, statement):
+        (driver_id,) = statement.compile().params.values()
+        return _FakeResult(self.drivers.get(int(driver_id)))
+
+
+@contextmanager
+def installed(redis: CountingRedis, producer: FakeProducer):
+    """
+    Point the process-wide Redis client and the Kafka producer at the fakes
+    for the duration of the block.
+    """
+    previous_redis, previous_producer = cache._redis_client, kafka_service.producer
+    cache._redis_client = redis
+    kafka_service.producer = producer
+    try:
+        yield
+    finally:
+        cache._redis_client = previous_redis
+        kafka_service.producer = previous_producer
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+from app.services.assignment.driver_claims import (release_claim,
+                                                   set_driver_availability)
+from app.services.assignment.matching import find_nearest_driver
+from app.services.messaging.kafka_service import KAFKA_TOPIC_DRIVER_LOCATIONS
+from app.services.tracking.driver_index_consumer import \
+    handle_driver_index_update
+from app.services.tracking.h3_index import driver_index
+from app.services.tracking.location_consumer import handle_location_batch
+from app.services.tracking.location_update import update_driver_locations
+from app.services.tracking.proximity import proximity_backend
+from app.services.tracking.tracking_service import TrackingService
+
+from .city import CityConfig, SyntheticCity, SyntheticDriver
+from .fakes import CountingRedis, FakeProducer, FakeSession, installed
+from .report import OperationStats
+
+
+class ScanCounter:
+    """
+    Counts the candidates returned by a lookup method while watched.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+
+    @contextmanager
+    def watch(self, obj, method: str):
+        original = getattr(obj, method)
+        if asyncio.iscoroutinefunction(original):
+
+            async def counted(*args, **kwargs):
+                result = await original(*args, **kwargs)
+                self.scanned += len(result)
+                return result
+
+        else:
+
+            def counted(*args, **kwargs):
+                result = original(*args, **kwargs)
+                self.scanned += len(result)
+                return result
+
+        setattr(obj, method, counted)
+        try:
+            yield self
+        finally:
+            delattr(obj, method)
+
+
+async def publish_locations(drivers: List[SyntheticDriver], producer: FakeProducer):
+    """
+    Send driver positions down the real ingestion path: the driver_locations
+    topic, then the Redis location consumer and the in-process index.
+    """
+    await update_driver_locations(
+        [
+            {
+                "driver_id": str(driver.driver_id),
+                "latitude": driver.latitude,
+                "longitude": driver.longitude,
+                "vehicle_type": driver.vehicle_type,
+            }
+            for driver in drivers
+        ]
+    )
+    await producer.drain()
+
+
+async def run(config: CityConfig) -> Dict[str, OperationStats]:
+    """
+    Seed a synthetic fleet, then match a stream of bookings against it while
+    part of the fleet keeps moving, timing find_nearest_driver and
+    get_nearby_drivers for every booking.
+    """
+    city = SyntheticCity(config)
+    fleet = city.fleet()
+    drivers = {driver.driver_id: driver for driver in fleet}
+    redis = CountingRedis()
+    producer = FakeProducer()
+    producer.subscribe(KAFKA_TOPIC_DRIVER_LOCATIONS, handle_location_batch, batch=True)
+    producer.subscribe(KAFKA_TOPIC_DRIVER_LOCATIONS, handle_driver_index_update)
+    tracking_service = TrackingService(manager=None)
+
+    matching = OperationStats("find_nearest_driver")
+    nearby = OperationStats("get_nearby_drivers")
+    # (booking number the trip ends at, driver_id, booking_id)
+    trips = deque()
+
+    with installed(redis, producer):
+        await publish_locations(fleet, producer)
+        for driver in fleet:
+            if not driver.is_available:
+                await set_driver_availability(driver.driver_id, False)
+
+        db = FakeSession(drivers)
+        for number, booking in enumerate(city.bookings()):
+            await publish_locations(city.move(fleet), producer)
+            while trips and trips[0][0] <= number:
+                _, driver_id, booking_id = trips.popleft()
+                await release_claim(driver_id, booking_id)
+
+            with ScanCounter().watch(proximity_backend, "find_candidates") as scan:
+                round_trips = redis.round_trips
+                start = time.perf_counter()
+                driver = await find_nearest_driver(booking, db)
+                matching.record(
+                    (time.perf_counter() - start) * 1000,
+                    scan.scanned,
+                    redis.round_trips - round_trips,
+                    hit=driver is not None,
+                )
+            if driver is not None:
+                trips.append(
+                    (number + config.trip_length, driver.driver_id, booking.id)
+                )
+
+            with ScanCounter().watch(driver_index, "drivers_in_cells") as scan:
+                round_trips = redis.round_trips
+                start = time.perf_counter()
+                result = await tracking_service.get_nearby_drivers(
+                    booking.pickup_latitude,
+                    booking.pickup_longitude,
+                    1,
+                    10,
+                    booking.vehicle_type,
+                )
+                nearby.record(
+                    (time.perf_counter() - start) * 1000,
+                    scan.scanned,
+                    redis.round_trips - round_trips,
+                    hit=bool(result["nearby_drivers"]),
+                )
+
+    return {stats.name: stats for stats in (matching, nearby)}
@@ -0,0 +1,93 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class OperationStats:
+    """
+    Per-call samples for one benchmarked operation.
+    """
+
+    name: str
+    latencies_ms: List[float] = field(default_factory=list)
+    candidates: List[int] = field(default_factory=list)
+    round_trips: List[int] = field(default_factory=list)
+    misses: int = 0
+
+    def record(
+        self, latency_ms: float, candidates: int, round_trips: int, hit: bool = True
+    ):
+        self.latencies_ms.append(latency_ms)
+        self.candidates.append(candidates)
+        self.round_trips.append(round_trips)
+        if not hit:
+            self.misses += 1
+
+    def summary(self) -> Dict[str, float]:
+        if not self.latencies_ms:
+            return {"calls": 0}
+        latencies = np.percentile(self.latencies_ms, PERCENTILES)
+        summary = {"calls": len(self.latencies_ms)}
+        for p, value in zip(PERCENTILES, latencies):
+            summary[f"p{p}_ms"] = round(float(value), 3)
+        summary["mean_candidates"] = round(float(np.mean(self.candidates)), 2)
+        summary["max_candidates"] = int(np.max(self.candidates))
+        summary["mean_round_trips"] = round(float(np.mean(self.round_trips)), 2)
+        summary["max_round_trips"] = int(np.max(self.round_trips))
+        summary["misses"] = self.misses
+        return summary
+
+
+def format_table(stats: List[OperationStats]) -> str:
+    columns = [
+        "calls",
+        "p50_ms",
+        "p95_ms",
+        "p99_ms",
+        "mean_candidates",
+        "mean_round_trips",
+        "max_round_trips",
+        "misses",
+    ]
+    rows = [["operation"] + columns]
+    for operation in stats:
+        summary = operation.summary()
+        rows.append([operation.name] + [str(summary.get(c, "-")) for c in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows
+    )
+
+
+def compare(
+    summaries: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """
+    Regressions of the current run against a saved one: p95/p99 latency or
+    mean round trips more than tolerance (a fraction) above the baseline.
+    """
+    regressions = []
+    for name, summary in summaries.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "p99_ms", "mean_round_trips"):
+            if metric not in summary or not previous.get(metric):
+                continue
+            if summary[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{name} {metric}: {summary[metric]} vs {previous[metric]}"
+                )
+    return regressions
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path) as f:
+        return json.load(f)["operations"]
@@ -0,0 +1,113 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiokafka import TopicPartition
+from aiokafka.partitioner import DefaultPartitioner
+from app.services.communication.assignment_delivery import (
+    ASSIGNMENTS, AssignmentDeliveryConsumer, partition_for_driver)
+from app.services.communication.websocket_service import ConnectionManager
+
+
+def make_record(driver_id, booking_id, published_at):
+    return SimpleNamespace(
+        value={
+            "driver_id": driver_id,
+            "message": {"type": "assignment", "data": {"booking_id": booking_id}},
+        },
+        timestamp=int(published_at * 1000),
+    )
+
+
+@pytest.fixture
+def delivery():
+    delivery = AssignmentDeliveryConsumer()
+    delivery.manager = MagicMock(active_drivers={"7": "sid-7"})
+    delivery.manager.deliver_local = AsyncMock(return_value=True)
+    return delivery
+
+
+def test_partition_matches_producer_partitioner():
+    partitions = list(range(12))
+    for driver_id in ("1", "42", "9001"):
+        expected = DefaultPartitioner()(driver_id.encode(), partitions, partitions)
+        assert partition_for_driver(driver_id, partitions) == expected
+
+
+@pytest.mark.asyncio
+async def test_only_local_drivers_are_delivered(delivery):
+    now = time.time()
+    await delivery.deliver_batch([make_record(7, 1, now), make_record(8, 2, now)])
+    delivery.manager.deliver_local.assert_awaited_once_with(
+        "driver", "7", "assignment", {"type": "assignment", "data": {"booking_id": 1}}
+    )
+    assert ("7", 1) in delivery._awaiting_ack
+
+
+@pytest.mark.asyncio
+async def test_raw_websocket_drivers_only_count_when_the_send_succeeds(delivery):
+    open_socket = MagicMock(send_json=AsyncMock())
+    closed_socket = MagicMock(send_json=AsyncMock(side_effect=RuntimeError("closed")))
+    delivery.manager = ConnectionManager()
+    delivery.manager.sio = MagicMock(emit=AsyncMock())
+    delivery.manager.active_drivers = {"7": open_socket, "8": closed_socket}
+    delivered = ASSIGNMENTS.labels(outcome="delivered")._value.get()
+    failed = ASSIGNMENTS.labels(outcome="failed")._value.get()
+
+    now = time.time()
+    await delivery.deliver_batch([make_record(7, 1, now), make_record(8, 2, now)])
+
+    open_socket.send_json.assert_awaited_once_with(
+        {"type": "assignment", "data": {"booking_id": 1}}
+    )
+    delivery.manager.sio.emit.assert_not_called()
+    assert ASSIGNMENTS.labels(outcome="delivered")._value.get() == delivered + 1
+    assert ASSIGNMENTS.labels(outcome="failed")._value.get() == failed + 1
+    assert list(delivery._awaiting_ack) == [("7", 1)]
+
+
+@pytest.mark.asyncio
+async def test_ack_clears_pending_assignment(delivery):
+    await delivery.deliver_batch([make_record(7, 1, time.time())])
+    delivery.record_ack("7", 1)
+    assert delivery._awaiting_ack == {}
+
+
+@pytest.mark.asyncio
+async def test_assignment_follows_local_drivers(delivery):
+    delivery.consumer = MagicMock()
+    delivery.consumer.partitions_for_topic.return_value = {0, 1, 2, 3}
+    delivery.consumer.offsets_for_times = AsyncMock(return_value={})
+    delivery.consumer.seek_to_end = AsyncMock()
+    await delivery.refresh_assignment()
+    assert delivery._assigned == {partition_for_driver("7", [0, 1, 2, 3])}
+    delivery.manager.active_drivers = {}
+    await delivery.refresh_assignment()
+    assert delivery._assigned == set()
+
+
+@pytest.mark.asyncio
+async def test_kept_partitions_resume_from_their_positions(delivery):
+    partitions = [0, 1, 2, 3]
+    first = next(
+        str(d) for d in range(100) if partition_for_driver(str(d), partitions) == 0
+    )
+    second = next(
+        str(d) for d in range(100) if partition_for_driver(str(d), partitions) == 1
+    )
+    delivery.manager.active_drivers = {first: "sid-1"}
+    delivery.consumer = MagicMock()
+    delivery.consumer.partitions_for_topic.return_value = set(partitions)
+    delivery.consumer.offsets_for_times = AsyncMock(return_value={})
+    delivery.consumer.seek_to_end = AsyncMock()
+    delivery.consumer.position = AsyncMock(return_value=42)
+    await delivery.refresh_assignment()
+    delivery.consumer.seek.assert_not_called()
+
+    delivery.manager.active_drivers = {first: "sid-1", second: "sid-2"}
+    await delivery.refresh_assignment()
+    kept = TopicPartition(delivery.topic, 0)
+    delivery.consumer.position.assert_awaited_once_with(kept)
+    delivery.consumer.seek.assert_called_once_with(kept, 42)
+    delivery.consumer.seek_to_end.assert_awaited_with(TopicPartition(delivery.topic, 1))
@@ -0,0 +1,77 @@
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.caching.auth_cache import AuthCache, Identity, token_digest
+
+DRIVER = Identity(
+    id=7, kind="driver", email="d@example.com", vehicle_type="van", is_available=True
+)
+
+
+@pytest.fixture
+def redis():
+    redis = AsyncMock()
+    redis.get.return_value = None
+    redis.pipeline = MagicMock(return_value=MagicMock(execute=AsyncMock()))
+    with patch(
+        "app.services.caching.auth_cache.get_redis_client",
+        new=AsyncMock(return_value=redis),
+    ):
+        yield redis
+
+
+def test_identity_reads_like_a_dict():
+    assert DRIVER["id"] == 7
+    assert DRIVER["vehicle_type"] == "van"
+    assert DRIVER.get("is_driver") is True
+    assert DRIVER.get("missing") is None
+    with pytest.raises(KeyError):
+        DRIVER["missing"]
+
+
+@pytest.mark.asyncio
+async def test_put_then_get_is_served_locally(redis):
+    cache = AuthCache()
+    await cache.put("token", DRIVER, time.time() + 600)
+    assert await cache.get("token", "driver") == DRIVER
+    assert await cache.get("token", "user") is None
+    redis.get.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_entries_do_not_outlive_the_token(redis):
+    cache = AuthCache(ttl_seconds=300)
+    await cache.put("expired", DRIVER, time.time() - 1)
+    assert await cache.get("expired", "driver") is None
+
+
+@pytest.mark.asyncio
+async def test_miss_falls_back_to_redis(redis):
+    cache = AuthCache()
+    redis.get.return_value = json.dumps(
+        {
+            "id": 7,
+            "kind": "driver",
+            "email": "d@example.com",
+            "role": None,
+            "vehicle_type": "van",
+            "is_available": True,
+            "expires_at": time.time() + 60,
+        }
+    )
+    assert await cache.get("token", "driver") == DRIVER
+    redis.get.assert_awaited_with(f"auth:token:{token_digest('token')}")
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_oldest_and_forget_drops_identity(redis):
+    cache = AuthCache(max_size=2)
+    user = Identity(id=1, kind="user")
+    for token in ("a", "b", "c"):
+        await cache.put(token, user, time.time() + 600)
+    assert len(cache._entries) == 2
+    cache.forget("user", 1)
+    assert len(cache._entries) == 0
+    assert cache._by_identity == {}
@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+from app.services.assignment import batch_matcher as batch_matcher_module
+from app.services.assignment.batch_matcher import (BatchMatcher, BatchResult,
+                                                   cost_matrix,
+                                                   solve_assignment)
+from app.utils.geo import haversine_km, haversine_matrix
+
+
+def test_haversine_matrix_matches_scalar_distance():
+    bookings = np.array([(37.7749, -122.4194), (37.8044, -122.2712)])
+    drivers = np.array([(37.7849, -122.4094), (37.7, -122.3), (37.8, -122.27)])
+    distances = haversine_matrix(bookings, drivers)
+    assert distances.shape == (2, 3)
+    for i, (lat1, lng1) in enumerate(bookings):
+        for j, (lat2, lng2) in enumerate(drivers):
+            assert distances[i, j] == pytest.approx(
+                haversine_km(lat1, lng1, lat2, lng2)
+            )
+
+
+def test_global_assignment_beats_greedy_order():
+    # Greedy in arrival order gives booking 0 driver 0 (1 km) and leaves
+    # booking 1 with driver 1 (10 km); the optimum costs 2 + 2
+    cost = np.array([[1.0, 2.0], [2.0, 10.0]])
+    pairs = solve_assignment(cost)
+    assert sorted(pairs) == [(0, 1), (1, 0)]
+
+
+def test_infeasible_pairs_are_left_unmatched():
+    bookings = np.array([(37.7749, -122.4194), (37.7749, -122.4194)])
+    drivers = np.array([(37.7750, -122.4195)])
+    compatible = np.array([[False], [True]])
+    cost = cost_matrix(haversine_matrix(bookings, drivers), compatible, 5.0)
+    assert solve_assignment(cost) == [(1, 0)]
+
+    far = haversine_matrix(bookings, np.array([(38.5, -121.5)]))
+    assert solve_assignment(cost_matrix(far, compatible, 5.0)) == []
+
+
+def test_scores_replace_distance_as_cost():
+    distances = np.array([[1.0, 2.0]])
+    compatible = np.ones((1, 2), dtype=bool)
+    scores = np.array([[0.5, 0.9]])
+    cost = cost_matrix(distances, compatible, 5.0, scores)
+    assert cost == pytest.approx(np.array([[0.5, 0.1]]))
+    assert solve_assignment(cost) == [(0, 1)]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_bookings_share_one_batch_and_unmatched_retry():
+    matcher = BatchMatcher(window_ms=10, max_attempts=2)
+    results = [
+        BatchResult(assigned={1: 11}, unmatched=[2]),
+        BatchResult(assigned={2: 12}),
+    ]
+    with patch.object(
+        matcher, "match_batch", AsyncMock(side_effect=results)
+    ) as match_batch:
+        assigned = await asyncio.gather(matcher.submit(1), matcher.submit(2))
+        await matcher.stop()
+
+    assert assigned == [11, 12]
+    assert match_batch.await_args_list[0].args == ([1, 2],)
+    assert match_batch.await_args_list[1].args == ([2],)
+
+
+@pytest.mark.asyncio
+async def test_skipped_and_exhausted_bookings_resolve_to_none():
+    matcher = BatchMatcher(window_ms=10, max_attempts=1)
+    result = BatchResult(skipped=[1], unmatched=[2])
+    with patch.object(matcher, "match_batch", AsyncMock(return_value=result)):
+        assigned = await asyncio.gather(matcher.submit(1), matcher.submit(2))
+        await matcher.stop()
+
+    assert assigned == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_candidates_are_pruned_to_the_best_per_booking():
+    def search(latitude, longitude, radius_km, vehicle_type):
+        # Ten drivers around each booking, nearest first
+        return [
+            (
+                SimpleNamespace(
+                    driver_id=str(int(latitude) * 100 + i),
+                    latitude=latitude,
+                    longitude=longitude,
+                    vehicle_type=vehicle_type,
+                ),
+                0.1 * (i + 1),
+            )
+            for i in range(10)
+        ]
+
+    matcher = BatchMatcher(candidates_per_booking=3)
+    bookings = [(1, "bike", 1.0, 0.0), (2, "bike", 2.0, 0.0)]
+    with patch.object(
+        batch_matcher_module.driver_index, "search", side_effect=search
+    ), patch.object(
+        batch_matcher_module,
+        "busy_drivers",
+        AsyncMock(return_value={"100"}),
+    ):
+        candidates = await matcher._available_candidates(bookings)
+
+    assert sorted(p.driver_id for p in candidates) == [
+        "101",
+        "102",
+        "103",
+        "200",
+        "201",
+        "202",
+    ]
+
+
+def mock_session(rows, fail_on_update=False):
+    db = MagicMock()
+    db.execute = AsyncMock(
+        side_effect=[rows, RuntimeError("deadlock")] if fail_on_update else [rows, None]
+    )
+    db.begin.return_value.__aenter__ = AsyncMock()
+    db.begin.return_value.__aexit__ = AsyncMock(return_value=False)
+    session = MagicMock()
+    session.__aenter__ = AsyncMock(return_value=db)
+    session.__aexit__ = AsyncMock(return_value=False)
+    return db, MagicMock(return_value=session)
+
+
+def driver(driver_id, latitude):
+    return SimpleNamespace(
+        driver_id=driver_id, latitude=latitude, longitude=0.0, vehicle_type="bike"
+    )
+
+
+@pytest.mark.asyncio
+async def test_drivers_claimed_elsewhere_send_their_bookings_back_to_retry():
+    rows = [(1, "bike", 1.0, 0.0), (2, "bike", 2.0, 0.0)]
+    db, session = mock_session(rows)
+    # Driver 21 was claimed by an offer between the busy check and the claim
+    claim = AsyncMock(return_value={1: 11})
+    matcher = BatchMatcher()
+    with patch.object(batch_matcher_module, "async_session", session), patch.object(
+        matcher,
+        "_available_candidates",
+        AsyncMock(return_value=[driver("11", 1.0), driver("21", 2.0)]),
+    ), patch.object(batch_matcher_module, "claim_drivers", claim), patch.object(
+        batch_matcher_module.auth_cache, "invalidate", AsyncMock()
+    ):
+        result = await matcher.match_batch([1, 2])
+
+    claim.assert_awaited_once_with({1: 11, 2: 21})
+    assert result.assigned == {1: 11}
+    assert result.unmatched == [2]
+    assert db.execute.await_args.args[1] == [{"b_id": 1, "d_id": 11}]
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_gives_its_claims_back():
+    db, session = mock_session([(1, "bike", 1.0, 0.0)], fail_on_update=True)
+    release = AsyncMock()
+    matcher = BatchMatcher()
+    with patch.object(batch_matcher_module, "async_session", session), patch.object(
+        matcher, "_available_candidates", AsyncMock(return_value=[driver("11", 1.0)])
+    ), patch.object(
+        batch_matcher_module, "claim_drivers", AsyncMock(return_value={1: 11})
+    ), patch.object(
+        batch_matcher_module, "release_claim", release
+    ):
+        with pytest.raises(RuntimeError):
+            await matcher.match_batch([1])
+
+    release.assert_awaited_once_with(11, 1)
@@ -0,0 +1,50 @@
+import numpy as np
+from app.utils.geo import haversine_km
+from benchmarks.city import CityConfig, SyntheticCity
+from benchmarks.report import OperationStats, compare
+
+
+def test_city_is_reproducible_for_a_seed():
+    config = CityConfig(num_drivers=50, num_bookings=20, radius_km=3, seed=7)
+    first, second = SyntheticCity(config), SyntheticCity(config)
+    assert first.fleet() == second.fleet()
+    assert first.bookings() == second.bookings()
+
+
+def test_bookings_cluster_around_hotspots():
+    config = CityConfig(
+        num_bookings=2000, radius_km=5, num_hotspots=1, hotspot_intensity=50
+    )
+    city = SyntheticCity(config)
+    hotspot = city.centers[np.argmax(city.hotspot_weight)]
+    near = sum(
+        haversine_km(b.pickup_latitude, b.pickup_longitude, *hotspot) < 1.5
+        for b in city.bookings()
+    )
+    # The 1.5 km disc is under a tenth of the city's area
+    assert near / config.num_bookings > 0.3
+    assert {b.vehicle_type for b in city.bookings()} <= set(config.vehicle_types)
+    lat, lng = config.center
+    assert all(
+        haversine_km(b.pickup_latitude, b.pickup_longitude, lat, lng) < 5.5
+        for b in city.bookings()
+    )
+
+
+def test_summary_percentiles_and_regressions():
+    stats = OperationStats("match")
+    for i in range(1, 101):
+        stats.record(float(i), candidates=4, round_trips=3, hit=i % 10 != 0)
+
+    summary = stats.summary()
+    assert summary["calls"] == 100
+    assert summary["p50_ms"] == 50.5
+    assert summary["p99_ms"] == 99.01
+    assert summary["mean_round_trips"] == 3
+    assert summary["misses"] == 10
+
+    baseline = {"match": {**summary, "p95_ms": 50.0}}
+    assert compare({"match": summary}, baseline, tolerance=0.2) == [
+        f"match p95_ms: {summary['p95_ms']} vs 50.0"
+    ]
+    assert compare({"match": summary}, {"match": summary}, tolerance=0.0) == []
@@ -0,0 +1,130 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.assignment import driver_claims
+from app.services.assignment.driver_claims import (AvailabilityWriteBehind,
+                                                   busy_drivers,
+                                                   claim_first_available,
+                                                   release_claim,
+                                                   set_driver_availability)
+
+
+@pytest.fixture
+def writer():
+    writer = AvailabilityWriteBehind(batch_size=2)
+    with patch.object(driver_claims, "availability_writer", writer):
+        yield writer
+
+
+def patch_script(result):
+    script = AsyncMock(return_value=result)
+    redis = MagicMock()
+    redis.pipeline.return_value = MagicMock(execute=AsyncMock())
+    return (
+        script,
+        patch.object(driver_claims, "get_redis_client", AsyncMock(return_value=redis)),
+        patch.object(driver_claims, "get_script", MagicMock(return_value=script)),
+    )
+
+
+@pytest.mark.asyncio
+async def test_claim_tries_ranked_drivers_in_one_call(writer):
+    script, redis_patch, script_patch = patch_script("3")
+    with redis_patch, script_patch:
+        claimed = await claim_first_available([5, 3, 9], booking_id=42)
+
+    assert claimed == 3
+    script.assert_awaited_once()
+    assert script.await_args.kwargs["args"][3:] == ["5", "3", "9"]
+    assert script.await_args.kwargs["args"][0] == 42
+    # The drivers table is only written behind the claim
+    assert writer._pending == {3: False}
+
+
+@pytest.mark.asyncio
+async def test_claim_conflict_on_every_driver_returns_none(writer):
+    script, redis_patch, script_patch = patch_script(None)
+    with redis_patch, script_patch:
+        assert await claim_first_available([5, 3], booking_id=42) is None
+        assert await claim_first_available([], booking_id=42) is None
+
+    script.assert_awaited_once()
+    assert len(writer) == 0
+
+
+@pytest.mark.asyncio
+async def test_release_only_writes_back_a_held_claim(writer):
+    script, redis_patch, script_patch = patch_script(0)
+    with redis_patch, script_patch:
+        assert await release_claim(3, booking_id=41) is False
+        assert len(writer) == 0
+        script.return_value = 1
+        assert await release_claim(3, booking_id=42) is True
+    assert writer._pending == {3: True}
+
+
+@pytest.mark.asyncio
+async def test_write_behind_coalesces_per_driver_and_flushes_per_value():
+    writer = AvailabilityWriteBehind()
+    writer.set(1, False)
+    writer.set(2, False)
+    writer.set(1, True)
+
+    db = AsyncMock()
+    session = MagicMock()
+    session.return_value.__aenter__ = AsyncMock(return_value=db)
+    session.return_value.__aexit__ = AsyncMock(return_value=False)
+    with patch.object(driver_claims, "async_session", session), patch.object(
+        driver_claims, "update", MagicMock()
+    ) as update, patch.object(driver_claims, "Driver", MagicMock()) as driver:
+        await writer.flush()
+
+    assert db.execute.await_count == 2
+    assert [call.args[0] for call in driver.id.in_.call_args_list] == [[2], [1]]
+    update.return_value.where.return_value.values.assert_any_call(is_available=False)
+    update.return_value.where.return_value.values.assert_any_call(is_available=True)
+    db.commit.assert_awaited_once()
+    assert len(writer) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_without_overwriting_newer_values():
+    writer = AvailabilityWriteBehind()
+    writer.set(1, False)
+    writer.set(2, False)
+
+    def fail():
+        # A newer change arrives while the failing batch is in flight
+        writer.set(2, True)
+        raise ConnectionError("database unavailable")
+
+    with patch.object(driver_claims, "async_session", MagicMock(side_effect=fail)):
+        await writer.flush()
+
+    assert writer._pending == {1: False, 2: True}
+
+
+@pytest.mark.asyncio
+async def test_reported_availability_moves_driver_between_partitions():
+    script, redis_patch, script_patch = patch_script(1)
+    with redis_patch as get_redis_client, script_patch:
+        await set_driver_availability(7, False)
+        await set_driver_availability(7, True)
+
+    pipe = get_redis_client.return_value.pipeline.return_value
+    assert pipe.execute.await_count == 2
+    assert [call.kwargs["args"][1] for call in script.await_args_list] == [
+        "False",
+        "True",
+    ]
+    assert script.await_args.kwargs["keys"][2] == "drivers:busy"
+    assert script.await_args.kwargs["client"] is pipe
+
+
+@pytest.mark.asyncio
+async def test_busy_drivers_is_one_round_trip():
+    redis = MagicMock(smismember=AsyncMock(return_value=[1, 0, 1]))
+    with patch.object(driver_claims, "get_redis_client", AsyncMock(return_value=redis)):
+        assert await busy_drivers(["1", "2", "3"]) == {"1", "3"}
+        assert await busy_drivers([]) == set()
+    redis.smismember.assert_awaited_once_with("drivers:busy", ["1", "2", "3"])
@@ -0,0 +1,76 @@
+import time
+
+import h3
+import pytest
+from app.services.tracking.h3_index import ShardedH3Index
+
+
+@pytest.fixture
+def driver_index():
+    return ShardedH3Index(num_shards=4)
+
+
+def test_upsert_adds_driver_to_cell(driver_index):
+    moved = driver_index.upsert("1", 37.7749, -122.4194, "van")
+    cell = h3.geo_to_h3(37.7749, -122.4194, 9)
+    assert moved is True
+    assert driver_index.drivers_in_cell(cell) == {"1"}
+    assert driver_index.drivers_in_cell(cell, "van") == {"1"}
+    assert driver_index.drivers_in_cell(cell, "truck") == set()
+
+
+def test_move_between_cells_removes_old_membership(driver_index):
+    driver_index.upsert("1", 37.7749, -122.4194, "van")
+    old_cell = h3.geo_to_h3(37.7749, -122.4194, 9)
+    moved = driver_index.upsert("1", 37.8044, -122.2712, "van")
+    new_cell = h3.geo_to_h3(37.8044, -122.2712, 9)
+    assert moved is True
+    assert driver_index.drivers_in_cell(old_cell) == set()
+    assert driver_index.drivers_in_cell(new_cell, "van") == {"1"}
+    assert len(driver_index) == 1
+
+
+def test_out_of_order_update_is_ignored(driver_index):
+    now = time.time()
+    driver_index.upsert("1", 37.7749, -122.4194, "van", timestamp=now)
+    driver_index.upsert("1", 37.8044, -122.2712, "van", timestamp=now - 10)
+    assert driver_index.get("1").latitude == 37.7749
+
+
+def test_drivers_in_cells_filters_by_vehicle_type(driver_index):
+    driver_index.upsert("1", 37.7749, -122.4194, "van")
+    driver_index.upsert("2", 37.7750, -122.4195, "truck")
+    cells = h3.k_ring(h3.geo_to_h3(37.7749, -122.4194, 9), 1)
+    positions = driver_index.drivers_in_cells(cells, "truck")
+    assert [position.driver_id for position in positions] == ["2"]
+
+
+def test_evict_stale_drops_silent_drivers(driver_index):
+    driver_index.upsert("1", 37.7749, -122.4194, "van", timestamp=time.time() - 600)
+    driver_index.upsert("2", 37.7750, -122.4195, "van")
+    assert driver_index.evict_stale(300) == 1
+    assert driver_index.get("1") is None
+    assert driver_index.get("2") is not None
+
+
+def test_parent_counts_follow_moves(driver_index):
+    driver_index.upsert("1", 37.7749, -122.4194, "van")
+    parent = h3.h3_to_parent(h3.geo_to_h3(37.7749, -122.4194, 9), 7)
+    assert driver_index.count_in_cell(parent) == 1
+    assert driver_index.count_in_cell(parent, "van") == 1
+    driver_index.upsert("1", 40.7128, -74.0060, "van")
+    assert driver_index.count_in_cell(parent) == 0
+
+
+def test_search_returns_drivers_within_radius_nearest_first(driver_index):
+    driver_index.upsert("near", 37.7760, -122.4194, "van")
+    driver_index.upsert("far", 37.8044, -122.2712, "van")
+    driver_index.upsert("truck", 37.7750, -122.4195, "truck")
+    results = driver_index.search(37.7749, -122.4194, 5, "van")
+    assert [position.driver_id for position, _ in results] == ["near"]
+    results = driver_index.search(37.7749, -122.4194, 20)
+    assert [position.driver_id for position, _ in results] == [
+        "truck",
+        "near",
+        "far",
+    ]
@@ -0,0 +1,103 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.services.tracking.driver_tracking import DriverTracker
+
+
+@pytest.mark.asyncio
+async def test_every_point_of_a_burst_is_kept_in_order():
+    tracker = DriverTracker(batch_size=10, linger_ms=1000)
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        new_callable=AsyncMock,
+    ) as mock_update:
+        await tracker.add_location_update("1", 37.0, -122.0, "van")
+        await tracker.add_location_update("1", 37.1, -122.1, "van")
+        await tracker.flush()
+        [updates] = mock_update.call_args.args
+        assert [update["latitude"] for update in updates] == [37.0, 37.1]
+
+
+@pytest.mark.asyncio
+async def test_flush_is_split_at_batch_size():
+    tracker = DriverTracker(batch_size=2, linger_ms=1000)
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        new_callable=AsyncMock,
+    ) as mock_update:
+        for driver_id in "12345":
+            await tracker.add_location_update(driver_id, 37.0, -122.0, "van")
+        await tracker.flush()
+        assert [len(call.args[0]) for call in mock_update.await_args_list] == [2, 2, 1]
+        assert tracker.location_update_queue == []
+
+
+@pytest.mark.asyncio
+async def test_stop_finishes_a_flush_in_progress():
+    tracker = DriverTracker(batch_size=1, linger_ms=10000)
+    published = []
+
+    async def slow_update(updates):
+        await asyncio.sleep(0.02)
+        published.extend(update["driver_id"] for update in updates)
+
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        side_effect=slow_update,
+    ):
+        await tracker.start()
+        await tracker.add_location_update("1", 37.0, -122.0, "van")
+        await asyncio.sleep(0.005)
+        await tracker.add_location_update("2", 37.0, -122.0, "van")
+        await tracker.stop()
+        assert published == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_flushes_when_batch_is_full():
+    tracker = DriverTracker(batch_size=2, linger_ms=10000)
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        new_callable=AsyncMock,
+    ) as mock_update:
+        await tracker.start()
+        await tracker.add_location_update("1", 37.0, -122.0, "van")
+        await tracker.add_location_update("2", 37.0, -122.0, "van")
+        await asyncio.sleep(0.05)
+        assert mock_update.await_count == 1
+        await tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_flushes_after_linger():
+    tracker = DriverTracker(batch_size=100, linger_ms=20)
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        new_callable=AsyncMock,
+    ) as mock_update:
+        await tracker.start()
+        await tracker.add_location_update("1", 37.0, -122.0, "van")
+        await asyncio.sleep(0.005)
+        assert mock_update.await_count == 0
+        await asyncio.sleep(0.05)
+        assert mock_update.await_count == 1
+        await tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_backpressure_waits_for_flush():
+    tracker = DriverTracker(batch_size=100, linger_ms=10000, max_pending=1)
+    with patch(
+        "app.services.tracking.driver_tracking.update_driver_locations",
+        new_callable=AsyncMock,
+    ) as mock_update:
+        await tracker.start()
+        await tracker.add_location_update("1", 37.0, -122.0, "van")
+        await asyncio.wait_for(
+            tracker.add_location_update("2", 37.0, -122.0, "van"), timeout=1
+        )
+        assert mock_update.await_count == 1
+        assert [u["driver_id"] for u in tracker.location_update_queue] == ["2"]
+        await tracker.stop()
+        assert mock_update.await_count == 2
@@ -0,0 +1,84 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import h3
+import pytest
+from app.services.communication.notification import (notify_drivers_near,
+                                                     notify_nearby_drivers)
+from app.services.communication.presence import presence_registry
+from app.services.communication.websocket_service import (ConnectionManager,
+                                                          hex_room, manager)
+
+
+@pytest.fixture
+def connection_manager():
+    connection_manager = ConnectionManager()
+    connection_manager.sio = MagicMock()
+    connection_manager.active_drivers["7"] = "sid-7"
+    return connection_manager
+
+
+@pytest.mark.asyncio
+async def test_driver_moves_between_hex_rooms(connection_manager):
+    sio = connection_manager.sio
+    await connection_manager.update_driver_room("7", 37.7749, -122.4194)
+    first = hex_room(h3.geo_to_h3(37.7749, -122.4194, 8))
+    sio.enter_room.assert_called_once_with("sid-7", first, namespace="/")
+
+    await connection_manager.update_driver_room("7", 37.7749, -122.4194)
+    assert sio.enter_room.call_count == 1
+
+    await connection_manager.update_driver_room("7", 37.8044, -122.2712)
+    sio.leave_room.assert_called_once_with("sid-7", first, namespace="/")
+    assert connection_manager.driver_rooms["7"] == hex_room(
+        h3.geo_to_h3(37.8044, -122.2712, 8)
+    )
+
+
+@pytest.mark.asyncio
+async def test_new_booking_is_broadcast_once_to_the_whole_ring():
+    with patch.object(presence_registry, "broadcast", AsyncMock()) as broadcast:
+        await notify_drivers_near(42, 37.7749, -122.4194, ring_size=1)
+        broadcast.assert_awaited_once()
+        rooms, event, message = broadcast.await_args.args
+        assert event == "new_booking"
+        assert message["data"]["booking_id"] == 42
+        assert len(rooms) == 7
+        assert hex_room(h3.geo_to_h3(37.7749, -122.4194, 8)) in rooms
+
+
+@pytest.mark.asyncio
+async def test_nearby_driver_ids_share_one_emit():
+    with patch.object(manager, "sio", MagicMock(emit=AsyncMock())) as sio:
+        await notify_nearby_drivers(42, [1, 2])
+        sio.emit.assert_awaited_once()
+        assert sio.emit.await_args.kwargs["room"] == ["driver_1", "driver_2"]
+
+
+@pytest.mark.asyncio
+async def test_raw_websocket_sessions_are_sent_to_directly(connection_manager):
+    websocket = MagicMock(send_json=AsyncMock())
+    connection_manager.active_drivers["8"] = websocket
+    message = {"data": {"booking_id": 42}}
+
+    assert await connection_manager.deliver_local("driver", "8", "assignment", message)
+    websocket.send_json.assert_awaited_once_with(
+        {"type": "assignment", "data": {"booking_id": 42}}
+    )
+    connection_manager.sio.emit.assert_not_called()
+
+    websocket.send_json.side_effect = RuntimeError("socket closed")
+    assert not await connection_manager.deliver_local(
+        "driver", "8", "assignment", message
+    )
+
+
+@pytest.mark.asyncio
+async def test_stale_disconnect_keeps_the_newer_session(connection_manager):
+    with patch.object(presence_registry, "unregister", AsyncMock()) as unregister:
+        await connection_manager.disconnect_driver("7", "sid-old")
+        assert connection_manager.active_drivers["7"] == "sid-7"
+        unregister.assert_not_awaited()
+
+        await connection_manager.disconnect_driver("7", "sid-7")
+        assert "7" not in connection_manager.active_drivers
+        unregister.assert_awaited_once_with("driver", "7")
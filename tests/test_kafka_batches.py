@@ -0,0 +1,179 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from aiokafka.structs import ConsumerRecord, TopicPartition
+from app.config import settings
+from app.services.messaging import kafka_service as kafka_module
+from app.services.messaging.kafka_service import KafkaService
+
+TOPIC = "driver_locations"
+
+
+def record(offset, value):
+    return ConsumerRecord(
+        topic=TOPIC,
+        partition=0,
+        offset=offset,
+        timestamp=0,
+        timestamp_type=0,
+        key=None,
+        value=value if isinstance(value, bytes) else json.dumps(value).encode(),
+        checksum=None,
+        serialized_key_size=0,
+        serialized_value_size=0,
+        headers=(),
+    )
+
+
+class FakeConsumer:
+    """
+    Hands out the given batches, then blocks the consumer loop for good.
+    """
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.commits = 0
+        self.committed = []
+        self.stopped = False
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.stopped = True
+
+    async def getmany(self, timeout_ms, max_records):
+        if self.batches:
+            return {TopicPartition(TOPIC, 0): self.batches.pop(0)}
+        if self.commits:
+            raise asyncio.CancelledError
+        return {}
+
+    async def commit(self, offsets=None):
+        self.commits += 1
+        self.committed.append(offsets)
+
+
+@pytest.fixture
+def service():
+    service = KafkaService.__new__(KafkaService)
+    service.consumers = set()
+    service.send_message = AsyncMock()
+    with patch.object(settings, "KAFKA_BATCH_RETRY_BACKOFF_MS", 0):
+        yield service
+
+
+def dead_lettered(service):
+    return [call.args[1]["offset"] for call in service.send_message.await_args_list]
+
+
+@pytest.mark.asyncio
+async def test_malformed_record_is_dead_lettered_and_batch_committed(service):
+    consumer = FakeConsumer([[record(0, {"driver_id": 1}), record(1, b"{oops")]])
+    handled = []
+
+    async def handler(batch):
+        handled.extend(message.value for message in batch)
+
+    with patch.object(kafka_module, "AIOKafkaConsumer", return_value=consumer):
+        with pytest.raises(asyncio.CancelledError):
+            await service.consume_batches(TOPIC, handler, linger_ms=1)
+
+    assert handled == [{"driver_id": 1}]
+    assert service.send_message.await_args.args[0] == f"{TOPIC}_dead_letter"
+    assert dead_lettered(service) == [1]
+    assert consumer.commits == 1 and consumer.stopped
+
+
+@pytest.mark.asyncio
+async def test_record_that_never_succeeds_is_isolated_and_dead_lettered(service):
+    handled = []
+
+    async def handler(batch):
+        if any(message.value["driver_id"] == 3 for message in batch):
+            raise KeyError("latitude")
+        handled.extend(message.value["driver_id"] for message in batch)
+
+    batch = await service.decode_batch(
+        TOPIC, [record(i, {"driver_id": i}) for i in range(6)]
+    )
+    await service.handle_batch(TOPIC, batch, handler)
+
+    assert sorted(handled) == [0, 1, 2, 4, 5]
+    assert dead_lettered(service) == [3]
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_without_dead_lettering(service):
+    handler = AsyncMock(
+        side_effect=[ConnectionError("redis down")]
+        * (settings.KAFKA_BATCH_MAX_ATTEMPTS + 2)
+        + [None]
+    )
+    batch = await service.decode_batch(TOPIC, [record(0, {"driver_id": 1})])
+    await service.handle_batch(TOPIC, batch, handler)
+
+    assert handler.await_count == settings.KAFKA_BATCH_MAX_ATTEMPTS + 3
+    service.send_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_offsets_are_not_committed_while_the_batch_fails(service):
+    consumer = FakeConsumer([[record(0, {"driver_id": 1})]])
+    handler = AsyncMock(side_effect=ConnectionError("redis down"))
+
+    with patch.object(kafka_module, "AIOKafkaConsumer", return_value=consumer):
+        task = asyncio.create_task(service.consume_batches(TOPIC, handler, linger_ms=1))
+        for _ in range(20):
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert handler.await_count > 1
+    assert consumer.commits == 0 and consumer.stopped
+
+
+@pytest.mark.asyncio
+async def test_commits_only_the_offsets_the_handler_reports_as_safe(service):
+    consumer = FakeConsumer(
+        [[record(0, {"driver_id": 1}), record(1, {"driver_id": 2})]]
+    )
+    safe = {TopicPartition(TOPIC, 0): 1}
+
+    with patch.object(kafka_module, "AIOKafkaConsumer", return_value=consumer):
+        with pytest.raises(asyncio.CancelledError):
+            await service.consume_batches(
+                TOPIC, AsyncMock(), linger_ms=1, committable_offsets=lambda: safe
+            )
+
+    assert consumer.committed == [safe]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_consumers_each_poll_and_commit_their_own(service):
+    first = FakeConsumer([[record(0, {"driver_id": 1})]])
+    second = FakeConsumer(
+        [[record(0, {"driver_id": 2})], [record(1, {"driver_id": 3})]]
+    )
+    handled = []
+
+    async def handler(batch):
+        handled.extend(message.value["driver_id"] for message in batch)
+        # Let the other consumer start while this one is mid-batch
+        await asyncio.sleep(0)
+
+    with patch.object(kafka_module, "AIOKafkaConsumer", side_effect=[first, second]):
+        results = await asyncio.gather(
+            service.consume_batches(TOPIC, handler, linger_ms=1),
+            service.consume_batches("other", handler, linger_ms=1),
+            return_exceptions=True,
+        )
+
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert sorted(handled) == [1, 2, 3]
+    assert first.commits == 1 and second.commits == 2
+    assert first.stopped and second.stopped
+    assert service.consumers == set()
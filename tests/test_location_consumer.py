@@ -0,0 +1,45 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.services.communication.pubsub_multiplexer import \
+    DRIVER_LOCATIONS_CHANNEL
+from app.services.tracking import location_consumer
+from fakeredis.aioredis import FakeRedis
+
+
+def location(driver_id, latitude=37.7749, timestamp=1700000000):
+    return SimpleNamespace(
+        value={
+            "driver_id": driver_id,
+            "latitude": latitude,
+            "longitude": -122.4194,
+            "vehicle_type": "van",
+            "timestamp": timestamp,
+            "received_at": timestamp,
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_batch_writes_and_publishes_every_driver():
+    redis = FakeRedis(decode_responses=True)
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(DRIVER_LOCATIONS_CHANNEL)
+    await pubsub.get_message(timeout=1)  # subscribe confirmation
+
+    with patch.object(
+        location_consumer, "get_redis_client", AsyncMock(return_value=redis)
+    ):
+        await location_consumer.handle_location_batch(
+            [location("1"), location("2"), location("1", latitude=37.78), location("3")]
+        )
+
+    message = await pubsub.get_message(timeout=1)
+    published = json.loads(message["data"])
+    assert [update["driver_id"] for update in published] == ["1", "2", "3"]
+    assert published[0]["latitude"] == 37.78
+    assert await pubsub.get_message(timeout=0.1) is None
+    for driver_id in "123":
+        assert await redis.exists(f"driver:location:{driver_id}")
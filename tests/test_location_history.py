@@ -0,0 +1,111 @@
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.services.tracking import location_history as history_module
+from app.services.tracking.location_history import (LocationHistoryBuffer,
+                                                    decode_points, downsample,
+                                                    encode_points,
+                                                    persist_chunks, quantize)
+
+
+def test_encode_round_trips_quantized_points():
+    points = [
+        quantize(37.77490, -122.41940, 1700000000),
+        quantize(37.77512, -122.41921, 1700000004),
+        quantize(37.77498, -122.41960, 1700000009),
+        quantize(-33.86882, 151.20930, 1700000012),
+    ]
+    decoded = decode_points(encode_points(points))
+    assert [quantize(*point) for point in decoded] == points
+
+
+def test_encoding_is_compact_for_a_moving_driver():
+    points = [
+        quantize(37.7749 + i * 0.0001, -122.4194 - i * 0.00005, 1700000000 + i * 4)
+        for i in range(240)
+    ]
+    encoded = encode_points(points)
+    assert len(encoded) < len(points) * 8
+    assert len(decode_points(encoded)) == 240
+
+
+def test_buffer_drains_full_and_aged_drivers():
+    buffer = LocationHistoryBuffer(buffer_points=10, chunk_points=3, chunk_seconds=60)
+    for i in range(3):
+        buffer.append(1, 37.7749 + i * 0.001, -122.4194, 1000 + i)
+    buffer.append(2, 37.7749, -122.4194, 1000)
+    ready = {chunk.driver_id: chunk.points for chunk in buffer.drain_ready(now=1010)}
+    assert list(ready) == [1]
+    assert len(ready[1]) == 3
+    ready = {chunk.driver_id: chunk.points for chunk in buffer.drain_ready(now=1060)}
+    assert list(ready) == [2]
+
+
+def test_buffer_skips_repeated_points_and_bounds_memory():
+    buffer = LocationHistoryBuffer(buffer_points=5, chunk_points=100)
+    buffer.append(1, 37.7749, -122.4194, 1000)
+    buffer.append(1, 37.7749, -122.4194, 1000)
+    for i in range(10):
+        buffer.append(1, 37.7749 + i * 0.001, -122.4194, 1001 + i)
+    (chunk,) = buffer.drain_ready(force=True)
+    assert chunk.driver_id == 1
+    assert [point[2] for point in chunk.points] == [1006, 1007, 1008, 1009, 1010]
+
+
+def test_quantize_accepts_milliseconds_and_rejects_garbage():
+    assert quantize(37.7749, -122.4194, 1700000000123)[2] == 1700000000
+    with pytest.raises(ValueError):
+        quantize(37.7749, -122.4194, 1e300)
+
+
+def test_offsets_are_held_back_until_points_are_saved():
+    buffer = LocationHistoryBuffer(chunk_points=2, chunk_seconds=60)
+    buffer.append(1, 37.7749, -122.4194, 1000, source="p0", offset=10)
+    buffer.append(2, 37.7749, -122.4194, 1000, source="p0", offset=11)
+    buffer.append(1, 37.7759, -122.4194, 1001, source="p0", offset=12)
+    buffer.append(3, 37.7749, -122.4194, 1000, source="p1", offset=5)
+    assert buffer.committable_offsets() == {"p0": 10, "p1": 5}
+
+    (chunk,) = buffer.drain_ready(now=1010)
+    assert chunk.driver_id == 1 and chunk.offsets == {"p0": 10}
+    assert buffer.committable_offsets() == {"p0": 10, "p1": 5}
+    buffer.saved([chunk])
+    assert buffer.committable_offsets() == {"p0": 11, "p1": 5}
+
+    buffer.saved(buffer.drain_ready(force=True))
+    assert buffer.committable_offsets() == {"p0": 13, "p1": 6}
+
+
+@pytest.mark.asyncio
+async def test_failed_chunks_are_retried_and_hold_back_offsets():
+    buffer = LocationHistoryBuffer(chunk_points=1, retry_seconds=30, max_attempts=2)
+    buffer.append(1, 37.7749, -122.4194, 1000, source="p0", offset=7)
+    buffer.append(2, 37.7749, -122.4194, 1000, source="p0", offset=8)
+
+    async def save(chunks):
+        if any(chunk.driver_id == 1 for chunk in chunks):
+            raise ConnectionError("database down")
+
+    with patch.object(history_module, "save_chunks", AsyncMock(side_effect=save)):
+        await persist_chunks(buffer, buffer.drain_ready(now=1000))
+        # Driver 2 was saved on its own, driver 1 waits for a retry
+        assert buffer.committable_offsets() == {"p0": 7}
+        assert buffer.drain_ready() == []
+
+        (retry,) = buffer.drain_ready(now=time.time() + 30)
+        assert retry.driver_id == 1
+        await persist_chunks(buffer, [retry])
+
+    # Out of attempts: dropped, no longer holding back the offset
+    assert buffer.drain_ready(force=True) == []
+    assert buffer.committable_offsets() == {"p0": 9}
+
+
+def test_downsample_keeps_endpoints():
+    points = [(37.0, -122.0, t) for t in range(100)]
+    thinned = downsample(points, min_interval_seconds=30)
+    assert [point[2] for point in thinned] == [0, 30, 60, 90, 99]
+    strided = downsample(points, max_points=5)
+    assert len(strided) == 5
+    assert strided[0] == points[0] and strided[-1] == points[-1]
@@ -0,0 +1,168 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from app.services.assignment import driver_claims
+from app.services.assignment.driver_claims import (AvailabilityWriteBehind,
+                                                   claim_drivers,
+                                                   claim_first_available,
+                                                   release_claim,
+                                                   set_driver_availability)
+from app.services.tracking.location_scripts import (ACCEPT_OFFER_SCRIPT,
+                                                    DRIVER_BUSY_KEY,
+                                                    DRIVER_CELLS_KEY,
+                                                    DRIVER_GEO_TYPES_KEY,
+                                                    DRIVER_LAST_SEEN_KEY,
+                                                    SWEEP_STALE_DRIVERS_SCRIPT,
+                                                    get_script)
+from app.services.tracking.proximity import (GeoProximityBackend,
+                                             H3SetProximityBackend)
+from fakeredis.aioredis import FakeRedis
+
+CELL_A = "8928308280fffff"
+CELL_B = "8928308280bffff"
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis(decode_responses=True)
+
+
+async def move(redis, driver_id, h3_index, vehicle_type="van", timestamp=1000.0):
+    pipe = redis.pipeline(transaction=False)
+    for backend in (H3SetProximityBackend(), GeoProximityBackend()):
+        await backend.queue_update(
+            pipe, driver_id, 37.77, -122.41, h3_index, vehicle_type, timestamp
+        )
+    return (await pipe.execute())[0]
+
+
+async def sweep(redis, cutoff, limit=100):
+    script = get_script(redis, SWEEP_STALE_DRIVERS_SCRIPT)
+    return await script(
+        keys=[DRIVER_LAST_SEEN_KEY, DRIVER_CELLS_KEY, DRIVER_GEO_TYPES_KEY],
+        args=[cutoff, limit],
+        client=redis,
+    )
+
+
+@pytest.mark.asyncio
+async def test_move_leaves_previous_cell(redis):
+    assert await move(redis, 7, CELL_A) == 1
+    assert await move(redis, 7, CELL_A, timestamp=1010.0) == 0
+    assert await move(redis, 7, CELL_B, timestamp=1020.0) == 1
+
+    assert await redis.smembers(f"drivers:{CELL_A}:van") == set()
+    assert await redis.smembers(f"drivers:{CELL_B}:van") == {"7"}
+    assert await redis.hget(DRIVER_CELLS_KEY, "7") == f"{CELL_B}|van"
+    assert await redis.get("driver:h3:7") == CELL_B
+    assert await redis.zscore(DRIVER_LAST_SEEN_KEY, "7") == 1020.0
+
+
+@pytest.mark.asyncio
+async def test_busy_driver_moves_within_busy_partition(redis):
+    await move(redis, 7, CELL_A)
+    await redis.sadd(DRIVER_BUSY_KEY, "7")
+    await move(redis, 7, CELL_B)
+
+    assert await redis.smembers(f"drivers:{CELL_B}:van") == set()
+    assert await redis.smembers(f"drivers:busy:{CELL_B}:van") == {"7"}
+    assert await redis.zscore("drivers:geo:van", "7") is None
+    assert await redis.zscore("drivers:geo:busy:van", "7") is not None
+
+
+@pytest.mark.asyncio
+async def test_vehicle_type_change_leaves_previous_type_sets(redis):
+    await move(redis, 7, CELL_A, vehicle_type="van")
+    await move(redis, 7, CELL_A, vehicle_type="truck")
+
+    assert await redis.smembers(f"drivers:{CELL_A}:van") == set()
+    assert await redis.smembers(f"drivers:{CELL_A}:truck") == {"7"}
+    assert await redis.zscore("drivers:geo:van", "7") is None
+    assert await redis.zscore("drivers:geo:truck", "7") is not None
+    assert await redis.hget(DRIVER_GEO_TYPES_KEY, "7") == "truck"
+
+
+@pytest.mark.asyncio
+async def test_sweep_evicts_only_stale_drivers(redis):
+    await move(redis, 1, CELL_A, timestamp=1000.0)
+    await move(redis, 2, CELL_A, vehicle_type="truck", timestamp=1000.0)
+    await redis.sadd(DRIVER_BUSY_KEY, "2")
+    await move(redis, 2, CELL_B, vehicle_type="truck", timestamp=1001.0)
+    await move(redis, 3, CELL_A, timestamp=2000.0)
+
+    assert await sweep(redis, cutoff=1500.0, limit=1) == 1
+    assert await sweep(redis, cutoff=1500.0) == 1
+    assert await sweep(redis, cutoff=1500.0) == 0
+
+    assert await redis.smembers(f"drivers:{CELL_A}:van") == {"3"}
+    assert await redis.smembers(f"drivers:busy:{CELL_B}:truck") == set()
+    assert await redis.zrange("drivers:geo:van", 0, -1) == ["3"]
+    assert await redis.zcard("drivers:geo:busy:truck") == 0
+    assert await redis.hkeys(DRIVER_CELLS_KEY) == ["3"]
+    assert await redis.hkeys(DRIVER_GEO_TYPES_KEY) == ["3"]
+    assert await redis.zrange(DRIVER_LAST_SEEN_KEY, 0, -1) == ["3"]
+
+
+@pytest.mark.asyncio
+async def test_reported_availability_never_frees_a_claimed_driver(redis):
+    await move(redis, 7, CELL_A)
+    with patch.object(
+        driver_claims, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(driver_claims, "availability_writer", AvailabilityWriteBehind()):
+        assert await claim_first_available([7], booking_id=42) == 7
+        # A socket's snapshot from before the trip says it is available
+        await set_driver_availability(7, True)
+
+        assert await redis.get("driver:claim:7") == "42"
+        assert await redis.sismember(DRIVER_BUSY_KEY, "7")
+        assert await redis.smembers(f"drivers:{CELL_A}:van") == set()
+        assert await claim_first_available([7], booking_id=43) is None
+
+        assert await release_claim(7, booking_id=42)
+        assert not await redis.sismember(DRIVER_BUSY_KEY, "7")
+        assert await redis.smembers(f"drivers:{CELL_A}:van") == {"7"}
+        assert await redis.zscore("drivers:geo:van", "7") is not None
+
+
+@pytest.mark.asyncio
+async def test_accepting_consumes_the_winners_offer(redis):
+    await move(redis, 7, CELL_A)
+    await redis.sadd("offer:42:drivers", 7, 8)
+    accept = get_script(redis, ACCEPT_OFFER_SCRIPT)
+
+    async def answer(driver_id):
+        return await accept(
+            keys=[
+                "offer:42:drivers",
+                "offer:42:winner",
+                DRIVER_CELLS_KEY,
+                DRIVER_BUSY_KEY,
+            ],
+            args=[driver_id, 42, 7200, 3600],
+            client=redis,
+        )
+
+    assert await answer(7) == 1
+    assert await answer(8) == 0
+    # The winner's offer timeout finds nothing left to expire
+    assert await redis.smembers("offer:42:drivers") == {"8"}
+    assert await redis.get("offer:42:winner") == "7"
+    assert await redis.get("driver:claim:7") == "42"
+    assert await redis.smembers(f"drivers:busy:{CELL_A}:van") == {"7"}
+
+
+@pytest.mark.asyncio
+async def test_batch_claims_never_overwrite_another_bookings_claim(redis):
+    await move(redis, 7, CELL_A)
+    await move(redis, 8, CELL_A)
+    with patch.object(
+        driver_claims, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(driver_claims, "availability_writer", AvailabilityWriteBehind()):
+        assert await claim_first_available([7], booking_id=41) == 7
+        assert await claim_drivers({42: 7, 43: 8}) == {43: 8}
+
+        assert await redis.get("driver:claim:7") == "41"
+        assert await redis.get("driver:claim:8") == "43"
+        assert await redis.smembers(f"drivers:{CELL_A}:van") == set()
+        # The winner of driver 7 can still give it back
+        assert await release_claim(7, booking_id=41)
@@ -0,0 +1,67 @@
+import pytest
+from app.services.tracking.movement_filter import MovementFilter
+
+
+@pytest.fixture
+def movement_filter():
+    return MovementFilter(
+        min_distance_m=25.0, min_heading_change_deg=30.0, max_silence_seconds=30.0
+    )
+
+
+def test_first_update_is_forwarded(movement_filter):
+    assert movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", timestamp=1000
+    )
+
+
+def test_stationary_driver_is_suppressed(movement_filter):
+    movement_filter.should_forward("1", 37.7749, -122.4194, "cell-a", timestamp=1000)
+    assert not movement_filter.should_forward(
+        "1", 37.77491, -122.41941, "cell-a", timestamp=1005
+    )
+
+
+def test_cell_change_is_forwarded(movement_filter):
+    movement_filter.should_forward("1", 37.7749, -122.4194, "cell-a", timestamp=1000)
+    assert movement_filter.should_forward(
+        "1", 37.77491, -122.41941, "cell-b", timestamp=1005
+    )
+
+
+def test_distance_threshold_is_forwarded(movement_filter):
+    movement_filter.should_forward("1", 37.7749, -122.4194, "cell-a", timestamp=1000)
+    # Roughly 55 m north
+    assert movement_filter.should_forward(
+        "1", 37.7754, -122.4194, "cell-a", timestamp=1005
+    )
+
+
+def test_heading_change_is_forwarded(movement_filter):
+    movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", heading=350.0, timestamp=1000
+    )
+    assert not movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", heading=10.0, timestamp=1002
+    )
+    assert movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", heading=60.0, timestamp=1004
+    )
+
+
+def test_heartbeat_after_max_silence(movement_filter):
+    movement_filter.should_forward("1", 37.7749, -122.4194, "cell-a", timestamp=1000)
+    assert not movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", timestamp=1029
+    )
+    assert movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", timestamp=1030
+    )
+
+
+def test_forget_resets_driver_state(movement_filter):
+    movement_filter.should_forward("1", 37.7749, -122.4194, "cell-a", timestamp=1000)
+    movement_filter.forget("1")
+    assert movement_filter.should_forward(
+        "1", 37.7749, -122.4194, "cell-a", timestamp=1001
+    )
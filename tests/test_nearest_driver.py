@@ -0,0 +1,55 @@
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from app.services.assignment.matching import (rank_nearest_drivers,
+                                              select_nearest_driver)
+
+PICKUP = (37.7749, -122.4194)
+
+
+def location(latitude, longitude):
+    return json.dumps({"latitude": latitude, "longitude": longitude})
+
+
+@pytest.fixture
+def redis():
+    # Driver 3 has no known position
+    return MagicMock(
+        mget=AsyncMock(
+            return_value=[
+                location(37.80, -122.42),
+                location(37.775, -122.4195),
+                None,
+                location(37.78, -122.42),
+            ]
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_candidates_are_fetched_in_one_round_trip(redis):
+    ranking = await rank_nearest_drivers(["1", "2", "3", "4"], *PICKUP, redis)
+    redis.mget.assert_awaited_once_with(
+        [
+            "driver:location:1",
+            "driver:location:2",
+            "driver:location:3",
+            "driver:location:4",
+        ]
+    )
+    assert [driver_id for driver_id, _ in ranking] == [2, 4, 1]
+    distances = [distance for _, distance in ranking]
+    assert distances == sorted(distances)
+
+
+@pytest.mark.asyncio
+async def test_top_k_keeps_only_the_nearest(redis):
+    ranking = await rank_nearest_drivers(["1", "2", "3", "4"], *PICKUP, redis, k=2)
+    assert [driver_id for driver_id, _ in ranking] == [2, 4]
+
+
+@pytest.mark.asyncio
+async def test_select_nearest_driver(redis):
+    assert await select_nearest_driver(["1", "2", "3", "4"], *PICKUP, redis) == 2
+    assert await select_nearest_driver(set(), *PICKUP, redis) is None
@@ -0,0 +1,228 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.assignment import offers
+from app.services.assignment.offers import (OfferEngine, TimerWheel,
+                                            accept_offer)
+
+
+def test_timer_wheel_fires_after_delay_and_wraps():
+    wheel = TimerWheel(tick_ms=100, slots=4)
+    wheel.schedule("a", 0.2)
+    # Needs more than one turn of the wheel
+    wheel.schedule("b", 0.6)
+    wheel.schedule("c", 0.3)
+    assert wheel.cancel("c")
+    assert not wheel.cancel("c")
+
+    fired = [wheel.tick() for _ in range(6)]
+    assert fired == [[], ["a"], [], [], [], ["b"]]
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_reschedule_replaces_timer():
+    wheel = TimerWheel(tick_ms=100, slots=8)
+    wheel.schedule("a", 0.1)
+    wheel.schedule("a", 0.3)
+    assert [wheel.tick() for _ in range(3)] == [[], [], ["a"]]
+
+
+@pytest.fixture
+def engine():
+    engine = OfferEngine(fan_out=2, accept_timeout_seconds=15, max_offers=4)
+    engine.manager = MagicMock(send_message_to_driver=AsyncMock())
+    redis = MagicMock(
+        srem=AsyncMock(return_value=1),
+        get=AsyncMock(return_value=None),
+        delete=AsyncMock(),
+        publish=AsyncMock(),
+    )
+    redis.pipeline.return_value = MagicMock(execute=AsyncMock())
+    with patch.object(offers, "get_redis_client", AsyncMock(return_value=redis)):
+        yield engine
+
+
+def sent(engine, event):
+    return [
+        int(call.args[0])
+        for call in engine.manager.send_message_to_driver.await_args_list
+        if call.args[1] == event
+    ]
+
+
+async def start_offer(engine, booking_id, candidates):
+    task = asyncio.create_task(engine.offer(booking_id, candidates, {}))
+    # Let the first offers go out
+    for _ in range(5):
+        await asyncio.sleep(0)
+    return task
+
+
+@pytest.mark.asyncio
+async def test_offers_top_k_in_parallel_and_first_accept_wins(engine):
+    task = await start_offer(engine, 7, [1, 2, 3])
+    assert sent(engine, "booking_offer") == [1, 2]
+    assert len(engine.wheel) == 2
+
+    await engine.handle_event({"event": "accepted", "booking_id": 7, "driver_id": 2})
+
+    assert await task == 2
+    assert sent(engine, "offer_revoked") == [1]
+    assert len(engine.wheel) == 0
+    # A second accept is a no-op
+    await engine.handle_event({"event": "accepted", "booking_id": 7, "driver_id": 1})
+    assert sent(engine, "offer_revoked") == [1]
+
+
+@pytest.mark.asyncio
+async def test_timeout_and_decline_cascade_to_next_driver(engine):
+    task = await start_offer(engine, 7, [1, 2, 3, 4, 5])
+
+    await engine._expire(7, 1)
+    assert sent(engine, "offer_expired") == [1]
+    assert sent(engine, "booking_offer") == [1, 2, 3]
+
+    await engine.handle_event({"event": "declined", "booking_id": 7, "driver_id": 3})
+    # Offer number max_offers goes to driver 4; driver 5 is never asked
+    assert sent(engine, "booking_offer") == [1, 2, 3, 4]
+
+    await engine._expire(7, 2)
+    await engine._expire(7, 4)
+    assert await task is None
+
+
+@pytest.mark.asyncio
+async def test_lost_accept_event_still_ends_the_cascade(engine):
+    task = await start_offer(engine, 7, [1, 2, 3])
+    redis = offers.get_redis_client.return_value
+    # Driver 2 accepted, but the event never arrived: its offer is consumed
+    redis.srem.return_value = 0
+    redis.get.return_value = "2"
+
+    await engine._expire(7, 2)
+
+    assert await task == 2
+    assert sent(engine, "booking_offer") == [1, 2]
+    assert sent(engine, "offer_expired") == []
+    assert sent(engine, "offer_revoked") == [1]
+
+
+@pytest.mark.asyncio
+async def test_failed_accept_ends_the_cascade_without_a_driver(engine):
+    task = await start_offer(engine, 7, [1, 2, 3])
+    await engine.handle_event({"event": "failed", "booking_id": 7, "driver_id": 2})
+    assert await task is None
+    assert sent(engine, "offer_revoked") == [1]
+
+
+@pytest.mark.asyncio
+async def test_cascade_gives_up_at_the_deadline(engine):
+    engine.deadline_seconds = 0.01
+    assert await engine.offer(7, [1, 2, 3], {}) is None
+    assert sent(engine, "offer_revoked") == [1, 2]
+    assert len(engine.wheel) == 0
+
+    # An accept that happened but was never announced is still returned
+    offers.get_redis_client.return_value.get.return_value = "3"
+    assert await engine.offer(8, [3], {}) == 3
+
+
+@pytest.mark.asyncio
+async def test_expired_offers_are_reported_as_outcomes(engine):
+    task = await start_offer(engine, 7, [1])
+    with patch.object(offers, "publish_offer_outcome", AsyncMock()) as publish:
+        await engine._expire(7, 1)
+    publish.assert_awaited_once_with(1, 7, "expired")
+    assert await task is None
+
+
+@pytest.mark.asyncio
+async def test_staggered_offers_go_out_one_at_a_time(engine):
+    engine.stagger_seconds = 2
+    task = await start_offer(engine, 7, [1, 2, 3])
+    assert sent(engine, "booking_offer") == [1]
+
+    await engine._stagger(engine._bookings[7])
+    assert sent(engine, "booking_offer") == [1, 2]
+    # fan_out offers are already outstanding
+    await engine._stagger(engine._bookings[7])
+    assert sent(engine, "booking_offer") == [1, 2]
+
+    await engine.handle_event({"event": "accepted", "booking_id": 7, "driver_id": 1})
+    assert await task == 1
+
+
+@pytest.mark.asyncio
+async def test_offer_with_no_candidates_returns_none(engine):
+    assert await engine.offer(7, [], {}) is None
+    engine.manager.send_message_to_driver.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_accept_offer_that_lost_does_not_touch_booking():
+    redis = MagicMock(publish=AsyncMock())
+    script = AsyncMock(return_value=0)
+    confirm = AsyncMock()
+    with patch.object(
+        offers, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(offers, "get_script", MagicMock(return_value=script)), patch.object(
+        offers, "confirm_booking", confirm
+    ), patch.object(
+        offers, "check_vehicle_schedule", AsyncMock()
+    ):
+        assert await accept_offer(3, 7) is False
+
+    confirm.assert_not_awaited()
+    redis.publish.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_accept_offer_releases_claim_if_booking_is_gone():
+    redis = MagicMock(publish=AsyncMock(), delete=AsyncMock())
+    release = AsyncMock()
+    with patch.object(
+        offers, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(
+        offers, "get_script", MagicMock(return_value=AsyncMock(return_value=1))
+    ), patch.object(
+        offers, "confirm_booking", AsyncMock(return_value=False)
+    ), patch.object(
+        offers, "release_claim", release
+    ), patch.object(
+        offers, "check_vehicle_schedule", AsyncMock()
+    ):
+        assert await accept_offer(3, 7) is False
+
+    release.assert_awaited_once_with(3, 7)
+    # Nobody won, and the cascade hears that the booking is gone
+    redis.delete.assert_awaited_once_with(offers.offer_winner_key(7))
+    channel, data = redis.publish.await_args.args
+    assert channel == offers.OFFER_EVENTS_CHANNEL
+    assert json.loads(data) == {"event": "failed", "booking_id": 7, "driver_id": 3}
+
+
+@pytest.mark.asyncio
+async def test_accept_offer_for_a_vehicle_that_is_booked_moves_the_cascade_on():
+    redis = MagicMock(srem=AsyncMock(return_value=1), publish=AsyncMock())
+    script = AsyncMock()
+    confirm = AsyncMock()
+    with patch.object(
+        offers, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(offers, "get_script", MagicMock(return_value=script)), patch.object(
+        offers, "confirm_booking", confirm
+    ), patch.object(
+        offers,
+        "check_vehicle_schedule",
+        AsyncMock(side_effect=ValueError("Vehicle has an overlapping booking")),
+    ):
+        assert await accept_offer(3, 7) is False
+
+    # The driver never wins, so nothing needs releasing
+    script.assert_not_awaited()
+    confirm.assert_not_awaited()
+    redis.srem.assert_awaited_once_with(offers.offered_drivers_key(7), 3)
+    channel, data = redis.publish.await_args.args
+    assert channel == offers.OFFER_EVENTS_CHANNEL
+    assert json.loads(data) == {"event": "declined", "booking_id": 7, "driver_id": 3}
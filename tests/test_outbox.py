@@ -0,0 +1,116 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.communication import websocket_service
+from app.services.communication.outbox import (ConflatingOutbox,
+                                               SlowConsumerError)
+from app.services.communication.pubsub_multiplexer import PubSubMultiplexer
+from fastapi import WebSocketDisconnect
+
+
+@pytest.mark.asyncio
+async def test_latest_message_per_key_is_sent_in_one_frame():
+    frames = []
+
+    async def send(batch):
+        frames.append(batch)
+
+    outbox = ConflatingOutbox(send)
+    outbox.put("1", {"driver_id": "1", "latitude": 1.0})
+    outbox.put("2", {"driver_id": "2", "latitude": 2.0})
+    outbox.put("1", {"driver_id": "1", "latitude": 3.0})
+    assert await outbox.flush() is True
+    assert frames == [
+        [{"driver_id": "2", "latitude": 2.0}, {"driver_id": "1", "latitude": 3.0}]
+    ]
+    assert await outbox.flush() is False
+
+
+@pytest.mark.asyncio
+async def test_pending_messages_are_bounded():
+    async def send(batch):
+        pass
+
+    outbox = ConflatingOutbox(send, max_keys=2)
+    for key in ("1", "2", "3"):
+        outbox.put(key, key)
+    assert len(outbox) == 2
+    assert outbox.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_blocked_socket_is_a_slow_consumer():
+    async def send(batch):
+        await asyncio.sleep(1)
+
+    outbox = ConflatingOutbox(send, tick_ms=1, max_send_seconds=0.01)
+    outbox.put("1", "update")
+    with pytest.raises(SlowConsumerError):
+        await outbox.run()
+
+
+@pytest.mark.asyncio
+async def test_socket_lagging_for_many_ticks_is_a_slow_consumer():
+    outbox = None
+
+    async def send(batch):
+        outbox.put("1", "update")
+        await asyncio.sleep(0.01)
+
+    outbox = ConflatingOutbox(send, tick_ms=1, max_lag_ticks=3)
+    outbox.put("1", "update")
+    with pytest.raises(SlowConsumerError):
+        await asyncio.wait_for(outbox.run(), 1)
+
+
+@pytest.mark.asyncio
+async def test_user_socket_receives_conflated_updates():
+    multiplexer = PubSubMultiplexer("driver_locations")
+    disconnected = asyncio.Event()
+
+    async def receive_text():
+        await disconnected.wait()
+        raise WebSocketDisconnect()
+
+    async def send_json(message):
+        disconnected.set()
+
+    websocket = MagicMock(
+        accept=AsyncMock(),
+        receive_text=receive_text,
+        send_json=AsyncMock(side_effect=send_json),
+    )
+    with patch.object(
+        PubSubMultiplexer, "_listen", lambda self: asyncio.sleep(3600)
+    ), patch.object(
+        websocket_service, "driver_location_multiplexer", multiplexer
+    ), patch.object(
+        websocket_service, "authenticate_websocket", AsyncMock(return_value={"id": 1})
+    ), patch.object(
+        websocket_service, "get_booking_driver_ids", AsyncMock(return_value={"7"})
+    ), patch.object(
+        websocket_service.manager, "connect_user", AsyncMock()
+    ), patch.object(
+        websocket_service.manager, "disconnect_user", AsyncMock()
+    ), patch.object(
+        websocket_service.settings, "OUTBOX_TICK_MS", 10
+    ):
+        handler = asyncio.create_task(
+            websocket_service.handle_user_connection(websocket)
+        )
+        while not len(multiplexer):
+            await asyncio.sleep(0)
+        multiplexer.dispatch(json.dumps({"driver_id": "7", "latitude": 1.0}))
+        multiplexer.dispatch(json.dumps({"driver_id": "7", "latitude": 2.0}))
+        await asyncio.wait_for(handler, 1)
+
+    websocket.accept.assert_awaited_once()
+    websocket.send_json.assert_awaited_once_with(
+        {
+            "type": "driver_location_updates",
+            "updates": [{"driver_id": "7", "latitude": 2.0}],
+        }
+    )
+    assert len(multiplexer) == 0
@@ -0,0 +1,117 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.communication.presence import (BROADCAST_CHANNEL,
+                                                 PresenceRegistry,
+                                                 node_channel)
+
+
+@pytest.fixture
+def redis():
+    redis = AsyncMock()
+    with patch(
+        "app.services.communication.presence.get_redis_client",
+        new=AsyncMock(return_value=redis),
+    ):
+        yield redis
+
+
+@pytest.mark.asyncio
+async def test_register_leases_presence_key(redis):
+    registry = PresenceRegistry(node_id="node-a", lease_seconds=30)
+    await registry.register("driver", "7", "sid-1")
+    redis.set.assert_awaited_once_with(
+        "presence:driver:7", json.dumps({"node": "node-a", "sid": "sid-1"}), ex=30
+    )
+
+
+@pytest.mark.asyncio
+async def test_route_publishes_to_owning_node(redis):
+    registry = PresenceRegistry(node_id="node-a")
+    redis.get.return_value = json.dumps({"node": "node-b", "sid": "sid-1"})
+    redis.publish.return_value = 1
+    delivered = await registry.route("driver", "7", "assignment", {"booking_id": 3})
+    assert delivered is True
+    channel, envelope = redis.publish.await_args.args
+    assert channel == "presence:node:node-b"
+    assert json.loads(envelope) == {
+        "kind": "driver",
+        "id": "7",
+        "event": "assignment",
+        "message": {"booking_id": 3},
+    }
+
+
+@pytest.mark.asyncio
+async def test_route_to_own_node_sends_locally(redis):
+    registry = PresenceRegistry(node_id="node-a")
+    registry.local_sender = AsyncMock(return_value=True)
+    redis.get.return_value = json.dumps({"node": "node-a", "sid": "sid-1"})
+    assert await registry.route("driver", "7", "assignment", {}) is True
+    registry.local_sender.assert_awaited_once_with("driver", "7", "assignment", {})
+    redis.publish.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_route_to_absent_driver_fails(redis):
+    registry = PresenceRegistry(node_id="node-a")
+    redis.get.return_value = None
+    assert await registry.route("driver", "7", "assignment", {}) is False
+
+
+@pytest.mark.asyncio
+async def test_room_broadcast_is_published_once_for_every_node(redis):
+    registry = PresenceRegistry(node_id="node-a")
+    await registry.broadcast(["hex:a", "hex:b"], "new_booking", {"booking_id": 3})
+    redis.publish.assert_awaited_once_with(
+        BROADCAST_CHANNEL,
+        json.dumps(
+            {
+                "rooms": ["hex:a", "hex:b"],
+                "event": "new_booking",
+                "message": {"booking_id": 3},
+            }
+        ),
+    )
+
+
+@pytest.mark.asyncio
+async def test_listener_emits_broadcasts_to_local_rooms(redis):
+    registry = PresenceRegistry(node_id="node-a")
+    registry.local_sender = AsyncMock(return_value=True)
+    registry.room_sender = AsyncMock()
+    messages = [
+        {"type": "subscribe", "channel": BROADCAST_CHANNEL, "data": 1},
+        {
+            "type": "message",
+            "channel": BROADCAST_CHANNEL,
+            "data": json.dumps({"rooms": ["hex:a"], "event": "e", "message": {}}),
+        },
+        {
+            "type": "message",
+            "channel": node_channel("node-a"),
+            "data": json.dumps(
+                {"kind": "driver", "id": "7", "event": "assignment", "message": {}}
+            ),
+        },
+    ]
+
+    async def listen():
+        for message in messages:
+            yield message
+        raise asyncio.CancelledError()
+
+    redis.pubsub = MagicMock(
+        return_value=MagicMock(
+            subscribe=AsyncMock(),
+            unsubscribe=AsyncMock(),
+            close=AsyncMock(),
+            listen=listen,
+        )
+    )
+    with pytest.raises(asyncio.CancelledError):
+        await registry._listen()
+    registry.room_sender.assert_awaited_once_with(["hex:a"], "e", {})
+    registry.local_sender.assert_awaited_once_with("driver", "7", "assignment", {})
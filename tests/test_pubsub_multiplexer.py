@@ -0,0 +1,161 @@
+import asyncio
+import json
+import random
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import h3
+import pytest
+from app.services.communication import websocket_service
+from app.services.communication.interests import Interest, bbox_cells
+from app.services.communication.pubsub_multiplexer import PubSubMultiplexer
+from fastapi import WebSocketDisconnect
+
+
+@pytest.fixture
+def multiplexer():
+    multiplexer = PubSubMultiplexer("driver_locations", queue_size=2)
+    # Keep the Redis listener from starting
+    with patch.object(PubSubMultiplexer, "_listen", lambda self: asyncio.sleep(3600)):
+        yield multiplexer
+
+
+@pytest.mark.asyncio
+async def test_batch_message_is_fanned_out_to_every_subscriber(multiplexer):
+    first = multiplexer.subscribe()
+    second = multiplexer.subscribe()
+    multiplexer.dispatch(json.dumps([{"driver_id": "1"}, {"driver_id": "2"}]))
+    for subscription in (first, second):
+        assert await subscription.get() == {"driver_id": "1"}
+        assert await subscription.get() == {"driver_id": "2"}
+    multiplexer.unsubscribe(first)
+    multiplexer.unsubscribe(second)
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_drops_oldest_updates(multiplexer):
+    subscription = multiplexer.subscribe()
+    for driver_id in ("1", "2", "3"):
+        multiplexer.dispatch(json.dumps({"driver_id": driver_id}))
+    assert subscription.dropped == 1
+    assert await subscription.get() == {"driver_id": "2"}
+    assert await subscription.get() == {"driver_id": "3"}
+    multiplexer.unsubscribe(subscription)
+
+
+@pytest.mark.asyncio
+async def test_listener_stops_with_last_subscriber(multiplexer):
+    subscription = multiplexer.subscribe()
+    assert multiplexer._task is not None
+    multiplexer.unsubscribe(subscription)
+    assert multiplexer._task is None
+    assert len(multiplexer) == 0
+
+
+@pytest.mark.asyncio
+async def test_updates_are_routed_by_driver_cell_and_bbox(multiplexer):
+    cell = h3.geo_to_h3(37.7749, -122.4194, 9)
+    by_driver = multiplexer.subscribe(Interest(driver_ids={"7"}))
+    by_cell = multiplexer.subscribe(Interest(cells={h3.h3_to_parent(cell, 7)}))
+    by_bbox = multiplexer.subscribe(Interest(bboxes=[(37.70, -122.52, 37.83, -122.35)]))
+    multiplexer.dispatch(
+        json.dumps(
+            [
+                {"driver_id": "7", "latitude": 40.7128, "longitude": -74.0060},
+                {
+                    "driver_id": "8",
+                    "latitude": 37.7749,
+                    "longitude": -122.4194,
+                    "h3_index": cell,
+                },
+            ]
+        )
+    )
+    assert by_driver.queue.qsize() == 1
+    assert (await by_driver.get())["driver_id"] == "7"
+    assert (await by_cell.get())["driver_id"] == "8"
+    assert (await by_bbox.get())["driver_id"] == "8"
+    assert by_cell.queue.empty() and by_bbox.queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_set_interest_replaces_previous_routing(multiplexer):
+    subscription = multiplexer.subscribe(Interest(driver_ids={"7"}))
+    multiplexer.set_interest(subscription, Interest(driver_ids={"8"}))
+    multiplexer.dispatch(json.dumps({"driver_id": "7"}))
+    multiplexer.dispatch(json.dumps({"driver_id": "8"}))
+    assert subscription.queue.qsize() == 1
+    assert (await subscription.get())["driver_id"] == "8"
+
+
+def test_bbox_across_antimeridian():
+    interest = Interest(bboxes=[(-20.0, 170.0, -10.0, -170.0)])
+    assert interest.in_bboxes(-15.0, 179.0)
+    assert interest.in_bboxes(-15.0, -175.0)
+    assert not interest.in_bboxes(-15.0, 0.0)
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        (37.70, -122.52, 37.83, -122.35),
+        (37.7749, -122.4194, 37.7750, -122.4193),
+        (-20.0, 179.5, -19.5, -179.5),
+    ],
+)
+def test_bbox_cells_cover_every_point_in_the_box(bbox):
+    south, west, north, east = bbox
+    width = east - west if west <= east else east + 360 - west
+    cells = bbox_cells(bbox)
+    rng = random.Random(7)
+    for _ in range(500):
+        longitude = west + rng.uniform(0, width)
+        if longitude > 180:
+            longitude -= 360
+        point = h3.geo_to_h3(rng.uniform(south, north), longitude, 5)
+        assert point in cells
+
+
+@pytest.mark.asyncio
+async def test_bboxes_are_indexed_by_cell(multiplexer):
+    city = multiplexer.subscribe(Interest(bboxes=[(37.70, -122.52, 37.83, -122.35)]))
+    continent = multiplexer.subscribe(Interest(bboxes=[(25.0, -125.0, 49.0, -67.0)]))
+    assert city in multiplexer._bbox_cells
+    assert continent in multiplexer._wide_bboxes
+    # Far from the city box, only the unindexed box is checked
+    with patch.object(Interest, "in_bboxes", return_value=False) as in_bboxes:
+        multiplexer.dispatch(
+            json.dumps({"driver_id": "1", "latitude": 40.7128, "longitude": -74.006})
+        )
+        assert in_bboxes.call_count == 1
+
+    multiplexer.dispatch(
+        json.dumps({"driver_id": "2", "latitude": 37.7749, "longitude": -122.4194})
+    )
+    assert (await city.get())["driver_id"] == "2"
+    multiplexer.unsubscribe(city)
+    multiplexer.unsubscribe(continent)
+    assert not multiplexer._by_bbox_cell and not multiplexer._wide_bboxes
+
+
+@pytest.mark.asyncio
+async def test_subscription_messages_are_answered_on_the_socket(multiplexer):
+    websocket = MagicMock(send_json=AsyncMock())
+    websocket.receive_text = AsyncMock(
+        side_effect=[
+            "not json",
+            json.dumps({"cells": [h3.geo_to_h3(37.7749, -122.4194, 7)]}),
+            WebSocketDisconnect(),
+        ]
+    )
+    subscription = multiplexer.subscribe()
+    with patch.object(
+        websocket_service, "driver_location_multiplexer", multiplexer
+    ), pytest.raises(WebSocketDisconnect):
+        await websocket_service.receive_subscriptions(
+            websocket, {"id": 1}, subscription
+        )
+    error, subscribed = [call.args[0] for call in websocket.send_json.await_args_list]
+    assert error["type"] == "error"
+    assert subscribed["type"] == "subscribed" and len(subscribed["cells"]) == 1
+    assert subscription.interest.cells
+    multiplexer.unsubscribe(subscription)
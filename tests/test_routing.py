@@ -0,0 +1,155 @@
+import itertools
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import pytest
+from app.services.pricing import pricing
+from app.services.routing.contraction import ContractedGraph, contract
+from app.services.routing.osm import load_osm, parse_maxspeed, way_direction
+from app.services.routing.router import RoadRouter
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+GRID = 6
+SPACING_DEG = 0.001  # 111 m north-south, 69 m east-west
+
+
+def grid_osm(oneway_row: int = 2, primary_column: int = 3) -> str:
+    """
+    A GRID x GRID street grid: residential streets, one one-way row and one
+    faster primary column.
+    """
+    nodes = [
+        f'<node id="{r * GRID + c + 1}" lat="{52.0 + r * SPACING_DEG}" '
+        f'lon="{13.0 + c * SPACING_DEG}"/>'
+        for r in range(GRID)
+        for c in range(GRID)
+    ]
+    ways = []
+    for r in range(GRID):
+        refs = "".join(f'<nd ref="{r * GRID + c + 1}"/>' for c in range(GRID))
+        oneway = '<tag k="oneway" v="yes"/>' if r == oneway_row else ""
+        ways.append(
+            f'<way id="{100 + r}">{refs}<tag k="highway" v="residential"/>'
+            f"{oneway}</way>"
+        )
+    for c in range(GRID):
+        refs = "".join(f'<nd ref="{r * GRID + c + 1}"/>' for r in range(GRID))
+        highway = "primary" if c == primary_column else "residential"
+        ways.append(f'<way id="{200 + c}">{refs}<tag k="highway" v="{highway}"/></way>')
+    # Not drivable, must be ignored
+    ways.append(
+        '<way id="300"><nd ref="1"/><nd ref="36"/><tag k="highway" v="footway"/></way>'
+    )
+    return f'<osm version="0.6">{"".join(nodes)}{"".join(ways)}</osm>'
+
+
+@pytest.fixture(scope="module")
+def network(tmp_path_factory):
+    path = tmp_path_factory.mktemp("osm") / "grid.osm"
+    path.write_text(grid_osm())
+    return load_osm(str(path))
+
+
+@pytest.fixture(scope="module")
+def router(network):
+    router = RoadRouter(max_snap_meters=200)
+    router.use(contract(network))
+    return router
+
+
+def exact_durations(network):
+    n = len(network)
+    matrix = coo_matrix(
+        (network.durations_s, (network.sources, network.targets)), shape=(n, n)
+    ).tocsr()
+    return dijkstra(matrix, directed=True)
+
+
+def node_point(network, node):
+    return float(network.latitudes[node]), float(network.longitudes[node])
+
+
+def test_osm_tags():
+    assert parse_maxspeed("50") == 50
+    assert parse_maxspeed("30 mph") == pytest.approx(48.28, abs=0.01)
+    assert parse_maxspeed("signals") is None
+    assert way_direction({"oneway": "-1"}) == -1
+    assert way_direction({"junction": "roundabout"}) == 1
+    assert way_direction({"highway": "motorway", "oneway": "no"}) == 0
+    assert way_direction({"highway": "residential"}) == 0
+
+
+def test_load_osm_builds_directed_drivable_graph(network):
+    assert len(network) == GRID * GRID
+    # Every street segment both ways, except the one-way row
+    segments = 2 * GRID * (GRID - 1)
+    assert len(network.sources) == 2 * segments - (GRID - 1)
+    assert network.lengths_m.min() > 60 and network.lengths_m.max() < 120
+
+
+def test_pbf_extracts_are_rejected():
+    with pytest.raises(ValueError):
+        load_osm("city.osm.pbf")
+
+
+def test_contracted_routes_match_dijkstra(network, router):
+    exact = exact_durations(network)
+    for origin, target in itertools.product(range(len(network)), repeat=2):
+        route = router.route(*node_point(network, origin), *node_point(network, target))
+        assert route.duration_min * 60 == pytest.approx(exact[origin, target])
+
+
+def test_one_way_street_is_respected(network, router):
+    # Along the one-way row, and back against it
+    west, east = 2 * GRID, 2 * GRID + GRID - 1
+    along = router.route(*node_point(network, west), *node_point(network, east))
+    against = router.route(*node_point(network, east), *node_point(network, west))
+    assert against.distance_km > along.distance_km
+
+
+def test_one_to_many_and_many_to_one_agree_with_point_to_point(network, router):
+    origin = node_point(network, 0)
+    targets = [node_point(network, node) for node in (7, 20, 35)]
+    single = [router.route(*origin, *target) for target in targets]
+    assert router.one_to_many(*origin, targets) == single
+    backwards = [router.route(*target, *origin) for target in targets]
+    assert router.many_to_one(targets, *origin) == backwards
+
+
+def test_snap_adds_access_leg_and_rejects_points_off_the_network(network, router):
+    lat, lng = node_point(network, 0)
+    nudged = router.route(lat - 0.0005, lng, *node_point(network, 1))
+    direct = router.route(lat, lng, *node_point(network, 1))
+    assert nudged.distance_km == pytest.approx(direct.distance_km + 0.0556, abs=0.001)
+    assert router.route(lat - 0.01, lng, *node_point(network, 1)) is None
+    assert router.one_to_many(lat, lng, [(lat - 0.01, lng)]) == [None]
+
+
+def test_graph_round_trips_through_file(network, tmp_path):
+    graph = contract(network)
+    graph.save(str(tmp_path / "graph.npz"))
+    loaded = ContractedGraph.load(str(tmp_path / "graph.npz"))
+    for name in ContractedGraph.__dataclass_fields__:
+        np.testing.assert_array_equal(getattr(graph, name), getattr(loaded, name))
+
+
+@pytest.mark.asyncio
+async def test_pricing_uses_road_router_before_google(network, router):
+    google = AsyncMock(return_value={"distance_km": 9.0, "duration_min": 9.0})
+    with patch.object(pricing, "road_router", router), patch.object(
+        pricing, "get_google_distance_duration", google
+    ), patch.object(pricing.settings, "GOOGLE_MAPS_API_KEY", "key"):
+        result = await pricing.get_distance_duration(
+            *node_point(network, 0), *node_point(network, 35)
+        )
+        google.assert_not_awaited()
+        assert result["distance_km"] == pytest.approx(0.9, abs=0.01)
+
+        # Off the road graph
+        assert await pricing.get_distance_duration(0.0, 0.0, 1.0, 1.0) == {
+            "distance_km": 9.0,
+            "duration_min": 9.0,
+        }
+        with patch.object(pricing.settings, "ROUTING_GOOGLE_FALLBACK", False):
+            assert await pricing.get_distance_duration(0.0, 0.0, 1.0, 1.0) is None
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from app.services.assignment.driver_features_consumer import (
+    apply_booking_event, apply_offer_outcome)
+from app.services.assignment.scoring import (ACCEPTED, DECLINED,
+                                             LAST_ASSIGNED_AT,
+                                             DriverFeatureStore, DriverScorer)
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def store():
+    return DriverFeatureStore(capacity=2)
+
+
+def test_unknown_drivers_get_default_features(store):
+    features = store.lookup([1, "2"])
+    assert features.shape == (2, 3)
+    assert not features.any()
+    assert len(store) == 0
+
+
+def test_store_grows_and_updates_rows_in_place(store):
+    for driver_id in range(1, 6):
+        store.record_assignment(driver_id, NOW - driver_id)
+    store.record_acceptance(3, True)
+    store.record_acceptance(3, False)
+
+    features = store.lookup(["3", 5])
+    assert len(store) == 5
+    assert features[0, LAST_ASSIGNED_AT] == NOW - 3
+    assert (features[0, ACCEPTED], features[0, DECLINED]) == (1, 1)
+    assert features[1, LAST_ASSIGNED_AT] == NOW - 5
+
+
+def test_booking_events_update_features(store):
+    apply_booking_event(
+        {"booking_id": 1, "driver_id": 7, "status": "confirmed", "timestamp": NOW},
+        store,
+    )
+    apply_booking_event({"booking_id": 3, "status": "confirmed"}, store)
+
+    features = store.lookup([7])[0]
+    assert features[LAST_ASSIGNED_AT] == NOW
+    assert len(store) == 1
+
+
+def test_offer_outcomes_drive_acceptance(store):
+    for outcome in ("accepted", "declined", "expired", "lost"):
+        apply_offer_outcome(
+            {"booking_id": 1, "driver_id": 7, "outcome": outcome}, store
+        )
+
+    features = store.lookup([7])[0]
+    assert (features[ACCEPTED], features[DECLINED]) == (1, 2)
+
+
+def test_score_follows_documented_weights(store):
+    scorer = DriverScorer(store, max_distance_km=5.0, idle_horizon_seconds=3600)
+    store.load(1, last_assigned_at=0.0, accepted=16, declined=0)
+    # Long idle and at the pickup; acceptance is smoothed by the 4-of-5
+    # prior
+    acceptance = (16 + 4) / (16 + 5)
+    assert scorer.score([1], [0.0], now=NOW)[0] == pytest.approx(
+        0.7 + 0.2 + 0.1 * acceptance
+    )
+    # Distance carries 70% of the score: its own 40% plus rating's 30%
+    assert scorer.score([1], [5.0], now=NOW)[0] == pytest.approx(0.2 + 0.1 * acceptance)
+
+
+def test_rank_prefers_idle_reliable_driver_over_slightly_closer_one(store):
+    scorer = DriverScorer(store)
+    store.load(1, last_assigned_at=NOW - 60, accepted=1, declined=9)
+    store.load(2, last_assigned_at=NOW - 7200, accepted=20, declined=0)
+    ranking = scorer.rank([(1, 0.5), (2, 1.0)], now=NOW)
+    assert [driver_id for driver_id, _ in ranking] == [2, 1]
+    assert scorer.rank([(1, 0.5), (2, 1.0)], k=1, now=NOW)[0][0] == 2
+
+
+def test_distance_matrix_broadcasts_over_drivers(store):
+    scorer = DriverScorer(store)
+    distances = np.array([[0.0, 1.0, 2.0], [2.0, 1.0, 0.0]])
+    scores = scorer.score([1, 2, 3], distances, now=NOW)
+    assert scores.shape == (2, 3)
+    assert scores[0, 0] == pytest.approx(scores[1, 2])
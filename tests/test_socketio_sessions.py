@@ -0,0 +1,72 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app.services.caching.auth_cache import Identity
+from app.services.communication import websocket_service
+
+DRIVER = Identity(id=7, kind="driver", vehicle_type="bike", is_available=True)
+USER = Identity(id=3, kind="user")
+
+
+@pytest.fixture
+def sio():
+    sio = MagicMock(environ={}, emit=AsyncMock(), disconnect=AsyncMock())
+    with patch.object(websocket_service, "sio", sio), patch.object(
+        websocket_service, "get_current_driver", AsyncMock(return_value=DRIVER)
+    ), patch.object(
+        websocket_service, "get_current_user", AsyncMock(return_value=USER)
+    ), patch.object(
+        websocket_service.manager, "connect_driver", AsyncMock()
+    ), patch.object(
+        websocket_service.manager, "connect_user", AsyncMock()
+    ):
+        yield sio
+
+
+@pytest.mark.asyncio
+async def test_driver_token_opens_a_driver_session(sio):
+    environ = {"HTTP_AUTHORIZATION": "Bearer driver-token"}
+    await websocket_service.connect("sid-1", environ, {"kind": "driver"})
+    websocket_service.get_current_driver.assert_awaited_once_with("driver-token")
+    websocket_service.get_current_user.assert_not_awaited()
+    websocket_service.manager.connect_driver.assert_awaited_once_with("7", "sid-1")
+    sio.enter_room.assert_called_once_with("sid-1", "driver_7")
+    assert sio.environ["sid-1"]["user"].is_driver
+
+
+@pytest.mark.asyncio
+async def test_sessions_without_driver_auth_are_users(sio):
+    await websocket_service.connect("sid-2", {"HTTP_AUTHORIZATION": "Bearer token"})
+    websocket_service.get_current_driver.assert_not_awaited()
+    websocket_service.manager.connect_user.assert_awaited_once_with("3", "sid-2")
+    sio.enter_room.assert_called_once_with("sid-2", "user_3")
+
+
+@pytest.mark.asyncio
+async def test_driver_session_can_accept_an_offer(sio):
+    environ = {"HTTP_AUTHORIZATION": "Bearer driver-token"}
+    await websocket_service.connect("sid-1", environ, {"kind": "driver"})
+    with patch.object(
+        websocket_service, "accept_offer", AsyncMock(return_value=True)
+    ) as accept, patch.object(
+        websocket_service.manager, "send_personal_message", AsyncMock()
+    ) as reply:
+        await websocket_service.offer_accept("sid-1", {"booking_id": "42"})
+
+    accept.assert_awaited_once_with(7, 42)
+    reply.assert_awaited_once_with(
+        "offer_result", {"booking_id": 42, "accepted": True}, "sid-1"
+    )
+    sio.emit.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_user_session_cannot_accept_an_offer(sio):
+    await websocket_service.connect("sid-2", {"HTTP_AUTHORIZATION": "Bearer token"})
+    with patch.object(websocket_service, "accept_offer", AsyncMock()) as accept:
+        await websocket_service.offer_accept("sid-2", {"booking_id": 42})
+
+    accept.assert_not_awaited()
+    sio.emit.assert_awaited_once_with(
+        "error", {"message": "Unauthorized"}, room="sid-2"
+    )
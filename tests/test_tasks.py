@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from app import tasks
+from app.models import Booking, BookingStatusEnum
+from app.services.assignment import driver_claims
+from app.services.assignment.driver_claims import (AvailabilityWriteBehind,
+                                                   claim_first_available)
+from app.services.tracking.location_scripts import DRIVER_BUSY_KEY
+from app.services.tracking.proximity import H3SetProximityBackend
+from fakeredis.aioredis import FakeRedis
+
+CELL = "8928308280fffff"
+
+
+def session_with(booking, driver):
+    db = MagicMock()
+    db.get = AsyncMock(
+        side_effect=lambda model, _id: booking if model is Booking else driver
+    )
+    db.commit = AsyncMock()
+    db.refresh = AsyncMock()
+    session = MagicMock()
+    session.__aenter__ = AsyncMock(return_value=db)
+    session.__aexit__ = AsyncMock(return_value=False)
+    return MagicMock(return_value=session)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "status", [BookingStatusEnum.completed, BookingStatusEnum.cancelled]
+)
+async def test_finished_booking_gives_its_driver_back(status):
+    redis = FakeRedis(decode_responses=True)
+    pipe = redis.pipeline(transaction=False)
+    await H3SetProximityBackend().queue_update(
+        pipe, 7, 37.77, -122.41, CELL, "van", 1000.0
+    )
+    await pipe.execute()
+
+    booking = SimpleNamespace(id=42, driver_id=7, status=BookingStatusEnum.confirmed)
+    driver = SimpleNamespace(id=7, is_available=False)
+    with patch.object(
+        driver_claims, "get_redis_client", AsyncMock(return_value=redis)
+    ), patch.object(
+        driver_claims, "availability_writer", AvailabilityWriteBehind()
+    ), patch.object(
+        tasks, "AsyncSession", session_with(booking, driver)
+    ), patch.object(
+        tasks.auth_cache, "invalidate", AsyncMock()
+    ), patch.object(
+        tasks, "compute_analytics", AsyncMock()
+    ):
+        assert await claim_first_available([7], booking_id=42) == 7
+        assert await redis.smembers(f"drivers:{CELL}:van") == set()
+
+        booking.status = status
+        await tasks.handle_booking_completion(42)
+
+        assert driver.is_available is True
+        assert await redis.get("driver:claim:7") is None
+        assert not await redis.sismember(DRIVER_BUSY_KEY, "7")
+        assert await redis.smembers(f"drivers:{CELL}:van") == {"7"}
+        assert await claim_first_available([7], booking_id=43) == 7
@@ -0,0 +1,152 @@
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import msgpack
+import numpy as np
+import pytest
+from app.services.communication import websocket_service
+from app.services.tracking.wire_format import (LOCATION_DTYPE,
+                                               SUBPROTOCOL_MSGPACK,
+                                               SUBPROTOCOL_STRUCT,
+                                               decode_frame,
+                                               negotiate_subprotocol,
+                                               to_location_updates,
+                                               trusted_timestamp,
+                                               validate_points)
+
+NOW = 1700000100.0
+
+
+def pack_points(rows):
+    return np.array(rows, dtype=LOCATION_DTYPE).tobytes()
+
+
+def test_negotiate_prefers_first_supported_subprotocol():
+    assert negotiate_subprotocol(["json", SUBPROTOCOL_MSGPACK]) == SUBPROTOCOL_MSGPACK
+    assert negotiate_subprotocol(["json"]) is None
+
+
+def test_decode_struct_frame():
+    payload = pack_points(
+        [
+            (1, 37.7749, -122.4194, 1700000000.0, 90.0, 12.5),
+            (1, 37.7750, -122.4195, 1700000001.0, 91.0, 12.0),
+        ]
+    )
+    points = decode_frame(payload, SUBPROTOCOL_STRUCT)
+    assert len(points) == 2
+    assert points["latitude"][1] == pytest.approx(37.7750)
+
+
+def test_decode_struct_frame_with_truncated_record():
+    payload = pack_points([(1, 37.7749, -122.4194, 1700000000.0, 90.0, 12.5)])
+    with pytest.raises(ValueError):
+        decode_frame(payload[:-1], SUBPROTOCOL_STRUCT)
+
+
+def test_decode_msgpack_frame():
+    payload = msgpack.packb([[7, 37.7749, -122.4194, 1700000000, 180.0, 3.5]])
+    points = decode_frame(payload, SUBPROTOCOL_MSGPACK)
+    assert points["driver_id"][0] == 7
+    assert points["heading"][0] == pytest.approx(180.0)
+
+
+def test_decode_msgpack_frame_with_missing_fields():
+    payload = msgpack.packb([[7, 37.7749, -122.4194]])
+    with pytest.raises(ValueError):
+        decode_frame(payload, SUBPROTOCOL_MSGPACK)
+
+
+def test_validate_points_rejects_out_of_range_values():
+    points = np.array(
+        [
+            (1, 37.7749, -122.4194, 1700000000.0, 90.0, 12.5),
+            (1, 95.0, -122.4194, 1700000000.0, 90.0, 12.5),
+            (1, 37.7749, float("nan"), 1700000000.0, 90.0, 12.5),
+            (1, 37.7749, -122.4194, 1700000000.0, float("nan"), -1.0),
+        ],
+        dtype=LOCATION_DTYPE,
+    )
+    valid, rejected = validate_points(points, now=NOW)
+    assert len(valid) == 1
+    assert rejected == 3
+
+
+def test_validate_points_normalizes_and_windows_timestamps():
+    payload = pack_points(
+        [
+            (1, 37.7749, -122.4194, 1700000000.0, 90.0, 12.5),
+            (1, 37.7749, -122.4194, 1700000050123.0, 90.0, 12.5),
+            (1, 37.7749, -122.4194, 1.0, 90.0, 12.5),
+            (1, 37.7749, -122.4194, NOW + 86400, 90.0, 12.5),
+            (1, 37.7749, -122.4194, NOW - 86400, 90.0, 12.5),
+        ]
+    )
+    valid, rejected = validate_points(
+        decode_frame(payload, SUBPROTOCOL_STRUCT), now=NOW
+    )
+    assert rejected == 3
+    assert valid["timestamp"].tolist() == [1700000000.0, 1700000050.123]
+
+
+def test_trusted_timestamp():
+    assert trusted_timestamp(1700000000, NOW) == 1700000000.0
+    assert trusted_timestamp(1700000000000, NOW) == 1700000000.0
+    assert trusted_timestamp(NOW + 3600, NOW) is None
+    assert trusted_timestamp(0, NOW) is None
+    assert trusted_timestamp("soon", NOW) is None
+    assert trusted_timestamp(None, NOW) is None
+
+
+def test_to_location_updates_omits_unreported_fields():
+    points = np.array(
+        [(3, 37.7749, -122.4194, 1700000000.0, float("nan"), 8.0)],
+        dtype=LOCATION_DTYPE,
+    )
+    [update] = to_location_updates(points, "van")
+    assert update["driver_id"] == "3"
+    assert update["vehicle_type"] == "van"
+    assert "heading" not in update
+    assert update["speed"] == pytest.approx(8.0)
+
+
+@pytest.mark.asyncio
+async def test_binary_frame_only_moves_the_connected_driver():
+    now = time.time()
+    payload = pack_points(
+        [
+            (7, 37.7749, -122.4194, now, 90.0, 12.5),
+            (8, 37.7750, -122.4195, now, 91.0, 12.0),
+            (7, 95.0, -122.4195, now, 91.0, 12.0),
+        ]
+    )
+    websocket = MagicMock(send_json=AsyncMock())
+    user = {"id": 7, "vehicle_type": "bike", "is_available": True}
+    tracking = MagicMock(update_driver_location_batch=AsyncMock())
+    with patch.object(websocket_service.manager, "tracking_service", tracking):
+        await websocket_service.handle_binary_location_frame(
+            websocket, user, payload, SUBPROTOCOL_STRUCT
+        )
+
+    (updates, _), _ = tracking.update_driver_location_batch.await_args
+    assert [update["driver_id"] for update in updates] == ["7"]
+    assert [
+        call.args[0]["message"] for call in websocket.send_json.await_args_list
+    ] == [
+        "Rejected 1 location updates for other drivers.",
+        "Rejected 1 invalid location updates.",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_undecodable_binary_frame_is_reported_on_the_socket():
+    websocket = MagicMock(send_json=AsyncMock())
+    user = {"id": 7, "vehicle_type": "bike", "is_available": True}
+    tracking = MagicMock(update_driver_location_batch=AsyncMock())
+    with patch.object(websocket_service.manager, "tracking_service", tracking):
+        await websocket_service.handle_binary_location_frame(
+            websocket, user, b"\x00" * 3, SUBPROTOCOL_STRUCT
+        )
+
+    assert websocket.send_json.await_args.args[0]["type"] == "error"
+    tracking.update_driver_location_batch.assert_not_awaited()